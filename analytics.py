@@ -0,0 +1,268 @@
+import bisect
+import os
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import (Column, Date, DateTime, Index, Integer, MetaData, String, Table, delete,
+                        func, insert, select)
+from sqlalchemy.orm import aliased
+
+from app import db
+from models import User, Subject, Query
+import archive
+
+# Workload and response-time reporting per subject, teacher and department,
+# served from rollup tables instead of aggregate scans over `queries`.
+#
+# analytics_daily holds, per day a query was submitted, subject and teacher,
+# how many queries were submitted and how many of those are now pending,
+# answered or closed. analytics_latency holds the same cohorts' times to
+# answer (updated_at - created_at of answered queries) as a histogram over
+# LATENCY_BUCKETS, which sums across any days and groups; medians and p90s
+# are read off the merged histogram, interpolated within a bucket.
+#
+# `flask rollup-analytics` (from cron, or with --interval) brings them up to
+# date incrementally: the days of queries updated since the watermark are
+# recomputed whole from `queries` and the archive, an index range scan per
+# day, so rerunning a day is harmless and the job only reads what changed.
+# Pending counts summed over all days are the current queue depth.
+
+ROLLUP_OVERLAP = timedelta(seconds=int(os.environ.get('ANALYTICS_OVERLAP_SECONDS', 300)))
+DEFAULT_DAYS = 30
+
+# Upper bounds in seconds: 1m 5m 15m 30m 1h 2h 4h 8h 12h 1d 2d 3d 5d 7d 14d 30d
+LATENCY_BUCKETS = (60, 300, 900, 1800, 3600, 7200, 14400, 28800, 43200, 86400,
+                   172800, 259200, 432000, 604800, 1209600, 2592000)
+
+metadata = MetaData()
+
+analytics_daily = Table(
+    'analytics_daily', metadata,
+    Column('day', Date, primary_key=True),
+    Column('subject_id', Integer, primary_key=True),
+    Column('teacher_id', Integer, primary_key=True),
+    Column('submitted', Integer, nullable=False),
+    Column('pending', Integer, nullable=False),
+    Column('answered', Integer, nullable=False),
+    Column('closed', Integer, nullable=False),
+    # Queue depth reads every day with a pending query
+    Index('ix_analytics_daily_pending', 'pending'),
+)
+
+analytics_latency = Table(
+    'analytics_latency', metadata,
+    Column('day', Date, primary_key=True),
+    Column('subject_id', Integer, primary_key=True),
+    Column('teacher_id', Integer, primary_key=True),
+    Column('bucket', Integer, primary_key=True),  # index into LATENCY_BUCKETS, or its length
+    Column('answers', Integer, nullable=False),
+)
+
+analytics_watermarks = Table(
+    'analytics_watermarks', metadata,
+    Column('name', String(50), primary_key=True),
+    Column('watermark', DateTime, nullable=False),
+)
+
+Report = namedtuple('Report', 'key name submitted pending answered closed queue_depth '
+                              'median_seconds p90_seconds')
+
+EXPORT_FIELDS = ('day', 'key', 'name', 'submitted', 'pending', 'answered', 'closed',
+                 'median_seconds', 'p90_seconds')
+
+def create_tables(connection):
+    # Idempotent; called from migrations
+    metadata.create_all(connection)
+
+# Rollup
+
+def bucket_for(seconds):
+    return bisect.bisect_left(LATENCY_BUCKETS, seconds)
+
+def as_date(value):
+    # func.date() gives a date on PostgreSQL and a string on SQLite
+    return value if isinstance(value, date) else date.fromisoformat(str(value)[:10])
+
+def day_bounds(day):
+    start = datetime(day.year, day.month, day.day)
+    return start, start + timedelta(days=1)
+
+def aggregate_day(day):
+    # (daily rows, latency rows) for the queries submitted on `day`
+    source = archive.all_queries(db.session.connection())
+    start, end = day_bounds(day)
+    rows = db.session.execute(
+        select(source.c.subject_id, source.c.teacher_id, source.c.status,
+               source.c.created_at, source.c.updated_at)
+        .where(source.c.created_at >= start, source.c.created_at < end)
+        .execution_options(yield_per=5000)
+    )
+    daily, latency = {}, {}
+    for subject_id, teacher_id, status, created_at, updated_at in rows:
+        key = (subject_id, teacher_id)
+        counts = daily.setdefault(key, {'submitted': 0, 'pending': 0, 'answered': 0, 'closed': 0})
+        counts['submitted'] += 1
+        if status in counts:
+            counts[status] += 1
+        if status == 'answered' and updated_at:
+            bucket = (key, bucket_for((updated_at - created_at).total_seconds()))
+            latency[bucket] = latency.get(bucket, 0) + 1
+    return (
+        [dict(day=day, subject_id=subject_id, teacher_id=teacher_id, **counts)
+         for (subject_id, teacher_id), counts in daily.items()],
+        [dict(day=day, subject_id=subject_id, teacher_id=teacher_id, bucket=bucket, answers=answers)
+         for ((subject_id, teacher_id), bucket), answers in latency.items()],
+    )
+
+def rollup_day(day):
+    daily, latency = aggregate_day(day)
+    for table in (analytics_daily, analytics_latency):
+        db.session.execute(delete(table).where(table.c.day == day))
+    if daily:
+        db.session.execute(insert(analytics_daily), daily)
+    if latency:
+        db.session.execute(insert(analytics_latency), latency)
+
+def get_watermark(name='rollup'):
+    return db.session.scalar(select(analytics_watermarks.c.watermark)
+                             .where(analytics_watermarks.c.name == name))
+
+def set_watermark(watermark, name='rollup'):
+    db.session.execute(delete(analytics_watermarks).where(analytics_watermarks.c.name == name))
+    db.session.execute(insert(analytics_watermarks).values(name=name, watermark=watermark))
+
+def rollup(full=False):
+    # Recomputes the days touched since the last run (every day with
+    # queries, for full or a first run), one transaction per day; returns
+    # the number of days recomputed. The watermark is the newest updated_at
+    # seen, and each run reaches back ROLLUP_OVERLAP before it for writes
+    # that committed late. Run one at a time.
+    watermark = None if full else get_watermark()
+    newest = select(func.max(Query.updated_at))
+    if watermark is None:
+        source = archive.all_queries(db.session.connection())
+        changed = select(func.date(source.c.created_at)).distinct()
+    else:
+        since = watermark - ROLLUP_OVERLAP
+        changed = select(func.date(Query.created_at)).distinct().where(Query.updated_at > since)
+        newest = newest.where(Query.updated_at > since)
+    newest = db.session.scalar(newest)
+    days = sorted(as_date(value) for value in db.session.scalars(changed) if value is not None)
+
+    for day in days:
+        rollup_day(day)
+        db.session.commit()
+    if newest is not None and (watermark is None or newest > watermark):
+        set_watermark(newest)
+    db.session.commit()
+    return len(days)
+
+# Reports, read from the rollups only
+
+GROUPS = ('subject', 'teacher', 'department')
+
+def grouped(table, group):
+    # (key, name, from clause) for reading `table` by group
+    teacher = aliased(User)
+    joined = table.join(Subject, Subject.id == table.c.subject_id)
+    if group == 'subject':
+        return table.c.subject_id, Subject.name, joined
+    if group == 'teacher':
+        return table.c.teacher_id, teacher.name, joined.join(teacher, teacher.id == table.c.teacher_id)
+    if group == 'department':
+        return Subject.department, Subject.department, joined
+    raise ValueError(f"Unknown grouping; use one of: {', '.join(GROUPS)}.")
+
+def in_range(table, since, until):
+    criteria = []
+    if since is not None:
+        criteria.append(table.c.day >= since)
+    if until is not None:
+        criteria.append(table.c.day <= until)
+    return criteria
+
+def percentile(histogram, fraction):
+    # Seconds at `fraction` of {bucket: answers}, interpolated within the
+    # bucket; answers past the last bound report that bound
+    total = sum(histogram.values())
+    if not total:
+        return None
+    rank = fraction * total
+    seen = 0
+    for bucket in sorted(histogram):
+        count = histogram[bucket]
+        if seen + count >= rank:
+            if bucket >= len(LATENCY_BUCKETS):
+                return float(LATENCY_BUCKETS[-1])
+            low = LATENCY_BUCKETS[bucket - 1] if bucket else 0
+            return low + (LATENCY_BUCKETS[bucket] - low) * (rank - seen) / count
+        seen += count
+    return float(LATENCY_BUCKETS[-1])
+
+def histograms(group, criteria):
+    key, _, source = grouped(analytics_latency, group)
+    result = {}
+    for group_key, bucket, answers in db.session.execute(
+        select(key, analytics_latency.c.bucket, func.sum(analytics_latency.c.answers))
+        .select_from(source).where(*criteria).group_by(key, analytics_latency.c.bucket)
+    ):
+        result.setdefault(group_key, {})[bucket] = answers
+    return result
+
+def report(group, since=None, until=None):
+    # [Report] per group for queries submitted in [since, until], busiest
+    # first; queue_depth counts every pending query regardless of the range
+    key, name, source = grouped(analytics_daily, group)
+    totals = db.session.execute(
+        select(key.label('key'), name.label('name'),
+               func.sum(analytics_daily.c.submitted), func.sum(analytics_daily.c.pending),
+               func.sum(analytics_daily.c.answered), func.sum(analytics_daily.c.closed))
+        .select_from(source).where(*in_range(analytics_daily, since, until))
+        .group_by(key, name)
+    ).all()
+    depth = dict(db.session.execute(
+        select(key, func.sum(analytics_daily.c.pending)).select_from(source)
+        .where(analytics_daily.c.pending > 0).group_by(key)
+    ).all())
+    latencies = histograms(group, in_range(analytics_latency, since, until))
+
+    reports = [Report(group_key, group_name, submitted, pending, answered, closed,
+                      depth.get(group_key, 0),
+                      percentile(latencies.get(group_key, {}), 0.5),
+                      percentile(latencies.get(group_key, {}), 0.9))
+               for group_key, group_name, submitted, pending, answered, closed in totals]
+    reports.sort(key=lambda row: (-row.submitted, str(row.name)))
+    return reports
+
+def export_rows(group, since=None, until=None):
+    # Per-day, per-group dicts (EXPORT_FIELDS) oldest first, a day at a time
+    key, name, source = grouped(analytics_daily, group)
+    days = db.session.scalars(
+        select(analytics_daily.c.day).distinct().where(*in_range(analytics_daily, since, until))
+        .order_by(analytics_daily.c.day)
+    ).all()
+    for day in days:
+        latencies = histograms(group, [analytics_latency.c.day == day])
+        for group_key, group_name, submitted, pending, answered, closed in db.session.execute(
+            select(key, name,
+                   func.sum(analytics_daily.c.submitted), func.sum(analytics_daily.c.pending),
+                   func.sum(analytics_daily.c.answered), func.sum(analytics_daily.c.closed))
+            .select_from(source).where(analytics_daily.c.day == day)
+            .group_by(key, name).order_by(key)
+        ):
+            histogram = latencies.get(group_key, {})
+            yield dict(day=as_date(day), key=group_key, name=group_name, submitted=submitted,
+                       pending=pending, answered=answered, closed=closed,
+                       median_seconds=percentile(histogram, 0.5),
+                       p90_seconds=percentile(histogram, 0.9))
+
+def parse_range(since, until, default_days=DEFAULT_DAYS):
+    # (since, until) dates from YYYY-MM-DD strings; since defaults to
+    # default_days ago in UTC, the timezone of the stored timestamps. Raises
+    # ValueError for a malformed date.
+    try:
+        since = date.fromisoformat(since) if since else datetime.utcnow().date() - timedelta(days=default_days)
+        until = date.fromisoformat(until) if until else None
+    except ValueError:
+        raise ValueError('Dates must be YYYY-MM-DD.')
+    return since, until
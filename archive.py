@@ -0,0 +1,138 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import (Column, DateTime, Index, Integer, MetaData, String, Table, Text, delete,
+                        inspect, insert, select, text, union_all)
+from sqlalchemy.orm import aliased
+
+from app import db
+from models import Query
+import counters
+
+# Finished queries older than the retention window move out of `queries`
+# into `queries_archive`, so the table every list page, dashboard and write
+# path works on only holds recent history. History pages read the archive
+# only when asked to (include_archive=1), through history_source().
+#
+# On PostgreSQL the archive is range-partitioned by month of created_at;
+# archive_queries() creates partitions as it needs them, and old months can
+# be detached, moved to cheaper storage or dropped on their own. Elsewhere
+# it is a plain table. It sits outside the models' metadata so that
+# db.metadata.create_all() never creates an unpartitioned one.
+
+ARCHIVABLE_STATUSES = ('answered', 'closed')
+BATCH_SIZE = 5000
+
+COLUMNS = ('id', 'student_id', 'teacher_id', 'subject_id', 'message', 'reply', 'status',
+           'created_at', 'updated_at')
+
+queries_archive = Table(
+    'queries_archive', MetaData(),
+    Column('id', Integer, primary_key=True, autoincrement=False),
+    Column('student_id', Integer, nullable=False),
+    Column('teacher_id', Integer, nullable=False),
+    Column('subject_id', Integer, nullable=False),
+    Column('message', Text, nullable=False),
+    Column('reply', Text),
+    Column('status', String(20), nullable=False),
+    # Part of the key because PostgreSQL partitions on it
+    Column('created_at', DateTime, primary_key=True),
+    Column('updated_at', DateTime),
+    Index('ix_queries_archive_student_created', 'student_id', 'created_at', 'id'),
+    Index('ix_queries_archive_teacher_created', 'teacher_id', 'created_at', 'id'),
+    # For reading back whole days (analytics.py)
+    Index('ix_queries_archive_created', 'created_at'),
+)
+
+def exists(connection):
+    return inspect(connection).has_table('queries_archive')
+
+def create_table(connection):
+    # Idempotent; called from migrations
+    if exists(connection):
+        return
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text(
+            'CREATE TABLE queries_archive ('
+            'id integer NOT NULL, student_id integer NOT NULL, teacher_id integer NOT NULL, '
+            'subject_id integer NOT NULL, message text NOT NULL, reply text, '
+            'status varchar(20) NOT NULL, created_at timestamp NOT NULL, updated_at timestamp, '
+            'PRIMARY KEY (id, created_at)'
+            ') PARTITION BY RANGE (created_at)'
+        ))
+        for index in queries_archive.indexes:
+            index.create(connection)
+    else:
+        queries_archive.create(connection)
+
+def month_start(moment):
+    return datetime(moment.year, moment.month, 1)
+
+def next_month(moment):
+    return datetime(moment.year + moment.month // 12, moment.month % 12 + 1, 1)
+
+def create_partitions(connection, oldest, newest):
+    # Monthly PostgreSQL partitions covering [oldest, newest]
+    month = month_start(oldest)
+    while month <= newest:
+        following = next_month(month)
+        connection.execute(text(
+            f'CREATE TABLE IF NOT EXISTS queries_archive_{month:%Y_%m} PARTITION OF queries_archive '
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{following:%Y-%m-%d}')"
+        ))
+        month = following
+
+def archive_queries(older_than, batch_size=BATCH_SIZE, dry_run=False):
+    # Moves finished queries created before `older_than` into the archive,
+    # one transaction per batch so writers are never blocked for long.
+    # Returns the number of queries moved (or that would be, for dry_run).
+    candidates = select(Query.id).where(
+        Query.status.in_(ARCHIVABLE_STATUSES), Query.created_at < older_than
+    )
+    if dry_run:
+        return db.session.scalar(select(db.func.count()).select_from(candidates.subquery()))
+
+    session = db.session
+    if session.get_bind().dialect.name == 'postgresql':
+        oldest = session.scalar(select(db.func.min(Query.created_at)).where(
+            Query.status.in_(ARCHIVABLE_STATUSES), Query.created_at < older_than
+        ))
+        if oldest is None:
+            return 0
+        create_partitions(session.connection(), oldest, older_than)
+        session.commit()
+
+    moved = 0
+    while True:
+        batch = session.execute(
+            select(*[Query.__table__.c[name] for name in COLUMNS])
+            .where(Query.id.in_(candidates.order_by(Query.created_at).limit(batch_size)
+                                .with_for_update(skip_locked=True)
+                                .scalar_subquery()))
+        ).all()
+        if not batch:
+            return moved
+        session.execute(insert(queries_archive), [row._asdict() for row in batch])
+        session.execute(delete(Query.__table__).where(Query.id.in_([row.id for row in batch])))
+        # Totals include the archive, but pages showing these rows change
+        counters.bump_many([(row, 0, 0) for row in batch])
+        session.commit()
+        moved += len(batch)
+
+def with_archive(name):
+    # queries UNION ALL queries_archive as a subquery
+    return union_all(
+        select(*[Query.__table__.c[column] for column in COLUMNS]),
+        select(*[queries_archive.c[column] for column in COLUMNS]),
+    ).subquery(name)
+
+def all_queries(connection):
+    # `queries` plus the archive, once it exists, for whole-history aggregates
+    return with_archive('all_queries') if exists(connection) else Query.__table__
+
+def history_source(include_archive=False):
+    # The entity history pages select from: Query itself, or Query mapped
+    # over both tables
+    return aliased(Query, with_archive('history')) if include_archive else Query
+
+def retention_cutoff(days):
+    return datetime.utcnow() - timedelta(days=days)
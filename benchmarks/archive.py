@@ -0,0 +1,91 @@
+"""Show that archiving keeps the hot list pages flat as history grows.
+
+For each --sizes total, seeds a fresh copy of the schema in the configured
+database (DATABASE_URL, initialised with `flask db-init`; the tables are
+emptied between sizes) using benchmarks.datagen, times a student's and a
+teacher's first history page, archives everything older than --retention-days
+and times the same pages again, with and without include_archive. With the
+archive in place the hot pages should cost the same at every size, since
+`queries` only holds the retention window.
+
+    DATABASE_URL=sqlite:///archive.db flask --app main db-init
+    DATABASE_URL=sqlite:///archive.db python -m benchmarks.archive --sizes 20000 100000 500000
+"""
+import argparse
+import statistics
+import time
+from datetime import timedelta
+
+from sqlalchemy import delete, func, select
+
+from app import create_app, db
+from models import User, Subject, StudentSubject, TeacherSubject, Query, QueryCounter
+from benchmarks.datagen import generate
+import archive
+import readmodel
+
+def first_page(column_name, owner_id, page_size, include_archive):
+    source = archive.history_source(include_archive)
+    return readmodel.to_rows(readmodel.query_list(
+        getattr(source, column_name) == owner_id, source=source
+    ).order_by(source.created_at.desc(), source.id.desc()).limit(page_size + 1))
+
+def median_ms(load, repeats):
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        load()
+        timings.append(time.perf_counter() - started)
+        db.session.rollback()
+    return statistics.median(timings) * 1000
+
+def busiest(column):
+    return db.session.execute(
+        select(column).group_by(column).order_by(func.count().desc()).limit(1)
+    ).scalar()
+
+def empty():
+    for model in (QueryCounter, Query, StudentSubject, TeacherSubject, Subject, User):
+        db.session.execute(delete(model))
+    db.session.execute(delete(archive.queries_archive))
+    db.session.commit()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[20000, 100000, 500000])
+    parser.add_argument('--retention-days', type=int, default=30)
+    parser.add_argument('--page-size', type=int, default=20)
+    parser.add_argument('--repeats', type=int, default=50)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        print(f"{'queries':>9} {'hot rows':>9} {'owner':<8} {'before ms':>10} {'after ms':>9} "
+              f"{'archive ms':>11}")
+        for size in args.sizes:
+            empty()
+            generate(students=max(size // 200, 1), teachers=max(size // 2000, 1), subjects=20,
+                     queries=size)
+            student_id = busiest(Query.student_id)
+            teacher_id = busiest(Query.teacher_id)
+
+            owners = (('student', 'student_id', student_id), ('teacher', 'teacher_id', teacher_id))
+            before = {name: median_ms(lambda: first_page(column, owner_id, args.page_size, False),
+                                      args.repeats)
+                      for name, column, owner_id in owners}
+
+            # datagen spreads queries over the year before its fixed "now"
+            newest = db.session.scalar(select(func.max(Query.created_at)))
+            archive.archive_queries(newest - timedelta(days=args.retention_days))
+            hot = db.session.scalar(select(func.count()).select_from(Query))
+
+            for name, column, owner_id in owners:
+                after = median_ms(lambda: first_page(column, owner_id, args.page_size, False),
+                                  args.repeats)
+                with_archive = median_ms(lambda: first_page(column, owner_id, args.page_size, True),
+                                         args.repeats)
+                print(f'{size:>9} {hot:>9} {name:<8} {before[name]:>10.2f} {after:>9.2f} '
+                      f'{with_archive:>11.2f}')
+
+if __name__ == '__main__':
+    main()
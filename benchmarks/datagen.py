@@ -0,0 +1,142 @@
+"""Populate the configured database with a deterministic synthetic dataset.
+
+Creates students, teachers, subjects, enrollments, assignments and queries at
+the requested scale. The same --seed always produces the same rows, so runs
+against separately generated databases are comparable. Every user's password
+is --password; emails are student<N>@bench.edu and teacher<N>@bench.edu.
+
+    DATABASE_URL=sqlite:///bench.db flask --app main db-init
+    DATABASE_URL=sqlite:///bench.db python -m benchmarks.datagen \\
+        --students 100000 --teachers 2000 --subjects 500 --queries 5000000
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, select, text
+
+from app import create_app, db
+from models import User, Subject, StudentSubject, TeacherSubject, Query
+import counters
+import passwords
+
+BATCH_SIZE = 10000
+DEPARTMENTS = ['Computer Science', 'Mathematics', 'Physics', 'Chemistry', 'Biology',
+               'Economics', 'History', 'Literature', 'Philosophy', 'Engineering']
+PASSWORD = 'bench-password'
+
+WORDS = ('how what why when does the a an of in to for is are this that limit integral '
+         'derivative proof theorem lemma equation matrix vector energy force reaction '
+         'cell protein market demand supply essay source argument example exercise '
+         'homework deadline exam lecture notes chapter section solution answer').split()
+
+def chunked(rows, size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def insert_all(model, rows):
+    for batch in chunked(rows):
+        db.session.execute(insert(model), batch)
+    db.session.commit()
+
+def generate(students, teachers, subjects, queries, seed=42, password=PASSWORD,
+             answered_ratio=0.8, days=365):
+    # Returns a dict of row counts; assumes an empty schema
+    rng = random.Random(seed)
+    password_hash = passwords.make_hash(password)
+    now = datetime(2026, 1, 1)
+
+    insert_all(User, (dict(
+        role='student', name=f'Student {i}', email=f'student{i}@bench.edu',
+        password_hash=password_hash, department=DEPARTMENTS[i % len(DEPARTMENTS)],
+        roll_no=f'R{i:07d}', created_at=now - timedelta(days=days)
+    ) for i in range(students)))
+    insert_all(User, (dict(
+        role='teacher', name=f'Teacher {i}', email=f'teacher{i}@bench.edu',
+        password_hash=password_hash, department=DEPARTMENTS[i % len(DEPARTMENTS)],
+        created_at=now - timedelta(days=days)
+    ) for i in range(teachers)))
+    insert_all(Subject, (dict(
+        name=f'Subject {i}', department=DEPARTMENTS[i % len(DEPARTMENTS)]
+    ) for i in range(subjects)))
+
+    student_ids = db.session.scalars(select(User.id).filter_by(role='student').order_by(User.id)).all()
+    teacher_ids = db.session.scalars(select(User.id).filter_by(role='teacher').order_by(User.id)).all()
+    subject_ids = db.session.scalars(select(Subject.id).order_by(Subject.id)).all()
+
+    # Every subject gets at least one teacher; teachers take 2-4 subjects
+    teachers_of = {subject_id: set() for subject_id in subject_ids}
+    for index, subject_id in enumerate(subject_ids):
+        teachers_of[subject_id].add(teacher_ids[index % len(teacher_ids)])
+    for teacher_id in teacher_ids:
+        for subject_id in rng.sample(subject_ids, min(rng.randint(2, 4), len(subject_ids))):
+            teachers_of[subject_id].add(teacher_id)
+    teachers_of = {subject_id: sorted(ids) for subject_id, ids in teachers_of.items()}
+    insert_all(TeacherSubject, (dict(teacher_id=teacher_id, subject_id=subject_id, assigned_at=now)
+                                for subject_id, ids in teachers_of.items() for teacher_id in ids))
+
+    # Students take 3-6 subjects
+    subjects_of = {student_id: rng.sample(subject_ids, min(rng.randint(3, 6), len(subject_ids)))
+                   for student_id in student_ids}
+    insert_all(StudentSubject, (dict(student_id=student_id, subject_id=subject_id, registered_at=now)
+                                for student_id, ids in subjects_of.items() for subject_id in ids))
+
+    # Queries skew towards a minority of active students and recent dates
+    def query_rows():
+        for i in range(queries):
+            student_id = student_ids[min(int(rng.paretovariate(1.2)) - 1, len(student_ids) - 1)
+                                     if rng.random() < 0.5 else rng.randrange(len(student_ids))]
+            subject_id = rng.choice(subjects_of[student_id])
+            created_at = now - timedelta(minutes=int(rng.triangular(0, days * 1440, 0)))
+            answered = rng.random() < answered_ratio
+            updated_at = created_at + timedelta(minutes=rng.randint(5, 4320)) if answered else created_at
+            yield dict(
+                student_id=student_id,
+                teacher_id=rng.choice(teachers_of[subject_id]),
+                subject_id=subject_id,
+                message=f'Question {i} about subject {subject_id}: ' + ' '.join(
+                    rng.choice(WORDS) for _ in range(rng.randint(8, 40))),
+                reply=' '.join(rng.choice(WORDS) for _ in range(rng.randint(10, 60))) if answered else None,
+                status='answered' if answered else 'pending',
+                created_at=created_at,
+                updated_at=updated_at,
+            )
+    insert_all(Query, query_rows())
+
+    # Bulk inserts bypass the write paths that maintain the counters
+    counters.rebuild(db.session.connection())
+
+    db.session.execute(text('ANALYZE'))
+    db.session.commit()
+    return {'students': students, 'teachers': teachers, 'subjects': subjects,
+            'enrollments': sum(len(ids) for ids in subjects_of.values()),
+            'assignments': sum(len(ids) for ids in teachers_of.values()),
+            'queries': queries}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--students', type=int, default=1000)
+    parser.add_argument('--teachers', type=int, default=50)
+    parser.add_argument('--subjects', type=int, default=40)
+    parser.add_argument('--queries', type=int, default=50000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--password', default=PASSWORD)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        started = time.perf_counter()
+        counts = generate(args.students, args.teachers, args.subjects, args.queries,
+                          seed=args.seed, password=args.password)
+        elapsed = time.perf_counter() - started
+    print(', '.join(f'{count} {name}' for name, count in counts.items()) + f' in {elapsed:.1f}s')
+
+if __name__ == '__main__':
+    main()
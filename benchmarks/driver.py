@@ -0,0 +1,291 @@
+"""Drive the app's pages with a realistic student/teacher traffic mix.
+
+Virtual users log in as accounts created by benchmarks.datagen and loop
+over weighted actions (dashboards, history pages, the JSON API, submitting
+queries, replying, saving profiles, dropping and re-adding a subject, the
+landing page, registering a new account, logging out and back in) for
+--duration seconds. The result is written as JSON for benchmarks.report to
+print or compare. Registering adds accounts to the database, as submitting
+adds queries; profile and subject saves leave the data as they found it.
+
+Left to other tools: /api/events (a stream open for the whole run, not a
+request with a latency), the admin analytics pages, bulk triage, and search,
+export and suggestions, which benchmarks.search, benchmarks.export and
+benchmarks.suggestions measure at scale.
+
+    python -m benchmarks.driver --start-server --workers 4 --users 40 \\
+        --duration 60 --output run.json
+    python -m benchmarks.report run.json
+"""
+import argparse
+import http.client
+import json
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from urllib.parse import urlencode, urlsplit
+
+from sqlalchemy import select
+
+from app import create_app, db
+from models import User, Subject, StudentSubject, TeacherSubject
+from benchmarks.datagen import PASSWORD
+from benchmarks.load import start_server
+from benchmarks.report import print_report, summarize
+
+FORM = {'Content-Type': 'application/x-www-form-urlencoded'}
+
+class VirtualUser:
+    def __init__(self, host, port, email, password, rng, results, profile, subjects):
+        self.connection = http.client.HTTPConnection(host, port, timeout=60)
+        self.host, self.port = host, port
+        self.email = email
+        self.password = password
+        self.rng = rng
+        self.results = results
+        self.profile = profile  # the profile form's fields, as stored
+        self.subjects = subjects  # (subject_id, name, department) of their own subjects
+        self.cookie = None
+
+    def request(self, name, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        started = time.perf_counter()
+        try:
+            self.connection.request(method, path, body, headers)
+            response = self.connection.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            self.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            self.results[name].append((None, 'error'))
+            return None, None
+        self.results[name].append((time.perf_counter() - started, response.status))
+        cookie = response.getheader('Set-Cookie')
+        if cookie:
+            self.cookie = cookie.split(';', 1)[0]
+        return response.status, data
+
+    def login(self):
+        status, _ = self.request('login', 'POST', '/login',
+                                 urlencode({'email': self.email, 'password': self.password}), FORM)
+        return status == 302
+
+    def api_queries(self, **params):
+        status, data = self.request('api_queries', 'GET', '/api/queries?' + urlencode(params))
+        return json.loads(data)['queries'] if status == 200 else []
+
+    def relogin(self):
+        self.request('logout', 'GET', '/logout')
+        self.request('index', 'GET', '/')
+        self.request('login_page', 'GET', '/login')
+        self.login()
+
+    def register(self):
+        # A new account each time; the session stays logged in as before
+        role = self.rng.choice(['student', 'teacher'])
+        number = f'{self.rng.getrandbits(48):012x}'
+        self.request('register', 'GET', '/register')
+        self.request('register POST', 'POST', '/register', urlencode({
+            'name': f'Driver {number}', 'email': f'driver{number}@bench.edu',
+            'password': self.password, 'role': role, 'department': self.profile['department'],
+            'roll_no': f'D{number}' if role == 'student' else '',
+        }), FORM)
+
+    def save_profile(self):
+        self.request(f'{self.role}_profile POST', 'POST', f'/{self.role}/profile',
+                     urlencode(self.profile), FORM)
+
+    def rejoin_subject(self):
+        # Drops one of their subjects and adds it back by name
+        if not self.subjects:
+            return
+        subject_id, name, department = self.rng.choice(self.subjects)
+        leave, join = ('withdraw', 'register') if self.role == 'student' else ('unassign', 'assign')
+        self.request(f'{self.role}_subjects POST', 'POST', f'/{self.role}/subjects',
+                     urlencode({'action': leave, 'subject_id': subject_id}), FORM)
+        self.request(f'{self.role}_subjects POST', 'POST', f'/{self.role}/subjects', urlencode({
+            'action': join, 'subject_name': name, 'subject_department': department,
+        }), FORM)
+
+class Student(VirtualUser):
+    role = 'student'
+
+    def __init__(self, *args, pairs, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pairs = pairs  # (subject_id, teacher_id) the student may ask
+
+    def actions(self):
+        return [
+            (30, lambda: self.request('student_dashboard', 'GET', '/student/dashboard')),
+            (25, lambda: self.request('view_queries', 'GET', '/student/queries')),
+            (10, lambda: self.api_queries(per_page=20)),
+            (10, self.submit_form),
+            (5, self.submit),
+            (10, lambda: self.request('student_subjects', 'GET', '/student/subjects')),
+            (10, lambda: self.request('student_profile', 'GET', '/student/profile')),
+            (3, self.save_profile),
+            (2, self.rejoin_subject),
+            (2, self.relogin),
+            (1, self.register),
+        ]
+
+    def submit_form(self):
+        subject_id, _ = self.rng.choice(self.pairs)
+        self.request('submit_query', 'GET', f'/student/submit-query?subject_id={subject_id}')
+        self.request('api_subject_teachers', 'GET', f'/api/subjects/{subject_id}/teachers')
+
+    def submit(self):
+        subject_id, teacher_id = self.rng.choice(self.pairs)
+        self.request('submit_query POST', 'POST', '/student/submit-query', urlencode({
+            'subject_id': subject_id, 'teacher_id': teacher_id,
+            'message': f'Benchmark question {self.rng.random():.6f}',
+        }), FORM)
+
+class Teacher(VirtualUser):
+    role = 'teacher'
+
+    def actions(self):
+        return [
+            (30, lambda: self.request('teacher_dashboard', 'GET', '/teacher/dashboard')),
+            (25, lambda: self.request('teacher_queries', 'GET', '/teacher/queries')),
+            (10, lambda: self.api_queries(status='pending', per_page=20)),
+            (15, self.respond),
+            (10, lambda: self.request('teacher_subjects', 'GET', '/teacher/subjects')),
+            (10, lambda: self.request('teacher_profile', 'GET', '/teacher/profile')),
+            (3, self.save_profile),
+            (2, self.rejoin_subject),
+            (2, self.relogin),
+            (1, self.register),
+        ]
+
+    def respond(self):
+        pending = self.api_queries(status='pending', per_page=20)
+        if not pending:
+            return
+        query_id = self.rng.choice(pending)['id']
+        self.request('respond_query', 'GET', f'/teacher/respond-query/{query_id}')
+        self.request('respond_query POST', 'POST', f'/teacher/respond-query/{query_id}',
+                     urlencode({'reply': 'Benchmark reply'}), FORM)
+
+def run_user(user, deadline, think_time):
+    if not user.login():
+        return
+    actions = user.actions()
+    weights = [weight for weight, _ in actions]
+    while time.monotonic() < deadline:
+        user.rng.choices(actions, weights)[0][1]()
+        if think_time:
+            time.sleep(user.rng.uniform(0, 2 * think_time))
+
+def profile_form(user):
+    form = {'name': user.name, 'email': user.email, 'department': user.department}
+    if user.role == 'student':
+        form['roll_no'] = user.roll_no
+    return form
+
+def own_subjects(link, user_column, user_id):
+    return [tuple(row) for row in db.session.execute(
+        select(Subject.id, Subject.name, Subject.department)
+        .join(link, link.subject_id == Subject.id)
+        .where(user_column == user_id)
+    )]
+
+def build_users(args, host, port, results):
+    # Picks accounts, their profiles and subjects, and each student's
+    # askable (subject, teacher) pairs straight from the database
+    rng = random.Random(args.seed)
+    with create_app().app_context():
+        teacher_count = round(args.users * args.teacher_share)
+        students = db.session.scalars(select(User.id).filter_by(role='student').order_by(User.id)).all()
+        teachers = db.session.scalars(select(User.id).filter_by(role='teacher').order_by(User.id)).all()
+        if not students or not teachers:
+            sys.exit('no users found; populate the database with benchmarks.datagen first')
+
+        users = []
+        for student_id in rng.sample(students, min(args.users - teacher_count, len(students))):
+            pairs = db.session.execute(
+                select(StudentSubject.subject_id, TeacherSubject.teacher_id)
+                .join(TeacherSubject, TeacherSubject.subject_id == StudentSubject.subject_id)
+                .where(StudentSubject.student_id == student_id)
+            ).all()
+            if pairs:
+                user = db.session.get(User, student_id)
+                users.append(Student(host, port, user.email, args.password, random.Random(rng.random()),
+                                     results, profile_form(user),
+                                     own_subjects(StudentSubject, StudentSubject.student_id, student_id),
+                                     pairs=[tuple(pair) for pair in pairs]))
+        for teacher_id in rng.sample(teachers, min(teacher_count, len(teachers))):
+            user = db.session.get(User, teacher_id)
+            users.append(Teacher(host, port, user.email, args.password, random.Random(rng.random()),
+                                 results, profile_form(user),
+                                 own_subjects(TeacherSubject, TeacherSubject.teacher_id, teacher_id)))
+    return users
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://127.0.0.1:5000',
+                        help='server to drive (ignored with --start-server)')
+    parser.add_argument('--start-server', action='store_true',
+                        help='start gunicorn with gunicorn.conf.py for the run')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--teacher-share', type=float, default=0.2)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--think-time', type=float, default=0.0,
+                        help='mean pause between actions, in seconds')
+    parser.add_argument('--password', default=PASSWORD)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='write the JSON report here')
+    args = parser.parse_args()
+
+    server = None
+    if args.start_server:
+        host, port = '127.0.0.1', 5057
+        server = start_server(port, args.workers, 'gthread')
+        url = f'http://{host}:{port}'
+    else:
+        url = args.url
+        host, port = urlsplit(url).hostname, urlsplit(url).port or 80
+
+    results = defaultdict(list)
+    try:
+        users = build_users(args, host, port, results)
+        deadline = time.monotonic() + args.duration
+        threads = [threading.Thread(target=run_user, args=(user, deadline, args.think_time))
+                   for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    def ok(samples):
+        return [latency for latency, status in samples if status != 'error' and status < 500]
+
+    def errors(samples):
+        return sum(1 for _, status in samples if status == 'error' or status >= 500)
+
+    everything = [sample for samples in results.values() for sample in samples]
+    report = {
+        'meta': {'url': url, 'users': len(users), 'duration': args.duration,
+                 'workers': args.workers if server else None, 'seed': args.seed,
+                 'finished_at': datetime.utcnow().isoformat()},
+        'overall': summarize(ok(everything), errors(everything), args.duration),
+        'routes': {name: summarize(ok(samples), errors(samples), args.duration)
+                   for name, samples in results.items()},
+    }
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Check that each route's main query is served by an index.
+
+Seeds the configured database (DATABASE_URL, initialised with `flask db-init`)
+using benchmarks.datagen, then runs EXPLAIN on the statements behind the list
+pages, dashboards and subject find-or-create. Exits non-zero if any of them
+falls back to a full scan.
+
+    DATABASE_URL=sqlite:///bench.db python -m benchmarks.explain_indexes --queries 1000000
+"""
+import argparse
+import sys
+
+from sqlalchemy import func, select, text
+
+from app import create_app, db
+from models import Subject, Query
+from benchmarks.datagen import generate
+
+def hot_statements(student_id, teacher_id):
+    newest = (Query.created_at.desc(), Query.id.desc())
+    return {
+        'view_queries': select(Query).where(Query.student_id == student_id)
+            .order_by(*newest).limit(21),
+        'teacher_queries': select(Query).where(Query.teacher_id == teacher_id)
+            .order_by(*newest).limit(21),
+        'teacher_queries?status': select(Query).where(
+            Query.teacher_id == teacher_id, Query.status == 'answered'
+        ).order_by(*newest).limit(21),
+        'student_dashboard': select(Query).where(Query.student_id == student_id)
+            .order_by(Query.created_at.desc()).limit(5),
+        'teacher_dashboard': select(Query).where(
+            Query.teacher_id == teacher_id, Query.status == 'pending'
+        ).order_by(Query.created_at.desc()).limit(5),
+        'subject find-or-create': select(Subject).where(
+            Subject.name == 'Subject 0', Subject.department == 'Computer Science'
+        ),
+    }
+
+def explain(statement):
+    # Returns (plan lines, whether the plan avoids a full scan)
+    sql = str(statement.compile(dialect=db.engine.dialect,
+                                compile_kwargs={'literal_binds': True}))
+    if db.engine.dialect.name == 'sqlite':
+        plan = [row[-1] for row in db.session.execute(text(f'EXPLAIN QUERY PLAN {sql}'))]
+        uses_index = any('USING' in line and 'INDEX' in line for line in plan)
+        scans = any(line.startswith('SCAN') and 'INDEX' not in line for line in plan)
+    else:
+        plan = [row[0] for row in db.session.execute(text(f'EXPLAIN {sql}'))]
+        uses_index = any('Index' in line for line in plan)
+        scans = any('Seq Scan' in line for line in plan)
+    return plan, uses_index and not scans
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--queries', type=int, default=1000000)
+    parser.add_argument('--no-seed', action='store_true',
+                        help='explain against the existing data')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        if not args.no_seed:
+            generate(students=max(args.queries // 100, 1), teachers=max(args.queries // 1000, 1),
+                     subjects=max(args.queries // 10000, 1), queries=args.queries)
+        # Explain against the busiest owners, the worst case for each filter
+        student_id = db.session.scalar(select(Query.student_id).group_by(Query.student_id)
+                                       .order_by(func.count().desc()).limit(1))
+        teacher_id = db.session.scalar(select(Query.teacher_id).group_by(Query.teacher_id)
+                                       .order_by(func.count().desc()).limit(1))
+
+        failures = 0
+        for name, statement in hot_statements(student_id, teacher_id).items():
+            plan, ok = explain(statement)
+            failures += not ok
+            print(f"{'ok  ' if ok else 'SCAN'} {name}")
+            for line in plan:
+                print(f"       {line}")
+
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
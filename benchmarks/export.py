@@ -0,0 +1,95 @@
+"""Check that history exports stream in constant memory.
+
+Seeds the configured database (DATABASE_URL, initialised with `flask db-init`)
+using benchmarks.datagen so one student owns --rows queries, in a child
+process so seeding doesn't raise this process's peak RSS. Then downloads
+that student's /api/queries/export through the test client in each format,
+consuming the body as it streams, and reports throughput and how far the
+export raised peak RSS. Exits 1 if any export grows RSS past --rss-budget-mb.
+
+    DATABASE_URL=sqlite:///export.db flask --app main db-init
+    DATABASE_URL=sqlite:///export.db python -m benchmarks.export --rows 1000000
+"""
+import argparse
+import multiprocessing
+import resource
+import sys
+import time
+
+from sqlalchemy import func, select
+
+from app import create_app, db
+from models import Query
+from benchmarks.datagen import generate
+
+EXPORTS = (('csv', 'format=csv'), ('ndjson', 'format=ndjson'), ('csv+gzip', 'format=csv&gzip=1'))
+
+def seed(rows):
+    with create_app().app_context():
+        generate(students=1, teachers=4, subjects=4, queries=rows)
+
+def peak_rss_mib():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def download(client, query_string):
+    # (bytes, newlines) of the streamed body, never holding more than a chunk
+    response = client.get(f'/api/queries/export?{query_string}', buffered=False)
+    if response.status_code != 200:
+        sys.exit(f'export failed with HTTP {response.status_code}')
+    size = lines = 0
+    for chunk in response.response:
+        chunk = chunk if isinstance(chunk, bytes) else chunk.encode()
+        size += len(chunk)
+        lines += chunk.count(b'\n')
+    response.close()
+    return size, lines
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--no-seed', action='store_true',
+                        help="use the existing data's busiest student")
+    parser.add_argument('--rss-budget-mb', type=float, default=64)
+    args = parser.parse_args()
+
+    if not args.no_seed:
+        child = multiprocessing.get_context('spawn').Process(target=seed, args=(args.rows,))
+        child.start()
+        child.join()
+        if child.exitcode:
+            sys.exit('seeding failed')
+
+    app = create_app({'TESTING': True})
+    with app.app_context():
+        student_id, history = db.session.execute(
+            select(Query.student_id, func.count()).group_by(Query.student_id)
+            .order_by(func.count().desc()).limit(1)
+        ).one()
+    print(f'student {student_id} has {history} queries')
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = student_id
+    # Warm up lazy imports and the connection pool
+    download(client, 'format=csv&status=closed')
+
+    over_budget = False
+    print(f"{'export':<10} {'lines':>9} {'MiB':>8} {'seconds':>8} {'rows/s':>9} {'RSS +MiB':>9}")
+    for name, query_string in EXPORTS:
+        before = peak_rss_mib()
+        started = time.perf_counter()
+        size, lines = download(client, query_string)
+        elapsed = time.perf_counter() - started
+        growth = peak_rss_mib() - before
+        over_budget |= growth > args.rss_budget_mb
+        # Newlines in compressed output mean nothing
+        lines = '-' if 'gzip' in query_string else lines
+        print(f'{name:<10} {lines:>9} {size / 2 ** 20:>8.1f} {elapsed:>8.1f} '
+              f'{history / elapsed:>9.0f} {growth:>9.1f}')
+
+    if over_budget:
+        sys.exit(f'an export grew peak RSS by more than {args.rss_budget_mb:g} MiB')
+
+if __name__ == '__main__':
+    main()
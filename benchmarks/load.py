@@ -0,0 +1,151 @@
+"""Load-test the gunicorn serving mode at several worker counts.
+
+For each worker count this starts gunicorn with gunicorn.conf.py, logs in
+once, hammers one URL from --concurrency keep-alive clients for --duration
+seconds and reports throughput, latency percentiles, errors and (on
+PostgreSQL) the peak number of server connections the app held open.
+
+    DATABASE_URL=postgresql://... python -m benchmarks.load \\
+        --workers 1,2,4 --email robert.teacher@demo.edu --password teacher123
+"""
+import argparse
+import http.client
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlencode
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import NullPool
+
+from benchmarks.report import percentile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def start_server(port, workers, worker_class):
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+         '--bind', f'127.0.0.1:{port}', '--workers', str(workers),
+         '--worker-class', worker_class],
+        # Load tests drive many logins and writes from one address, so rate
+        # limits are off unless RATE_LIMIT_ENABLED is set explicitly
+        cwd=ROOT, env={'RATE_LIMIT_ENABLED': '0', **os.environ, 'GUNICORN_WORKER_CLASS': worker_class},
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.kill()
+    sys.exit('gunicorn did not start within 30s')
+
+def login(port, email, password):
+    # Returns the session cookie, or None when no credentials were given
+    if not email:
+        return None
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    connection.request('POST', '/login', urlencode({'email': email, 'password': password}),
+                       {'Content-Type': 'application/x-www-form-urlencoded'})
+    response = connection.getresponse()
+    response.read()
+    cookie = response.getheader('Set-Cookie')
+    if response.status != 302 or not cookie:
+        sys.exit(f'login failed for {email} (HTTP {response.status})')
+    return cookie.split(';', 1)[0]
+
+def client(port, path, cookie, deadline, latencies, errors):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    headers = {'Cookie': cookie} if cookie else {}
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            connection.request('GET', path, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            if response.status >= 500:
+                errors.append(response.status)
+            else:
+                latencies.append(time.perf_counter() - started)
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(type(e).__name__)
+            connection.close()
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+
+def watch_connections(database_url, stop, peak):
+    # Samples the app's server-side connection count on PostgreSQL
+    if not database_url.startswith('postgresql'):
+        return
+    engine = create_engine(database_url, poolclass=NullPool)
+    while not stop.is_set():
+        with engine.connect() as connection:
+            count = connection.scalar(text(
+                "SELECT count(*) - 1 FROM pg_stat_activity WHERE datname = current_database()"
+            ))
+        peak[0] = max(peak[0], count)
+        stop.wait(0.25)
+
+def run(args, workers, port):
+    server = start_server(port, workers, args.worker_class)
+    try:
+        cookie = login(port, args.email, args.password)
+        latencies, errors, peak = [], [], [0]
+        stop = threading.Event()
+        watcher = threading.Thread(target=watch_connections,
+                                   args=(os.environ.get('DATABASE_URL', ''), stop, peak))
+        watcher.start()
+
+        deadline = time.monotonic() + args.duration
+        clients = [threading.Thread(target=client,
+                                    args=(port, args.path, cookie, deadline, latencies, errors))
+                   for _ in range(args.concurrency)]
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+        stop.set()
+        watcher.join()
+    finally:
+        server.terminate()
+        server.wait()
+
+    if not latencies:
+        sys.exit(f'no successful requests; errors: {errors[:5]}')
+    return {
+        'workers': workers,
+        'rps': len(latencies) / args.duration,
+        'p50': percentile(latencies, 0.50) * 1000,
+        'p99': percentile(latencies, 0.99) * 1000,
+        'mean': statistics.mean(latencies) * 1000,
+        'errors': len(errors),
+        'peak_connections': peak[0] if os.environ.get('DATABASE_URL', '').startswith('postgresql') else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', default='1,2,4',
+                        help='comma-separated worker counts to compare')
+    parser.add_argument('--worker-class', default='gthread', choices=['gthread', 'gevent'])
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--path', default='/api/queries')
+    parser.add_argument('--email')
+    parser.add_argument('--password')
+    parser.add_argument('--port', type=int, default=5055)
+    args = parser.parse_args()
+
+    print(f"{'workers':>7} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7} {'peak conns':>11}")
+    for workers in [int(n) for n in args.workers.split(',')]:
+        result = run(args, workers, args.port)
+        peak = result['peak_connections']
+        print(f"{result['workers']:>7} {result['rps']:>9.1f} {result['p50']:>8.1f} "
+              f"{result['p99']:>8.1f} {result['errors']:>7} {'-' if peak is None else peak:>11}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""Measure login latency under a concurrent login burst.
+
+Starts gunicorn with gunicorn.conf.py, then runs --concurrency clients that
+log in back to back as --email/--password for --duration seconds. With
+--path, as many clients again fetch that URL meanwhile, showing whether the
+burst starves other routes. Tune the hashing pool with PASSWORD_HASH_*.
+
+    DATABASE_URL=... python -m benchmarks.login \\
+        --email alice.student@demo.edu --password student123 --path /api/queries
+"""
+import argparse
+import http.client
+import sys
+import threading
+import time
+from urllib.parse import urlencode
+
+from benchmarks.load import start_server
+from benchmarks.report import percentile
+
+def login_client(port, email, password, deadline, latencies, statuses):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    body = urlencode({'email': email, 'password': password})
+    headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        connection.request('POST', '/login', body, headers)
+        response = connection.getresponse()
+        response.read()
+        latencies.append(time.perf_counter() - started)
+        statuses.append(response.status)
+
+def page_client(port, path, deadline, latencies):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        connection.request('GET', path)
+        connection.getresponse().read()
+        latencies.append(time.perf_counter() - started)
+
+def report(label, latencies, duration):
+    if not latencies:
+        print(f"{label:<14} no completed requests")
+        return
+    print(f"{label:<14} {len(latencies) / duration:8.1f} req/s   "
+          f"p50 {percentile(latencies, 0.50) * 1000:8.1f} ms   "
+          f"p99 {percentile(latencies, 0.99) * 1000:8.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--email', required=True)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--path', help='URL fetched alongside the logins')
+    parser.add_argument('--port', type=int, default=5056)
+    args = parser.parse_args()
+
+    server = start_server(args.port, args.workers, 'gthread')
+    try:
+        logins, statuses, pages = [], [], []
+        deadline = time.monotonic() + args.duration
+        threads = [threading.Thread(target=login_client, args=(
+            args.port, args.email, args.password, deadline, logins, statuses
+        )) for _ in range(args.concurrency)]
+        if args.path:
+            threads += [threading.Thread(target=page_client, args=(
+                args.port, args.path, deadline, pages
+            )) for _ in range(args.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        server.terminate()
+        server.wait()
+
+    report('login', logins, args.duration)
+    if args.path:
+        report(args.path, pages, args.duration)
+    busy = statuses.count(503)
+    if busy:
+        print(f"{busy} login(s) shed with 503 by the hashing pool")
+    if not statuses or all(status not in (302, 503) for status in statuses):
+        sys.exit('no login succeeded; check --email/--password')
+
+if __name__ == '__main__':
+    main()
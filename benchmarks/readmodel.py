@@ -0,0 +1,87 @@
+"""Compare ORM instances with read-model rows for a large teacher inbox.
+
+Seeds the configured database (DATABASE_URL, initialised with `flask db-init`)
+using benchmarks.datagen so one teacher owns --queries queries, then loads
+that inbox whole and as a first page, once as Query instances with their
+subject and student (what the list routes used to do) and once through
+readmodel, reporting median latency and the memory the result holds.
+
+    DATABASE_URL=sqlite:///inbox.db flask --app main db-init
+    DATABASE_URL=sqlite:///inbox.db python -m benchmarks.readmodel --queries 10000
+"""
+import argparse
+import gc
+import statistics
+import time
+import tracemalloc
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import selectinload
+
+from app import create_app, db
+from models import Query
+from benchmarks.datagen import generate
+import readmodel
+
+def orm_inbox(teacher_id, limit):
+    base = Query.query.options(
+        selectinload(Query.subject),
+        selectinload(Query.student)
+    ).filter_by(teacher_id=teacher_id).order_by(Query.created_at.desc(), Query.id.desc())
+    return base.limit(limit).all()
+
+def readmodel_inbox(teacher_id, limit):
+    return readmodel.to_rows(readmodel.query_list(
+        Query.teacher_id == teacher_id
+    ).order_by(Query.created_at.desc(), Query.id.desc()).limit(limit))
+
+def measure(load, teacher_id, limit, repeats):
+    # (median seconds, bytes held by the result)
+    timings = []
+    for _ in range(repeats):
+        db.session.expunge_all()
+        started = time.perf_counter()
+        load(teacher_id, limit)
+        timings.append(time.perf_counter() - started)
+        db.session.rollback()
+
+    db.session.expunge_all()
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = load(teacher_id, limit)
+    gc.collect()
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del result
+    db.session.rollback()
+    return statistics.median(timings), held
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--queries', type=int, default=10000)
+    parser.add_argument('--no-seed', action='store_true',
+                        help="use the existing data's busiest teacher")
+    parser.add_argument('--page-size', type=int, default=20)
+    parser.add_argument('--repeats', type=int, default=20)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        if not args.no_seed:
+            generate(students=max(args.queries // 50, 1), teachers=1, subjects=4,
+                     queries=args.queries)
+        teacher_id, inbox = db.session.execute(
+            select(Query.teacher_id, func.count()).group_by(Query.teacher_id)
+            .order_by(func.count().desc()).limit(1)
+        ).one()
+        print(f'teacher {teacher_id} has {inbox} queries')
+
+        print(f"{'load':<12} {'rows':>6} {'method':<10} {'median ms':>10} {'held KiB':>10}")
+        for name, limit in (('first page', args.page_size), ('whole inbox', inbox)):
+            for method, load in (('orm', orm_inbox), ('readmodel', readmodel_inbox)):
+                seconds, held = measure(load, teacher_id, limit, args.repeats)
+                print(f"{name:<12} {limit:>6} {method:<10} {seconds * 1000:>10.2f} {held / 1024:>10.0f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Print or compare load-driver reports.
+
+With one report, prints its per-route throughput and latency percentiles.
+With two, compares the second (candidate) against the first (baseline) and
+exits non-zero if any route's p50/p99 latency grew, or its throughput fell,
+by more than --threshold percent.
+
+    python -m benchmarks.report baseline.json candidate.json --threshold 10
+"""
+import argparse
+import json
+import sys
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+def summarize(latencies, errors, duration):
+    # latencies in seconds -> a JSON-friendly dict in milliseconds
+    if not latencies:
+        return {'count': 0, 'errors': errors, 'rps': 0.0}
+    return {
+        'count': len(latencies),
+        'errors': errors,
+        'rps': len(latencies) / duration,
+        'mean_ms': sum(latencies) / len(latencies) * 1000,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p90_ms': percentile(latencies, 0.90) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+    }
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+def print_report(report):
+    meta = report['meta']
+    print(f"{meta['users']} users for {meta['duration']}s against {meta['url']}")
+    print(f"{'route':<28} {'req/s':>8} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for name, stats in sorted(report['routes'].items()) + [('TOTAL', report['overall'])]:
+        if not stats['count']:
+            print(f"{name:<28} {'-':>8} {'-':>8} {'-':>8} {'-':>8} {stats['errors']:>7}")
+            continue
+        print(f"{name:<28} {stats['rps']:>8.1f} {stats['p50_ms']:>8.1f} {stats['p90_ms']:>8.1f} "
+              f"{stats['p99_ms']:>8.1f} {stats['errors']:>7}")
+
+def change(before, after):
+    return (after - before) / before * 100 if before else 0.0
+
+def compare(baseline, candidate, threshold):
+    # Prints the deltas and returns the names of regressed routes
+    print(f"{'route':<28} {'req/s':>16} {'p50 ms':>16} {'p99 ms':>16}")
+    regressions = []
+    routes = sorted(set(baseline['routes']) & set(candidate['routes']))
+    for name in routes + ['TOTAL']:
+        old = baseline['overall'] if name == 'TOTAL' else baseline['routes'][name]
+        new = candidate['overall'] if name == 'TOTAL' else candidate['routes'][name]
+        if not old['count'] or not new['count']:
+            continue
+        rps, p50, p99 = (change(old['rps'], new['rps']), change(old['p50_ms'], new['p50_ms']),
+                         change(old['p99_ms'], new['p99_ms']))
+        regressed = rps < -threshold or p50 > threshold or p99 > threshold
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<28} {new['rps']:>8.1f} {rps:>+6.1f}% {new['p50_ms']:>8.1f} {p50:>+6.1f}% "
+              f"{new['p99_ms']:>8.1f} {p99:>+6.1f}%{'  REGRESSED' if regressed else ''}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('reports', nargs='+', metavar='report.json')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='allowed change in percent before a route counts as regressed')
+    args = parser.parse_args()
+
+    if len(args.reports) == 1:
+        print_report(load(args.reports[0]))
+    elif len(args.reports) == 2:
+        regressions = compare(load(args.reports[0]), load(args.reports[1]), args.threshold)
+        if regressions:
+            sys.exit(f"regressed: {', '.join(regressions)}")
+    else:
+        parser.error('pass one report to print it or two to compare them')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Time full-text search against a naive LIKE scan.
+
+Seeds the configured database (DATABASE_URL, initialised with `flask db-init`
+so migration 6 has created the search index) using benchmarks.datagen, then
+runs the same one- and two-word searches through search.search_queries and
+through an equivalent `message/reply LIKE '%word%'` filter, scoped to the
+busiest teacher and to random teachers and students, and prints latency
+percentiles for each.
+
+    DATABASE_URL=sqlite:///bench.db python -m benchmarks.search --queries 3000000
+    DATABASE_URL=postgresql://... python -m benchmarks.search --no-seed
+"""
+import argparse
+import random
+import time
+
+from sqlalchemy import and_, func, or_, select
+
+from app import create_app, db
+from models import Query
+from benchmarks.datagen import WORDS, generate
+from benchmarks.report import percentile
+import search
+
+def like_search(owner_column, owner_id, words, per_page):
+    # The scan search replaces: every word somewhere in message or reply
+    matches = [or_(Query.message.ilike(f'%{word}%'), Query.reply.ilike(f'%{word}%'))
+               for word in words]
+    return db.session.execute(
+        select(Query.id).where(owner_column == owner_id, and_(*matches))
+        .order_by(Query.created_at.desc()).limit(per_page)
+    ).all()
+
+def fts_search(owner_column, owner_id, words, per_page):
+    return search.search_queries(Query.query, owner_column, owner_id, ' '.join(words),
+                                 per_page=per_page)
+
+def timed(function, cases, per_page):
+    latencies = []
+    for owner_column, owner_id, words in cases:
+        started = time.perf_counter()
+        function(owner_column, owner_id, words, per_page)
+        latencies.append(time.perf_counter() - started)
+        db.session.rollback()
+    return latencies
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--queries', type=int, default=1000000,
+                        help='rows to seed (and the range of rare search terms)')
+    parser.add_argument('--no-seed', action='store_true',
+                        help='search the existing data')
+    parser.add_argument('--searches', type=int, default=200)
+    parser.add_argument('--per-page', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        if not args.no_seed:
+            started = time.perf_counter()
+            generate(students=max(args.queries // 100, 1), teachers=max(args.queries // 1000, 1),
+                     subjects=max(args.queries // 10000, 1), queries=args.queries)
+            print(f'seeded {args.queries} queries in {time.perf_counter() - started:.1f}s')
+
+        rng = random.Random(args.seed)
+        busiest = db.session.scalar(select(Query.teacher_id).group_by(Query.teacher_id)
+                                    .order_by(func.count().desc()).limit(1))
+        teachers = db.session.scalars(select(Query.teacher_id).distinct()).all()
+        students = db.session.scalars(select(Query.student_id).distinct().limit(10000)).all()
+
+        def words():
+            # Vocabulary words match most rows, the worst case for ranking;
+            # question numbers (see datagen) match one row, the worst case
+            # for a scan
+            if rng.random() < 0.5:
+                return [str(rng.randrange(args.queries))]
+            return rng.sample(WORDS, rng.choice((1, 2)))
+
+        scenarios = {
+            'busiest teacher': [(Query.teacher_id, busiest, words()) for _ in range(args.searches)],
+            'random teacher': [(Query.teacher_id, rng.choice(teachers), words())
+                               for _ in range(args.searches)],
+            'random student': [(Query.student_id, rng.choice(students), words())
+                               for _ in range(args.searches)],
+        }
+
+        print(f"{'scope':<16} {'method':<6} {'p50 ms':>9} {'p99 ms':>9}")
+        for name, cases in scenarios.items():
+            for method, function in (('fts', fts_search), ('like', like_search)):
+                latencies = timed(function, cases, args.per_page)
+                print(f"{name:<16} {method:<6} {percentile(latencies, 0.50) * 1000:>9.2f} "
+                      f"{percentile(latencies, 0.99) * 1000:>9.2f}")
+
+if __name__ == '__main__':
+    main()
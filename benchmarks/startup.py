@@ -0,0 +1,59 @@
+"""Measure import-to-first-request latency of a fresh worker.
+
+Each sample starts a new interpreter, imports main (which builds the app the
+way a gunicorn worker does) and serves one request through the test client,
+so the numbers include interpreter start-up costs that a pre-forked worker
+would pay.
+
+    python -m benchmarks.startup --workers 10 --path /api/queries
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+WORKER = """
+import json, time
+started = time.perf_counter()
+from main import app
+imported = time.perf_counter()
+response = app.test_client().get({path!r})
+served = time.perf_counter()
+print(json.dumps({{
+    'import_ms': (imported - started) * 1000,
+    'first_request_ms': (served - imported) * 1000,
+    'status': response.status_code,
+}}))
+"""
+
+def run_worker(path):
+    result = subprocess.run(
+        [sys.executable, '-c', WORKER.format(path=path)],
+        capture_output=True, text=True
+    )
+    if result.returncode:
+        sys.exit(f"worker failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def summarize(label, values):
+    print(f"{label:<18} median {statistics.median(values):8.1f} ms"
+          f"   min {min(values):8.1f} ms   max {max(values):8.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=10,
+                        help='number of fresh interpreters to sample')
+    parser.add_argument('--path', default='/api/queries',
+                        help='URL of the first request')
+    args = parser.parse_args()
+
+    samples = [run_worker(args.path) for _ in range(args.workers)]
+    print(f"{args.workers} workers, first request GET {args.path} "
+          f"-> {samples[0]['status']}")
+    summarize('import', [s['import_ms'] for s in samples])
+    summarize('first request', [s['first_request_ms'] for s in samples])
+    summarize('total', [s['import_ms'] + s['first_request_ms'] for s in samples])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""Time duplicate-question lookups against one large subject's index.
+
+Builds a suggestions.SubjectIndex in memory from --answered synthetic
+questions (datagen's vocabulary, no database needed), then reports build
+time, matrix size and lookup latency percentiles for questions drawn from
+the same distribution, including lookups while new answers sit in the
+unmerged tail.
+
+    python -m benchmarks.suggestions --answered 100000 --lookups 1000
+"""
+import argparse
+import random
+import time
+
+from benchmarks.datagen import WORDS
+from benchmarks.report import percentile
+import suggestions
+
+def question(rng, number):
+    return f'Question {number}: ' + ' '.join(rng.choice(WORDS) for _ in range(rng.randint(8, 40)))
+
+def time_lookups(index, rng, lookups):
+    latencies = []
+    for _ in range(lookups):
+        text = question(rng, rng.randrange(10 ** 6))
+        started = time.perf_counter()
+        index.lookup(text)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--answered', type=int, default=100000)
+    parser.add_argument('--lookups', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    index = suggestions.SubjectIndex()
+    started = time.perf_counter()
+    index.add([(i, question(rng, i)) for i in range(args.answered)])
+    with index.lock:
+        index.rebuild()
+    built = time.perf_counter() - started
+    matrix = index.matrix
+    size = matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+    print(f'indexed {len(index)} answers in {built:.1f}s: {len(index.vocabulary)} terms, '
+          f'{matrix.nnz} non-zeros, {size / 2 ** 20:.1f} MiB')
+
+    print(f"{'phase':<24} {'p50 ms':>8} {'p99 ms':>8}")
+    rows = [('merged', time_lookups(index, rng, args.lookups))]
+    index.add([(args.answered + i, question(rng, args.answered + i))
+               for i in range(suggestions.TAIL_SIZE - 1)])
+    rows.append((f'with {len(index.tail)}-answer tail', time_lookups(index, rng, args.lookups)))
+    started = time.perf_counter()
+    index.add([(args.answered + suggestions.TAIL_SIZE, question(rng, 0))])
+    merged = time.perf_counter() - started
+    for phase, latencies in rows:
+        print(f"{phase:<24} {percentile(latencies, 0.50) * 1000:>8.2f} "
+              f"{percentile(latencies, 0.99) * 1000:>8.2f}")
+    print(f'folding the tail in took {merged * 1000:.0f} ms')
+
+if __name__ == '__main__':
+    main()
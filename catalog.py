@@ -0,0 +1,91 @@
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from app import db
+from models import User, Subject, TeacherSubject
+
+# Plain rows rather than ORM instances, so cached entries never outlive or
+# leak between database sessions
+SubjectRow = namedtuple('SubjectRow', 'id name department')
+TeacherRow = namedtuple('TeacherRow', 'id name department')
+
+class TTLCache:
+    # Small thread-safe LRU cache whose entries also expire after ttl seconds.
+    # It is per process, so other workers see changes within ttl at worst.
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped by every invalidation; a load that overlapped one may have
+        # read the old data, so its result is returned but not stored
+        self._generation = 0
+
+    def get(self, key, load):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(key)
+                return entry[1]
+            generation = self._generation
+
+        value = load()
+        with self._lock:
+            if generation != self._generation:
+                return value
+            self._entries[key] = (now + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, *keys):
+        with self._lock:
+            self._generation += 1
+            if not keys:
+                self._entries.clear()
+            for key in keys:
+                self._entries.pop(key, None)
+
+cache = TTLCache(
+    maxsize=int(os.environ.get('CATALOG_CACHE_SIZE', 1024)),
+    ttl=float(os.environ.get('CATALOG_CACHE_TTL', 300)),
+)
+
+def subjects_with_teachers():
+    # Subjects a student can actually ask about: those with an assigned teacher
+    def load():
+        rows = db.session.query(Subject.id, Subject.name, Subject.department).filter(
+            Subject.id.in_(db.session.query(TeacherSubject.subject_id))
+        ).order_by(Subject.department, Subject.name).all()
+        return [SubjectRow(*row) for row in rows]
+    return cache.get('subjects', load)
+
+def teachers_for_subject(subject_id):
+    def load():
+        rows = db.session.query(User.id, User.name, User.department).join(
+            TeacherSubject, TeacherSubject.teacher_id == User.id
+        ).filter(
+            TeacherSubject.subject_id == subject_id
+        ).order_by(User.name).all()
+        return [TeacherRow(*row) for row in rows]
+    return cache.get(('teachers', subject_id), load)
+
+def is_teacher_assigned(teacher_id, subject_id):
+    # Validates submissions, so it reads the database rather than the cache,
+    # which another worker's unassignment may not have reached yet; one
+    # lookup on the unique (teacher_id, subject_id) index
+    return db.session.query(TeacherSubject.query.filter_by(
+        teacher_id=teacher_id, subject_id=subject_id
+    ).exists()).scalar()
+
+def invalidate_subject(subject_id):
+    # Called when a teacher is assigned to or unassigned from a subject
+    cache.invalidate('subjects', ('teachers', subject_id))
+
+def invalidate_all():
+    cache.invalidate()
@@ -0,0 +1,138 @@
+import time
+
+import click
+from flask import current_app
+
+from app import db
+import analytics
+import archive
+import counters
+import migrations
+import replicas
+import roster
+
+@click.command('db-init')
+def db_init_command():
+    """Create the database schema by applying every migration."""
+    applied = migrations.upgrade(db.engine)
+    click.echo(f"Applied {len(applied)} migration(s); schema is up to date.")
+
+@click.command('db-migrate')
+@click.option('--target', type=int, default=None,
+              help='Stop after this migration version.')
+def db_migrate_command(target):
+    """Apply pending schema migrations."""
+    applied = migrations.upgrade(db.engine, target=target)
+    if applied:
+        click.echo(f"Applied migration(s): {', '.join(map(str, applied))}")
+    else:
+        click.echo("No pending migrations.")
+
+@click.command('import-roster')
+@click.option('--users', type=click.Path(exists=True, dir_okay=False),
+              help='CSV with role,name,email,password,department,roll_no')
+@click.option('--subjects', type=click.Path(exists=True, dir_okay=False),
+              help='CSV with name,department')
+@click.option('--enrollments', type=click.Path(exists=True, dir_okay=False),
+              help='CSV with email,subject_name,subject_department')
+@click.option('--batch-size', type=int, default=roster.BATCH_SIZE, show_default=True)
+@click.option('--hash-workers', type=int, default=None,
+              help='Password hashing processes (default: one per CPU).')
+def import_roster_command(users, subjects, enrollments, batch_size, hash_workers):
+    """Bulk-load users, subjects and enrollments from CSV files."""
+    if not any([users, subjects, enrollments]):
+        raise click.UsageError('Pass at least one of --users, --subjects, --enrollments.')
+    # Users and subjects first, so enrollments can refer to them
+    if users:
+        click.echo(roster.timed('users', roster.import_users, users,
+                                batch_size=batch_size, hash_workers=hash_workers))
+    if subjects:
+        click.echo(roster.timed('subjects', roster.import_subjects, subjects,
+                                batch_size=batch_size))
+    if enrollments:
+        click.echo(roster.timed('enrollments', roster.import_enrollments, enrollments,
+                                batch_size=batch_size))
+
+@click.command('rebuild-counters')
+@click.option('--check', is_flag=True,
+              help='Only report counters that drifted; exit 1 if any did.')
+def rebuild_counters_command(check):
+    """Recompute the dashboard counters from the queries table."""
+    if check:
+        with db.engine.connect() as connection:
+            drift = counters.check(connection)
+        for scope, scope_id, stored, actual in drift:
+            click.echo(f"{scope} {scope_id}: stored {tuple(stored)}, actual {tuple(actual)}")
+        if drift:
+            raise click.exceptions.Exit(1)
+        click.echo("Counters are consistent.")
+        return
+
+    with db.engine.begin() as connection:
+        counters.rebuild(connection)
+    click.echo("Counters rebuilt.")
+
+@click.command('archive-queries')
+@click.option('--older-than-days', type=int, default=365, show_default=True,
+              help='Archive answered and closed queries created longer ago than this.')
+@click.option('--batch-size', type=int, default=archive.BATCH_SIZE, show_default=True)
+@click.option('--dry-run', is_flag=True, help='Only count the queries that would move.')
+def archive_queries_command(older_than_days, batch_size, dry_run):
+    """Move finished queries past the retention window into queries_archive."""
+    older_than = archive.retention_cutoff(older_than_days)
+    count = archive.archive_queries(older_than, batch_size=batch_size, dry_run=dry_run)
+    if dry_run:
+        click.echo(f"{count} queries created before {older_than:%Y-%m-%d} would be archived.")
+    else:
+        click.echo(f"Archived {count} queries created before {older_than:%Y-%m-%d}.")
+
+@click.command('replica-heartbeat')
+@click.option('--interval', type=float, default=replicas.HEARTBEAT_SECONDS, show_default=True,
+              help='Seconds between heartbeats.')
+@click.option('--once', is_flag=True, help='Write one heartbeat and exit.')
+def replica_heartbeat_command(interval, once):
+    """Keep the heartbeat that replica lag is measured by current on the primary."""
+    while True:
+        with db.engine.begin() as connection:
+            replicas.beat(connection)
+        if once:
+            return
+        time.sleep(interval)
+
+@click.command('replica-status')
+def replica_status_command():
+    """Show each read replica's lag and whether reads would use it."""
+    pool = current_app.extensions.get('replicas')
+    if not pool:
+        click.echo("No replicas configured (DATABASE_REPLICA_URLS).")
+        return
+    for key, lag in pool.lags().items():
+        if lag is None:
+            click.echo(f"{key}: lag unknown, not used")
+        else:
+            state = 'used' if lag <= pool.max_lag else 'not used'
+            click.echo(f"{key}: {lag:.1f}s behind, {state} (tolerance {pool.max_lag:g}s)")
+
+@click.command('rollup-analytics')
+@click.option('--full', is_flag=True, help='Recompute every day instead of what changed.')
+@click.option('--interval', type=float, default=None,
+              help='Keep running, rolling up every this many seconds.')
+def rollup_analytics_command(full, interval):
+    """Bring the analytics rollup tables up to date."""
+    while True:
+        days = analytics.rollup(full=full)
+        click.echo(f"Rolled up {days} day(s).")
+        if interval is None:
+            return
+        full = False
+        time.sleep(interval)
+
+def init_app(app):
+    app.cli.add_command(db_init_command)
+    app.cli.add_command(db_migrate_command)
+    app.cli.add_command(import_roster_command)
+    app.cli.add_command(rebuild_counters_command)
+    app.cli.add_command(archive_queries_command)
+    app.cli.add_command(replica_heartbeat_command)
+    app.cli.add_command(replica_status_command)
+    app.cli.add_command(rollup_analytics_command)
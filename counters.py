@@ -0,0 +1,121 @@
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import case, func, literal, select, text
+
+from app import db
+from enrollment import dialect_insert
+from models import Query, QueryCounter
+
+# Dashboard aggregates maintained incrementally: submit_query and
+# respond_query bump the student's, teacher's and subject's rows in the same
+# transaction as their write, so dashboards read a primary-key lookup instead
+# of running COUNT(*) over `queries`. `flask rebuild-counters` recomputes
+# them from scratch to repair drift (e.g. after bulk loads).
+#
+# Each row's updated_at doubles as the version of the pages built from that
+# scope's queries (see http_cache.py), so every write to a query bumps its
+# rows, even when no total changes.
+
+SCOPES = {
+    'student': Query.student_id,
+    'teacher': Query.teacher_id,
+    'subject': Query.subject_id,
+}
+
+Counts = namedtuple('Counts', 'pending answered')
+ZERO = Counts(0, 0)
+
+def status_deltas(old_status, new_status):
+    # (pending, answered) change when a query moves between statuses
+    return ((new_status == 'pending') - (old_status == 'pending'),
+            (new_status == 'answered') - (old_status == 'answered'))
+
+def bump_many(changes):
+    # changes: [(query, pending, answered)], where each query only needs its
+    # owner ids. Deltas are summed per counter row so any number of queries
+    # is one statement, and rows are written in sorted order so concurrent
+    # bumps cannot deadlock. Rows with no net change still get a new version.
+    totals = {}
+    for query, pending, answered in changes:
+        for scope, column in SCOPES.items():
+            key = (scope, getattr(query, column.key))
+            total = totals.get(key, ZERO)
+            totals[key] = Counts(total.pending + pending, total.answered + answered)
+    if not totals:
+        return
+    now = datetime.utcnow()
+    rows = [dict(scope=scope, scope_id=scope_id, pending=total.pending,
+                 answered=total.answered, updated_at=now)
+            for (scope, scope_id), total in sorted(totals.items())]
+    statement = dialect_insert(QueryCounter.__table__).values(rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=['scope', 'scope_id'],
+        set_={
+            'pending': QueryCounter.pending + statement.excluded.pending,
+            'answered': QueryCounter.answered + statement.excluded.answered,
+            'updated_at': statement.excluded.updated_at,
+        }
+    )
+    db.session.execute(statement)
+
+def bump(query, pending=0, answered=0):
+    bump_many([(query, pending, answered)])
+
+def query_submitted(query):
+    bump(query, pending=1)
+
+def status_changed(query, new_status):
+    # Call before setting query.status; an unchanged status (e.g. an edited
+    # reply) still gives the pages a new version
+    bump(query, *status_deltas(query.status, new_status))
+
+def counts_for(scope, ids):
+    # {id: Counts} for every id, zero for ids without a row
+    ids = list(ids)
+    counts = dict.fromkeys(ids, ZERO)
+    if ids:
+        rows = db.session.execute(
+            select(QueryCounter.scope_id, QueryCounter.pending, QueryCounter.answered)
+            .where(QueryCounter.scope == scope, QueryCounter.scope_id.in_(ids))
+        )
+        counts.update({scope_id: Counts(pending, answered) for scope_id, pending, answered in rows})
+    return counts
+
+def aggregate_statements(connection):
+    # One SELECT per scope computing the counters from the queries directly,
+    # archived ones included
+    import archive
+    source = archive.all_queries(connection)
+    return [
+        select(literal(scope).label('scope'), source.c[column.key].label('scope_id'),
+               func.sum(case((source.c.status == 'pending', 1), else_=0)).label('pending'),
+               func.sum(case((source.c.status == 'answered', 1), else_=0)).label('answered'))
+        .group_by(source.c[column.key])
+        for scope, column in SCOPES.items()
+    ]
+
+def rebuild(connection):
+    # Recomputes every counter in one transaction on `connection`
+    if connection.dialect.name == 'postgresql':
+        # Writers wait for the rebuild instead of bumping rows it replaces
+        connection.execute(text('LOCK TABLE query_counters IN EXCLUSIVE MODE'))
+    connection.execute(QueryCounter.__table__.delete())
+    for statement in aggregate_statements(connection):
+        connection.execute(QueryCounter.__table__.insert().from_select(
+            ['scope', 'scope_id', 'pending', 'answered'], statement
+        ))
+    connection.execute(QueryCounter.__table__.update().values(updated_at=datetime.utcnow()))
+
+def check(connection):
+    # Returns [(scope, scope_id, stored Counts, actual Counts)] for drifted rows
+    stored = {(scope, scope_id): Counts(pending, answered)
+              for scope, scope_id, pending, answered in connection.execute(
+                  select(QueryCounter.scope, QueryCounter.scope_id,
+                         QueryCounter.pending, QueryCounter.answered))}
+    actual = {(scope, scope_id): Counts(pending, answered)
+              for statement in aggregate_statements(connection)
+              for scope, scope_id, pending, answered in connection.execute(statement)}
+    return [(scope, scope_id, stored.get((scope, scope_id), ZERO), actual.get((scope, scope_id), ZERO))
+            for scope, scope_id in sorted(set(stored) | set(actual))
+            if stored.get((scope, scope_id), ZERO) != actual.get((scope, scope_id), ZERO)]
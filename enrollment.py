@@ -0,0 +1,62 @@
+from sqlalchemy import select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app import db
+from models import Subject, StudentSubject, TeacherSubject
+
+# Find-or-create and enrollment as INSERT ... ON CONFLICT statements, so that
+# concurrent registrations can neither race nor create duplicate subjects.
+# Each function is one or two statements however many subjects are passed in.
+
+def dialect_insert(table):
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(table)
+    if dialect == 'sqlite':
+        return sqlite.insert(table)
+    raise NotImplementedError(f"Upserts are not supported on {dialect}")
+
+def upsert_subjects(pairs):
+    # Returns {(name, department): subject_id} for every pair, creating the
+    # subjects that do not exist yet
+    pairs = list(dict.fromkeys(pairs))
+    statement = dialect_insert(Subject.__table__).values(
+        [{'name': name, 'department': department} for name, department in pairs]
+    )
+    statement = statement.on_conflict_do_nothing(
+        index_elements=['name', 'department']
+    ).returning(Subject.id, Subject.name, Subject.department)
+    subject_ids = {(name, department): subject_id
+                   for subject_id, name, department in db.session.execute(statement)}
+
+    # RETURNING skips the rows that already existed; read those rather than
+    # rewrite them with a no-op update
+    existing = [pair for pair in pairs if pair not in subject_ids]
+    if existing:
+        subject_ids.update({(name, department): subject_id
+                            for subject_id, name, department in db.session.execute(
+            select(Subject.id, Subject.name, Subject.department)
+            .where(tuple_(Subject.name, Subject.department).in_(existing))
+        )})
+    return subject_ids
+
+def enroll(model, owner_column, owner_id, subject_ids):
+    # Links owner_id to each subject, skipping existing links. Returns the
+    # subject ids that were newly linked.
+    subject_ids = list(dict.fromkeys(subject_ids))
+    table = model.__table__
+    statement = dialect_insert(table).values(
+        [{owner_column: owner_id, 'subject_id': subject_id} for subject_id in subject_ids]
+    ).on_conflict_do_nothing(
+        index_elements=[owner_column, 'subject_id']
+    ).returning(table.c.subject_id)
+
+    return set(db.session.scalars(statement))
+
+def register_student(student_id, pairs):
+    subject_ids = upsert_subjects(pairs)
+    return subject_ids, enroll(StudentSubject, 'student_id', student_id, subject_ids.values())
+
+def assign_teacher(teacher_id, pairs):
+    subject_ids = upsert_subjects(pairs)
+    return subject_ids, enroll(TeacherSubject, 'teacher_id', teacher_id, subject_ids.values())
@@ -0,0 +1,58 @@
+import csv
+import io
+import json
+import zlib
+from datetime import date, datetime
+
+# Streaming encoders for downloadable exports. Each takes an iterable of
+# dicts and yields the encoded text a chunk at a time, so a response built
+# on them never holds more than one chunk of rows.
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+CHUNK_ROWS = 500
+
+def to_json(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+def csv_lines(fieldnames, rows):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fieldnames, extrasaction='ignore')
+    writer.writeheader()
+    for i, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if i % CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def ndjson_lines(rows):
+    chunk = []
+    for row in rows:
+        chunk.append(json.dumps(row, default=to_json) + '\n')
+        if len(chunk) == CHUNK_ROWS:
+            yield ''.join(chunk)
+            chunk = []
+    yield ''.join(chunk)
+
+def encode(format, fieldnames, rows):
+    # Raises ValueError for an unknown format
+    if format == 'csv':
+        return csv_lines(fieldnames, rows)
+    if format == 'ndjson':
+        return ndjson_lines(rows)
+    raise ValueError(f"Unknown export format; use one of: {', '.join(FORMATS)}.")
+
+def gzipped(chunks, level=6):
+    # The encoded chunks as one gzip stream, compressed as they arrive
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk.encode())
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,56 @@
+# Production serving config, picked up automatically by `gunicorn main:app`
+# from the project directory (or pass -c gunicorn.conf.py).
+#
+# The app is preloaded in the master so workers fork with the code already
+# imported. create_app() does no database I/O, and post_fork() drops any pool
+# inherited from the master, so no connection is ever shared across processes.
+#
+# Each worker holds up to DB_POOL_SIZE + DB_MAX_OVERFLOW connections; keep
+# workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) below the server's max_connections.
+import logging
+import multiprocessing
+import os
+
+wsgi_app = "main:app"
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+
+# 'gthread' (default) or 'gevent'; gevent needs the gevent and psycogreen
+# packages installed. Use gevent when many clients keep /api/events open: a
+# gthread worker gives each stream a thread and caps them below `threads`
+# (see notifications.py).
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 100))
+
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") == "1"
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 0))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", 0))
+
+def when_ready(server):
+    per_worker = int(os.environ.get("DB_POOL_SIZE", 5)) + int(os.environ.get("DB_MAX_OVERFLOW", 10))
+    max_connections = os.environ.get("DB_MAX_CONNECTIONS")
+    # The effective count, which -w on the command line can override
+    workers = server.cfg.workers
+    server.log.info(f"Up to {workers * per_worker} database connections "
+                    f"({workers} workers x {per_worker})")
+    if max_connections and workers * per_worker > int(max_connections):
+        server.log.warning(f"Worker pools can exceed DB_MAX_CONNECTIONS={max_connections}")
+
+def post_fork(server, worker):
+    if worker_class == "gevent":
+        try:
+            from psycogreen.gevent import patch_psycopg
+            patch_psycopg()
+        except ImportError:
+            logging.warning("psycogreen is not installed; psycopg2 calls will block the gevent loop")
+
+    # Forget (without closing) connections the master may have opened, so
+    # this worker builds its own pool on first use
+    from app import db
+    from main import app
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
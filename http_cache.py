@@ -0,0 +1,67 @@
+import hashlib
+from datetime import timezone
+
+from flask import Response, request
+from sqlalchemy import and_, func, or_, select
+
+from app import db
+from models import QueryCounter, StudentSubject, TeacherSubject
+
+# Conditional GET for the dashboards and query history pages. A page's
+# version is the user's row version (User.updated_at) plus the newest
+# updated_at of the query counters behind it; every write to a query bumps
+# its student's, teacher's and subject's counter rows in the same
+# transaction (see counters.py). The probe is an index lookup on
+# query_counters, so a matching revalidation is answered with 304 before
+# any queries are loaded or templates rendered.
+#
+# Pages also show other users' names (a student's teacher, a teacher's
+# students); renames by those users don't change the version.
+
+def history_version(user):
+    # Newest write to any of the user's own queries
+    scope = 'student' if user.is_student() else 'teacher'
+    return db.session.scalar(select(QueryCounter.updated_at).where(
+        QueryCounter.scope == scope, QueryCounter.scope_id == user.id
+    ))
+
+def dashboard_version(user):
+    # Dashboards also show totals for each of the user's subjects
+    if user.is_student():
+        scope, subject_ids = 'student', select(StudentSubject.subject_id).where(
+            StudentSubject.student_id == user.id)
+    else:
+        scope, subject_ids = 'teacher', select(TeacherSubject.subject_id).where(
+            TeacherSubject.teacher_id == user.id)
+    return db.session.scalar(select(func.max(QueryCounter.updated_at)).where(or_(
+        and_(QueryCounter.scope == scope, QueryCounter.scope_id == user.id),
+        and_(QueryCounter.scope == 'subject', QueryCounter.scope_id.in_(subject_ids)),
+    )))
+
+def validators(user, changed_at):
+    # (etag, last_modified) of this request's page for `user`
+    parts = [request.endpoint, user.id, user.updated_at, changed_at,
+             request.query_string.decode()]
+    etag = hashlib.sha1('|'.join(map(str, parts)).encode()).hexdigest()
+    last_modified = max((t for t in (user.updated_at, changed_at) if t), default=None)
+    return etag, last_modified
+
+def is_fresh(etag, last_modified):
+    # If-None-Match wins over If-Modified-Since, as in RFC 9110
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if request.if_modified_since and last_modified:
+        return last_modified.replace(microsecond=0, tzinfo=timezone.utc) <= request.if_modified_since
+    return False
+
+def mark(response, etag, last_modified):
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified.replace(tzinfo=timezone.utc)
+    # Per-user pages: browsers may keep them but must revalidate each time
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add('Cookie')
+    return response
+
+def not_modified(etag, last_modified):
+    return mark(Response(status=304), etag, last_modified)
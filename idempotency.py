@@ -0,0 +1,59 @@
+import os
+from datetime import datetime, timedelta
+
+from flask import request
+from sqlalchemy import delete, select
+
+from app import db
+from models import IdempotencyKey, Query
+
+# Idempotent query submission. The submit form carries a fresh key (clients
+# may send an Idempotency-Key header instead) that is stored with the query
+# in the inserting transaction. A POST repeating a key the user already
+# submitted with gets the original result instead of a second query, unless
+# it asks a different question, which is refused; two racing POSTs with the
+# same key collide on the primary key, and the loser rolls back and reports
+# the winner's query.
+#
+#   IDEMPOTENCY_TTL_HOURS  how long a key is remembered (default 24); a
+#                          user's expired keys are dropped on their next
+#                          submission
+
+MAX_KEY_LENGTH = 100
+TTL = timedelta(hours=int(os.environ.get('IDEMPOTENCY_TTL_HOURS', 24)))
+
+def key_from_request():
+    # The client's key, or None if it sent none
+    key = (request.headers.get('Idempotency-Key') or request.form.get('idempotency_key') or '').strip()
+    return key or None
+
+def is_valid(key):
+    return len(key) <= MAX_KEY_LENGTH
+
+def original(user_id, key):
+    # (query_id, subject_id, message) the key submitted, or None; subject
+    # and message are None once the query has been archived
+    return db.session.execute(
+        select(IdempotencyKey.query_id, Query.subject_id, Query.message)
+        .outerjoin(Query, Query.id == IdempotencyKey.query_id)
+        .where(
+            IdempotencyKey.user_id == user_id,
+            IdempotencyKey.key == key,
+            IdempotencyKey.created_at >= datetime.utcnow() - TTL,
+        )
+    ).first()
+
+def same_request(original, subject_id, message):
+    # Whether a repeat asks what the original did; an archived original
+    # can't be compared, so the key decides
+    return original.message is None or (original.subject_id, original.message) == (subject_id, message)
+
+def remember(user_id, key, query_id):
+    # Part of the caller's transaction; raises IntegrityError if a
+    # concurrent request committed the same key first
+    now = datetime.utcnow()
+    db.session.execute(delete(IdempotencyKey).where(
+        IdempotencyKey.user_id == user_id, IdempotencyKey.created_at < now - TTL
+    ))
+    db.session.add(IdempotencyKey(user_id=user_id, key=key, query_id=query_id, created_at=now))
+    db.session.flush()
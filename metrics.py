@@ -0,0 +1,218 @@
+import cProfile
+import os
+import threading
+import time
+from collections import defaultdict
+
+from flask import Response, current_app, g, has_request_context, request, template_rendered, before_render_template
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app import db
+
+# Per-process request metrics in the Prometheus text format. Each gunicorn
+# worker keeps its own registry, so /metrics reports the worker that served
+# the scrape; the `worker` label on every sample tells them apart.
+#
+#   METRICS_TOKEN      if set, /metrics requires "Authorization: Bearer <token>"
+#   PROFILING_ENABLED  set to 1 to allow admins to profile a request by
+#                      sending "X-Profile: 1"; the cProfile dump is written
+#                      to PROFILE_DIR (default: <instance path>/profiles)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+class Histogram:
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self._series = defaultdict(lambda: [[0] * len(self.buckets), 0, 0.0])
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series[key]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += 1
+            series[2] += value
+
+    def render(self, common):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, count, total) in sorted(self._series.items()):
+                labels = dict(key, **common)
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{format_labels(labels, le=bound)} {bucket_count}")
+                lines.append(f"{self.name}_bucket{format_labels(labels, le='+Inf')} {count}")
+                lines.append(f"{self.name}_sum{format_labels(labels)} {total}")
+                lines.append(f"{self.name}_count{format_labels(labels)} {count}")
+        return lines
+
+class Counter:
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._series = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        with self._lock:
+            self._series[tuple(sorted(labels.items()))] += amount
+
+    def render(self, common):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._series.items()):
+                lines.append(f"{self.name}{format_labels(dict(key, **common))} {value}")
+        return lines
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(labels, **extra):
+    labels = {**labels, **extra}
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{escape_label(value)}"' for key, value in labels.items()) + '}'
+
+requests_total = Counter('http_requests_total', 'HTTP requests by endpoint, method and status.')
+request_duration = Histogram('http_request_duration_seconds', 'Request latency by endpoint.')
+statements_per_request = Histogram('db_statements_per_request', 'SQL statements issued per request.',
+                                   buckets=STATEMENT_BUCKETS)
+statement_time_per_request = Histogram('db_statement_seconds_per_request',
+                                       'Time spent executing SQL per request.')
+pool_checkout_wait = Histogram('db_pool_checkout_wait_seconds',
+                               'Time spent waiting for a pooled connection.')
+template_render = Histogram('template_render_duration_seconds', 'Jinja render time by template.')
+rate_limited = Counter('http_rate_limited_total', 'Requests refused by rate limits, by endpoint.')
+
+REGISTRY = [requests_total, request_duration, statements_per_request,
+            statement_time_per_request, pool_checkout_wait, template_render, rate_limited]
+
+def render_metrics():
+    common = {'worker': os.getpid()}
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render(common))
+    return '\n'.join(lines) + '\n'
+
+class RequestStats:
+    __slots__ = ('started', 'statements', 'statement_time', 'template_started', 'profiler')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.statement_time = 0.0
+        self.template_started = None
+        self.profiler = None
+
+def current_stats():
+    return g.get('request_stats') if has_request_context() else None
+
+# SQL statement count and time, via engine events
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = current_stats()
+    if stats is not None and context is not None:
+        stats.statements += 1
+        stats.statement_time += time.perf_counter() - context._metrics_started
+
+def time_pool_checkouts(pool):
+    # The engine calls pool.connect() for every checkout; the pool is
+    # replaced on dispose(), so this is re-applied per pool instance
+    if getattr(pool, '_metrics_timed', False):
+        return
+    connect = pool.connect
+
+    def timed_connect():
+        started = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            pool_checkout_wait.observe(time.perf_counter() - started)
+
+    pool.connect = timed_connect
+    pool._metrics_timed = True
+
+# Template render time, via Flask signals
+
+def on_before_render_template(sender, template, context, **extra):
+    stats = current_stats()
+    if stats is not None:
+        stats.template_started = time.perf_counter()
+
+def on_template_rendered(sender, template, context, **extra):
+    stats = current_stats()
+    if stats is not None and stats.template_started is not None:
+        template_render.observe(time.perf_counter() - stats.template_started,
+                                template=template.name)
+        stats.template_started = None
+
+# Request hooks
+
+def wants_profile():
+    if not current_app.config['PROFILING_ENABLED'] or request.headers.get('X-Profile') != '1':
+        return False
+    from routes import get_current_user
+    user = get_current_user()
+    return user is not None and user.is_admin()
+
+def start_request():
+    for engine in db.engines.values():
+        time_pool_checkouts(engine.pool)
+    g.request_stats = RequestStats()
+    if wants_profile():
+        g.request_stats.profiler = cProfile.Profile()
+        g.request_stats.profiler.enable()
+
+def finish_request(response):
+    stats = current_stats()
+    if stats is None:
+        return response
+    endpoint = request.endpoint or 'unmatched'
+
+    if stats.profiler is not None:
+        stats.profiler.disable()
+        profile_dir = current_app.config['PROFILE_DIR']
+        os.makedirs(profile_dir, exist_ok=True)
+        path = os.path.join(profile_dir, f"{endpoint}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.prof")
+        stats.profiler.dump_stats(path)
+        response.headers['X-Profile-File'] = os.path.basename(path)
+
+    elapsed = time.perf_counter() - stats.started
+    requests_total.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    request_duration.observe(elapsed, endpoint=endpoint)
+    statements_per_request.observe(stats.statements, endpoint=endpoint)
+    statement_time_per_request.observe(stats.statement_time, endpoint=endpoint)
+    return response
+
+def metrics_view():
+    token = current_app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return Response('Forbidden\n', status=403, mimetype='text/plain')
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+def init_app(app):
+    app.config.setdefault('METRICS_TOKEN', os.environ.get('METRICS_TOKEN'))
+    app.config.setdefault('PROFILING_ENABLED', os.environ.get('PROFILING_ENABLED') == '1')
+    app.config.setdefault('PROFILE_DIR', os.environ.get('PROFILE_DIR',
+                                                        os.path.join(app.instance_path, 'profiles')))
+
+    if not event.contains(Engine, 'before_cursor_execute', before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+    before_render_template.connect(on_before_render_template, app)
+    template_rendered.connect(on_template_rendered, app)
+
+    # Registered ahead of the app's own hooks so their time is included
+    app.before_request_funcs.setdefault(None, []).insert(0, start_request)
+    app.after_request(finish_request)
+    app.add_url_rule('/metrics', view_func=metrics_view)
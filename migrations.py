@@ -0,0 +1,220 @@
+import logging
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, inspect, select, text
+from sqlalchemy.schema import CreateTable
+
+from app import db
+
+logger = logging.getLogger(__name__)
+
+# Applied versions are recorded here, outside the models' metadata
+schema_migrations = Table(
+    'schema_migrations', MetaData(),
+    Column('version', Integer, primary_key=True),
+    Column('description', String(200), nullable=False),
+    Column('applied_at', DateTime, default=datetime.utcnow, nullable=False),
+)
+
+# (version, description, function) in the order they were written. Every
+# migration must be safe to run against a database that already has its
+# changes, because migration 1 creates fresh databases from the current
+# models and databases created by the old db.create_all() have no history.
+MIGRATIONS = []
+
+def migration(version, description):
+    def decorator(f):
+        MIGRATIONS.append((version, description, f))
+        return f
+    return decorator
+
+def existing_indexes(connection, table_name):
+    return {index['name']: index for index in inspect(connection).get_indexes(table_name)}
+
+def existing_columns(connection, table_name):
+    return {column['name'] for column in inspect(connection).get_columns(table_name)}
+
+def create_indexes(connection, table, names):
+    existing = existing_indexes(connection, table.name)
+    for index in table.indexes:
+        if index.name in names and index.name not in existing:
+            index.create(connection)
+
+@migration(1, 'create base tables')
+def create_base_tables(connection):
+    import models  # noqa: F401
+    db.metadata.create_all(connection)
+
+@migration(2, 'add indexes for query list and subject lookup filters')
+def add_query_indexes(connection):
+    from models import Query, Subject
+    create_indexes(connection, Query.__table__, {
+        'ix_queries_student_created',
+        'ix_queries_teacher_created',
+        'ix_queries_teacher_status_created',
+        'ix_queries_teacher_pending',
+    })
+    # Spelled out because the model's version of this index became unique in
+    # migration 3, which has to merge duplicates first
+    if 'ix_subjects_name_department' not in existing_indexes(connection, 'subjects'):
+        connection.execute(text(
+            'CREATE INDEX ix_subjects_name_department ON subjects (name, department)'
+        ))
+
+@migration(3, 'merge duplicate subjects and make (name, department) unique')
+def unique_subjects(connection):
+    from models import Subject, StudentSubject, TeacherSubject, Query
+    index = existing_indexes(connection, 'subjects').get('ix_subjects_name_department')
+    if index and index['unique']:
+        return
+
+    duplicates = connection.execute(
+        select(Subject.name, Subject.department, func.min(Subject.id))
+        .group_by(Subject.name, Subject.department)
+        .having(func.count() > 1)
+    ).all()
+    for name, department, keep_id in duplicates:
+        duplicate_ids = connection.scalars(select(Subject.id).where(
+            Subject.name == name, Subject.department == department, Subject.id != keep_id
+        )).all()
+
+        # Move enrollments onto the surviving subject, keeping one link per
+        # student or teacher across the whole group
+        for model, owner in ((StudentSubject, StudentSubject.student_id),
+                             (TeacherSubject, TeacherSubject.teacher_id)):
+            linked, redundant = set(), []
+            rows = connection.execute(
+                select(model.id, owner).where(model.subject_id.in_([keep_id] + duplicate_ids))
+                .order_by(model.subject_id != keep_id, model.id)
+            )
+            for link_id, owner_id in rows:
+                if owner_id in linked:
+                    redundant.append(link_id)
+                linked.add(owner_id)
+            if redundant:
+                connection.execute(model.__table__.delete().where(model.id.in_(redundant)))
+            connection.execute(model.__table__.update().where(
+                model.subject_id.in_(duplicate_ids)
+            ).values(subject_id=keep_id))
+
+        connection.execute(Query.__table__.update().where(
+            Query.subject_id.in_(duplicate_ids)
+        ).values(subject_id=keep_id))
+        connection.execute(Subject.__table__.delete().where(Subject.id.in_(duplicate_ids)))
+
+    if index:
+        connection.execute(text('DROP INDEX ix_subjects_name_department'))
+    create_indexes(connection, Subject.__table__, {'ix_subjects_name_department'})
+
+@migration(4, 'add query_counters and backfill them')
+def add_query_counters(connection):
+    import counters
+    from models import QueryCounter
+    QueryCounter.__table__.create(connection, checkfirst=True)
+    counters.rebuild(connection)
+
+@migration(5, 'add row versions to users and query_counters')
+def add_row_versions(connection):
+    from models import User, QueryCounter
+    now = datetime.utcnow()
+    if 'updated_at' not in existing_columns(connection, 'users'):
+        connection.execute(text('ALTER TABLE users ADD COLUMN updated_at TIMESTAMP'))
+        connection.execute(User.__table__.update().values(updated_at=User.created_at))
+    if 'updated_at' not in existing_columns(connection, 'query_counters'):
+        connection.execute(text('ALTER TABLE query_counters ADD COLUMN updated_at TIMESTAMP'))
+        connection.execute(QueryCounter.__table__.update().values(updated_at=now))
+
+@migration(6, 'add full-text search over query messages and replies')
+def add_query_search(connection):
+    import search
+    search.create_index(connection)
+
+@migration(7, 'add index for reading a subject\'s answered queries')
+def add_subject_answers_index(connection):
+    from models import Query
+    create_indexes(connection, Query.__table__, {'ix_queries_subject_status_updated'})
+
+@migration(8, 'add queries_archive for finished queries past retention')
+def add_queries_archive(connection):
+    import archive
+    from models import Query
+    create_indexes(connection, Query.__table__, {'ix_queries_created'})
+    archive.create_table(connection)
+
+@migration(9, 'add replica_heartbeat for measuring read replica lag')
+def add_replica_heartbeat(connection):
+    import replicas
+    replicas.create_heartbeat(connection)
+
+@migration(10, 'add analytics rollup tables')
+def add_analytics_rollups(connection):
+    import analytics
+    import archive
+    from models import Query
+    create_indexes(connection, Query.__table__, {'ix_queries_updated'})
+    create_indexes(connection, archive.queries_archive, {'ix_queries_archive_created'})
+    analytics.create_tables(connection)
+
+@migration(11, 'add idempotency_keys for repeated query submissions')
+def add_idempotency_keys(connection):
+    from models import IdempotencyKey
+    IdempotencyKey.__table__.create(connection, checkfirst=True)
+
+@migration(12, 'keep SQLite query ids unique once queries are archived')
+def autoincrement_query_ids(connection):
+    # Without AUTOINCREMENT SQLite reuses the ids of the newest rows once
+    # they are deleted, which archiving does; a reused id collides with its
+    # archived namesake. PostgreSQL sequences never go back.
+    if connection.dialect.name != 'sqlite':
+        return
+    import archive
+    import search
+    from models import Query, Subject, User
+    table_sql = connection.scalar(text(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'queries'"
+    ))
+    if 'AUTOINCREMENT' not in table_sql.upper():
+        # SQLite can't alter a column, so copy into a rebuilt table; dropping
+        # the old one drops its indexes and search triggers too
+        metadata = MetaData()
+        for table in (User.__table__, Subject.__table__):
+            table.to_metadata(metadata)
+        connection.execute(CreateTable(Query.__table__.to_metadata(metadata, name='queries_rebuild')))
+        columns = ', '.join(column.name for column in Query.__table__.columns)
+        connection.execute(text(f'INSERT INTO queries_rebuild ({columns}) SELECT {columns} FROM queries'))
+        connection.execute(text('DROP TABLE queries'))
+        connection.execute(text('ALTER TABLE queries_rebuild RENAME TO queries'))
+        for index in Query.__table__.indexes:
+            index.create(connection)
+        search.create_index(connection)
+
+    # New ids start past every id already handed out, archived ones included
+    highest = max(connection.scalar(select(func.max(Query.id))) or 0,
+                  connection.scalar(select(func.max(archive.queries_archive.c.id))) or 0)
+    if not connection.execute(text("UPDATE sqlite_sequence SET seq = max(seq, :highest) "
+                                   "WHERE name = 'queries'"), {'highest': highest}).rowcount:
+        connection.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES ('queries', :highest)"),
+                           {'highest': highest})
+
+def applied_versions(engine):
+    schema_migrations.create(engine, checkfirst=True)
+    with engine.connect() as connection:
+        return set(connection.scalars(select(schema_migrations.c.version)))
+
+def upgrade(engine, target=None):
+    # Apply pending migrations up to target (default: latest), each in its
+    # own transaction. Returns the versions that were applied.
+    applied = applied_versions(engine)
+    newly_applied = []
+
+    for version, description, apply in sorted(MIGRATIONS, key=lambda m: m[0]):
+        if version in applied or (target is not None and version > target):
+            continue
+        with engine.begin() as connection:
+            apply(connection)
+            connection.execute(schema_migrations.insert().values(
+                version=version, description=description
+            ))
+        logger.info(f"Applied migration {version}: {description}")
+        newly_applied.append(version)
+
+    return newly_applied
@@ -1,6 +1,7 @@
 from datetime import datetime
+from flask import current_app
 from app import db
-from werkzeug.security import generate_password_hash, check_password_hash
+import passwords
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -13,6 +14,9 @@ class User(db.Model):
     department = db.Column(db.String(100), nullable=False)
     roll_no = db.Column(db.String(50), nullable=True)  # Only for students
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Row version for conditional GET: any change to the user, including
+    # their subject list (see touch()), moves it forward
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
     student_subjects = db.relationship('StudentSubject', backref='student', lazy=True, cascade='all, delete-orphan')
@@ -21,16 +25,26 @@ class User(db.Model):
     received_queries = db.relationship('Query', foreign_keys='Query.teacher_id', backref='teacher', lazy=True)
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = passwords.hash_password(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return passwords.verify_password(self.password_hash, password)
+    
+    def password_needs_rehash(self):
+        return passwords.needs_rehash(self.password_hash)
+    
+    def touch(self):
+        # For changes the row itself doesn't see, e.g. enrollments
+        self.updated_at = datetime.utcnow()
     
     def is_student(self):
         return self.role == 'student'
     
     def is_teacher(self):
         return self.role == 'teacher'
+    
+    def is_admin(self):
+        return self.email.lower() in current_app.config['ADMIN_EMAILS']
 
 class Subject(db.Model):
     __tablename__ = 'subjects'
@@ -43,6 +57,10 @@ class Subject(db.Model):
     student_subjects = db.relationship('StudentSubject', backref='subject', lazy=True, cascade='all, delete-orphan')
     teacher_subjects = db.relationship('TeacherSubject', backref='subject', lazy=True, cascade='all, delete-orphan')
     queries = db.relationship('Query', backref='subject', lazy=True)
+    
+    # Subjects are identified by name and department; the unique index is
+    # also the conflict target of the find-or-create upsert
+    __table_args__ = (db.Index('ix_subjects_name_department', 'name', 'department', unique=True),)
 
 class StudentSubject(db.Model):
     __tablename__ = 'student_subjects'
@@ -64,6 +82,9 @@ class TeacherSubject(db.Model):
     
     __table_args__ = (db.UniqueConstraint('teacher_id', 'subject_id', name='unique_teacher_subject'),)
 
+# Closed queries were dismissed by their teacher without an answer
+QUERY_STATUSES = ('pending', 'answered', 'closed')
+
 class Query(db.Model):
     __tablename__ = 'queries'
     
@@ -73,12 +94,58 @@ class Query(db.Model):
     subject_id = db.Column(db.Integer, db.ForeignKey('subjects.id'), nullable=False)
     message = db.Column(db.Text, nullable=False)
     reply = db.Column(db.Text, nullable=True)
-    status = db.Column(db.String(20), default='pending', nullable=False)  # 'pending' or 'answered'
+    status = db.Column(db.String(20), default='pending', nullable=False)  # 'pending', 'answered' or 'closed'
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Every list page filters on one owner column and pages by (created_at, id);
+    # the partial index keeps the teacher dashboard's pending queue small.
+    # Duplicate suggestions read a subject's answers, newest last, and
+    # archiving reads the oldest rows first.
+    __table_args__ = (
+        db.Index('ix_queries_student_created', 'student_id', 'created_at', 'id'),
+        db.Index('ix_queries_teacher_created', 'teacher_id', 'created_at', 'id'),
+        db.Index('ix_queries_teacher_status_created', 'teacher_id', 'status', 'created_at', 'id'),
+        db.Index('ix_queries_teacher_pending', 'teacher_id', 'created_at',
+                 postgresql_where=db.text("status = 'pending'"),
+                 sqlite_where=db.text("status = 'pending'")),
+        db.Index('ix_queries_subject_status_updated', 'subject_id', 'status', 'updated_at'),
+        db.Index('ix_queries_created', 'created_at'),
+        # Where the analytics rollup finds what changed since its last run
+        db.Index('ix_queries_updated', 'updated_at'),
+        # Archiving moves the newest ids out too; SQLite would hand them out
+        # again without AUTOINCREMENT (see migration 12)
+        {'sqlite_autoincrement': True},
+    )
+    
     def is_pending(self):
         return self.status == 'pending'
     
     def is_answered(self):
         return self.status == 'answered'
+    
+    def is_closed(self):
+        return self.status == 'closed'
+
+class QueryCounter(db.Model):
+    __tablename__ = 'query_counters'
+    
+    # Pending/answered totals per student, teacher and subject, kept in step
+    # with `queries` by the write paths (see counters.py)
+    scope = db.Column(db.String(20), primary_key=True)  # 'student', 'teacher' or 'subject'
+    scope_id = db.Column(db.Integer, primary_key=True)
+    pending = db.Column(db.Integer, default=0, nullable=False)
+    answered = db.Column(db.Integer, default=0, nullable=False)
+    # Time of the last write that touched this scope's queries
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class IdempotencyKey(db.Model):
+    __tablename__ = 'idempotency_keys'
+    
+    # Keys clients send with a submission, so a repeated POST finds the query
+    # the first one created instead of inserting another (see idempotency.py).
+    # query_id has no foreign key because queries move to the archive.
+    user_id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(100), primary_key=True)
+    query_id = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
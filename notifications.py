@@ -0,0 +1,194 @@
+import json
+import logging
+import os
+import queue
+import select
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from app import db
+
+logger = logging.getLogger(__name__)
+
+# Push notifications for new queries and replies. Write paths publish a
+# small delta event; each worker delivers it to the involved student's and
+# teacher's open /api/events streams (Server-Sent Events).
+#
+# With NOTIFICATIONS_BACKEND=postgres (the default on PostgreSQL) events go
+# through NOTIFY inside the writing transaction, so they are only delivered
+# if it commits, and reach every worker through one LISTEN connection per
+# process. The 'local' backend (default elsewhere, e.g. SQLite) hands events
+# to subscribers in the same process after commit.
+#
+# Each open stream occupies a worker thread; serve it with gevent workers
+# (GUNICORN_WORKER_CLASS=gevent) when many clients stay connected. Elsewhere
+# a worker holds at most NOTIFICATIONS_MAX_STREAMS streams (default one less
+# than its GUNICORN_THREADS, so a thread is always left for ordinary
+# requests) and answers further ones with 503; clients then poll
+# /api/queries instead. Under gevent the default is no limit; 0 also means
+# no limit.
+
+CHANNEL = 'query_events'
+QUEUE_SIZE = 100
+KEEPALIVE_SECONDS = 15
+# Threads per gthread worker, as gunicorn.conf.py reads them
+WORKER_THREADS = int(os.environ.get('GUNICORN_THREADS', 4))
+
+_subscribers = {}
+_lock = threading.Lock()
+_listener = {'pid': None}
+_streams = {'open': 0}
+
+def subscribe(user_id):
+    stream = queue.Queue(maxsize=QUEUE_SIZE)
+    with _lock:
+        _subscribers.setdefault(user_id, set()).add(stream)
+    return stream
+
+def unsubscribe(user_id, stream):
+    with _lock:
+        streams = _subscribers.get(user_id)
+        if streams:
+            streams.discard(stream)
+            if not streams:
+                del _subscribers[user_id]
+
+def dispatch(payload):
+    # Delivers an event to this process's subscribers. A stream that has
+    # fallen QUEUE_SIZE events behind misses events rather than blocking the
+    # publisher; the client resyncs from /api/queries on reconnect.
+    with _lock:
+        streams = [stream for user_id in {payload['student_id'], payload['teacher_id']}
+                   for stream in _subscribers.get(user_id, ())]
+    for stream in streams:
+        try:
+            stream.put_nowait(payload)
+        except queue.Full:
+            pass
+
+def backend():
+    return current_app.config['NOTIFICATIONS_BACKEND']
+
+def payload_for(kind, query):
+    return {
+        'type': kind,
+        'query_id': query.id,
+        'student_id': query.student_id,
+        'teacher_id': query.teacher_id,
+        'subject_id': query.subject_id,
+        'status': query.status,
+    }
+
+def publish(kind, query):
+    # Call inside the transaction that writes `query`, after a flush
+    publish_many(kind, [query])
+
+def publish_many(kind, queries):
+    # One statement however many queries changed; `queries` only need the
+    # attributes in payload_for
+    payloads = [payload_for(kind, query) for query in queries]
+    if not payloads:
+        return
+    if backend() == 'postgres':
+        db.session.execute(
+            text('SELECT pg_notify(:channel, payload) FROM unnest(CAST(:payloads AS text[])) AS payload'),
+            {'channel': CHANNEL, 'payloads': [json.dumps(payload) for payload in payloads]}
+        )
+    else:
+        db.session.info.setdefault('pending_events', []).extend(payloads)
+
+def after_commit(session):
+    for payload in session.info.pop('pending_events', []):
+        dispatch(payload)
+
+def after_rollback(session):
+    session.info.pop('pending_events', None)
+
+def listen(engine):
+    # Runs in a daemon thread per process: relays NOTIFY payloads to dispatch()
+    while True:
+        raw = None
+        try:
+            connection = engine.raw_connection()
+            connection.detach()
+            raw = connection.driver_connection
+            raw.autocommit = True
+            with raw.cursor() as cursor:
+                cursor.execute(f'LISTEN {CHANNEL}')
+            while True:
+                if select.select([raw], [], [], KEEPALIVE_SECONDS) == ([], [], []):
+                    continue
+                raw.poll()
+                while raw.notifies:
+                    dispatch(json.loads(raw.notifies.pop(0).payload))
+        except Exception as e:
+            logger.warning(f"Notification listener error, reconnecting: {e}")
+            if raw is not None:
+                try:
+                    raw.close()
+                except Exception:
+                    pass
+            time.sleep(1)
+
+def ensure_listener():
+    # Started lazily by the first stream in each (possibly forked) process
+    if backend() != 'postgres':
+        return
+    with _lock:
+        if _listener['pid'] == os.getpid():
+            return
+        _listener['pid'] = os.getpid()
+    threading.Thread(target=listen, args=(db.engine,), name='notification-listener',
+                     daemon=True).start()
+
+def running_on_gevent():
+    # Checked per request: gunicorn's gevent workers patch after forking
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('threading')
+
+def open_stream():
+    # Reserves one of this worker's stream slots; False if none is free.
+    # Pair with close_stream().
+    limit = current_app.config['NOTIFICATIONS_MAX_STREAMS']
+    if limit is None:
+        limit = 0 if running_on_gevent() else max(WORKER_THREADS - 1, 1)
+    with _lock:
+        if limit and _streams['open'] >= limit:
+            return False
+        _streams['open'] += 1
+    return True
+
+def close_stream():
+    with _lock:
+        _streams['open'] -= 1
+
+def stream_events(user_id):
+    # Generator of SSE frames for one user's stream; needs no app context
+    stream = subscribe(user_id)
+    try:
+        yield 'retry: 5000\n\n'
+        while True:
+            try:
+                payload = stream.get(timeout=KEEPALIVE_SECONDS)
+            except queue.Empty:
+                yield ': keepalive\n\n'
+                continue
+            yield f"event: {payload['type']}\ndata: {json.dumps(payload)}\n\n"
+    finally:
+        unsubscribe(user_id, stream)
+
+def init_app(app):
+    default = 'postgres' if app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgresql') else 'local'
+    app.config.setdefault('NOTIFICATIONS_BACKEND', os.environ.get('NOTIFICATIONS_BACKEND', default))
+    max_streams = os.environ.get('NOTIFICATIONS_MAX_STREAMS')
+    app.config.setdefault('NOTIFICATIONS_MAX_STREAMS', int(max_streams) if max_streams else None)
+    if not event.contains(Session, 'after_commit', after_commit):
+        event.listen(Session, 'after_commit', after_commit)
+        event.listen(Session, 'after_rollback', after_rollback)
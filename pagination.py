@@ -0,0 +1,60 @@
+import base64
+from datetime import datetime
+from sqlalchemy import and_, or_
+from models import Query, QUERY_STATUSES
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# Cursors point at the last row of the previous page as "created_at|id".
+# Ordering on (created_at, id) keeps pages stable when several queries share
+# a timestamp, and each page is a range scan no matter how deep it is.
+
+def encode_cursor(query):
+    raw = f"{query.created_at.isoformat()}|{query.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, query_id = base64.urlsafe_b64decode(padded).decode().split('|')
+        return datetime.fromisoformat(created_at), int(query_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('Invalid cursor.')
+
+def clamp_page_size(per_page):
+    if not per_page or per_page < 1:
+        return DEFAULT_PAGE_SIZE
+    return min(per_page, MAX_PAGE_SIZE)
+
+# `model` is Query or an alias of it (e.g. over the archive, see archive.py)
+
+def filter_queries(base, status=None, subject_id=None, model=Query):
+    if status:
+        if status not in QUERY_STATUSES:
+            raise ValueError('Invalid status filter.')
+        base = base.filter(model.status == status)
+    if subject_id:
+        base = base.filter(model.subject_id == subject_id)
+    return base
+
+def paginate_queries(base, cursor=None, per_page=DEFAULT_PAGE_SIZE, model=Query):
+    # Returns (rows, next_cursor); next_cursor is None on the last page
+    per_page = clamp_page_size(per_page)
+    page = base.order_by(model.created_at.desc(), model.id.desc())
+
+    if cursor:
+        created_at, query_id = cursor
+        page = page.filter(or_(
+            model.created_at < created_at,
+            and_(model.created_at == created_at, model.id < query_id)
+        ))
+
+    # Fetch one extra row to learn whether another page exists
+    rows = page.limit(per_page + 1).all()
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        return rows, encode_cursor(rows[-1])
+    return rows, None
@@ -0,0 +1,80 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# Password hashing is CPU-bound, so it runs in a small per-process thread
+# pool (hashlib's scrypt and pbkdf2 release the GIL) instead of on every
+# request thread at once. When all workers and queue slots are taken for
+# PASSWORD_HASH_TIMEOUT seconds, callers get PasswordHashingBusy rather than
+# piling up behind a login burst.
+#
+#   PASSWORD_HASH_METHOD   Werkzeug method string, e.g. 'scrypt:32768:8:1'
+#                          (the default) or 'pbkdf2:sha256:600000'
+#   PASSWORD_HASH_WORKERS  concurrent hashes per process (default: CPUs)
+#   PASSWORD_HASH_QUEUE    extra callers allowed to wait (default: 4 x workers)
+#   PASSWORD_HASH_TIMEOUT  seconds to wait for a slot (default: 5)
+
+class PasswordHashingBusy(Exception):
+    pass
+
+def hash_method():
+    return os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+
+@lru_cache(maxsize=None)
+def canonical_method(method):
+    # Werkzeug fills in defaults ('scrypt' -> 'scrypt:32768:8:1'), so compare
+    # stored hashes against the prefix it actually writes
+    return generate_password_hash('', method=method).split('$', 1)[0]
+
+def make_hash(password):
+    # Synchronous; used directly by the roster import's worker processes
+    return generate_password_hash(password, method=hash_method())
+
+def needs_rehash(password_hash):
+    return password_hash.split('$', 1)[0] != canonical_method(hash_method())
+
+class HashingPool:
+    def __init__(self, workers, queue_size, timeout):
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def executor(self):
+        # Created lazily and re-created after a fork, since worker threads
+        # do not survive into a gunicorn worker forked from a preloaded master
+        with self._lock:
+            if self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                    thread_name_prefix='password-hash')
+                self._pid = os.getpid()
+            return self._executor
+
+    def run(self, fn, *args):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PasswordHashingBusy()
+        try:
+            future = self.executor().submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result()
+
+_workers = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+pool = HashingPool(
+    workers=_workers,
+    queue_size=int(os.environ.get('PASSWORD_HASH_QUEUE', 4 * _workers)),
+    timeout=float(os.environ.get('PASSWORD_HASH_TIMEOUT', 5)),
+)
+
+def hash_password(password):
+    return pool.run(make_hash, password)
+
+def verify_password(password_hash, password):
+    return pool.run(check_password_hash, password_hash, password)
@@ -0,0 +1,189 @@
+import importlib
+import math
+import os
+import threading
+import time
+from collections import namedtuple
+
+from flask import Response, current_app, jsonify, request
+
+import metrics
+
+# Token-bucket rate limits on the write endpoints and a few costly reads.
+# Each bucket holds up to `burst` tokens and refills at `per_minute` a
+# minute; a request spends one and is refused with 429 and Retry-After when
+# none is left. Buckets are keyed by endpoint and the logged-in user. Before
+# login they are keyed by the client IP and the email in the form, so
+# everyone behind one campus NAT address doesn't share a bucket; a looser
+# IP_LIMITS bucket per address caps what one client can try across emails.
+#
+#   RATE_LIMIT_ENABLED    set to 0 to turn limiting off
+#   RATE_LIMIT_BACKEND    'memory' (default): buckets per worker process,
+#                         so each of N workers allows the full rate;
+#                         'redis': one set of buckets shared by every worker
+#                         in RATE_LIMIT_REDIS_URL (needs the redis package);
+#                         'module:factory': factory(app) returns any object
+#                         with take(buckets) as below, e.g. a stand-in for
+#                         a shared store in local runs
+
+# methods: the HTTP methods limited; None means the ones that write
+Limit = namedtuple('Limit', 'per_minute burst methods', defaults=(None,))
+
+LIMITS = {
+    'login': Limit(10, 10),
+    'register': Limit(5, 5),
+    'submit_query': Limit(6, 10),
+    'respond_query': Limit(60, 30),
+    'api_triage_queries': Limit(20, 10),
+    # Lookups can load a subject's whole suggestion index
+    'api_subject_suggestions': Limit(60, 20, ('GET',)),
+}
+# Per endpoint and client IP, on top of LIMITS, for the endpoints used
+# before login
+IP_LIMITS = {
+    'login': Limit(100, 50),
+    'register': Limit(30, 20),
+}
+MAX_MEMORY_KEYS = 100000
+
+class MemoryBackend:
+    def __init__(self, max_keys=MAX_MEMORY_KEYS):
+        self.max_keys = max_keys
+        self._buckets = {}  # key -> (tokens, monotonic time, rate, burst)
+        self._lock = threading.Lock()
+
+    def take(self, buckets):
+        # buckets: [(key, rate, burst)], rate in tokens per second. Spends a
+        # token from each only if every one has one, so a bucket that refuses
+        # doesn't drain the others. Returns (allowed, seconds until the
+        # emptiest one has a token).
+        now = time.monotonic()
+        with self._lock:
+            levels = []
+            for key, rate, burst in buckets:
+                tokens, updated, _, _ = self._buckets.get(key, (burst, now, rate, burst))
+                levels.append(min(burst, tokens + (now - updated) * rate))
+            allowed = all(tokens >= 1 for tokens in levels)
+            for (key, rate, burst), tokens in zip(buckets, levels):
+                if len(self._buckets) >= self.max_keys and key not in self._buckets:
+                    self.prune(now)
+                self._buckets[key] = (tokens - 1 if allowed else tokens, now, rate, burst)
+        if allowed:
+            return True, 0
+        return False, max((1 - tokens) / rate for (_, rate, _), tokens in zip(buckets, levels)
+                          if tokens < 1)
+
+    def prune(self, now):
+        # Drops buckets that have refilled, which are the same as missing
+        # ones, or else the older half; caller holds the lock
+        full = [key for key, (tokens, updated, rate, burst) in self._buckets.items()
+                if tokens + (now - updated) * rate >= burst]
+        for key in full or list(self._buckets)[:len(self._buckets) // 2]:
+            del self._buckets[key]
+
+# Same algorithm as MemoryBackend, atomic on the Redis server and on its
+# clock; ARGV holds each key's rate and burst in turn. A bucket expires once
+# it would be full again.
+REDIS_TAKE = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local levels, allowed, wait = {}, 1, 0
+for i, key in ipairs(KEYS) do
+    local rate, burst = tonumber(ARGV[2 * i - 1]), tonumber(ARGV[2 * i])
+    local bucket = redis.call('HMGET', key, 'tokens', 'updated')
+    local tokens = tonumber(bucket[1]) or burst
+    local updated = tonumber(bucket[2]) or now
+    tokens = math.min(burst, tokens + (now - updated) * rate)
+    if tokens < 1 then
+        allowed = 0
+        wait = math.max(wait, (1 - tokens) / rate)
+    end
+    levels[i] = tokens
+end
+for i, key in ipairs(KEYS) do
+    local rate, burst = tonumber(ARGV[2 * i - 1]), tonumber(ARGV[2 * i])
+    local tokens = levels[i] - allowed
+    redis.call('HSET', key, 'tokens', tostring(tokens), 'updated', tostring(now))
+    redis.call('PEXPIRE', key, math.ceil((burst - tokens) / rate * 1000) + 1000)
+end
+return {allowed, tostring(wait)}
+"""
+
+class RedisBackend:
+    def __init__(self, client, prefix='ratelimit:'):
+        self.prefix = prefix
+        self._take = client.register_script(REDIS_TAKE)
+
+    def take(self, buckets):
+        allowed, wait = self._take(keys=[self.prefix + key for key, _, _ in buckets],
+                                   args=[value for _, rate, burst in buckets for value in (rate, burst)])
+        return bool(allowed), 0 if allowed else float(wait)
+
+    @classmethod
+    def from_url(cls, url):
+        import redis
+        return cls(redis.Redis.from_url(url))
+
+def make_backend(app):
+    name = app.config['RATE_LIMIT_BACKEND']
+    if name == 'memory':
+        return MemoryBackend()
+    if name == 'redis':
+        return RedisBackend.from_url(app.config['RATE_LIMIT_REDIS_URL'])
+    module, _, factory = name.partition(':')
+    if not factory:
+        raise ValueError(f"RATE_LIMIT_BACKEND must be 'memory', 'redis' or 'module:factory', not {name!r}")
+    return getattr(importlib.import_module(module), factory)(app)
+
+def client_key():
+    # Imported here: routes imports this module
+    from routes import get_current_user
+    user = get_current_user()
+    if user:
+        return f'user:{user.id}'
+    email = request.form.get('email', '').strip().lower()
+    return f'ip:{request.remote_addr}:email:{email}' if email else f'ip:{request.remote_addr}'
+
+def too_many_requests(retry_after):
+    seconds = max(1, math.ceil(retry_after))
+    if request.path.startswith('/api/'):
+        response = jsonify(error='Too many requests.', retry_after=seconds)
+        response.status_code = 429
+    else:
+        response = Response(f'Too many requests. Please wait {seconds} seconds and try again.\n',
+                            status=429, mimetype='text/plain')
+    response.headers['Retry-After'] = str(seconds)
+    return response
+
+def applies(limit):
+    if limit.methods is None:
+        return request.method not in ('GET', 'HEAD', 'OPTIONS')
+    return request.method in limit.methods
+
+def limited(f):
+    # Applies LIMITS[<view name>], and IP_LIMITS[<view name>] if any, to the
+    # view's requests; goes right below @route
+    limits = [(lambda: f'{f.__name__}:{client_key()}', LIMITS[f.__name__])]
+    if f.__name__ in IP_LIMITS:
+        limits.append((lambda: f'{f.__name__}:any-email:{request.remote_addr}', IP_LIMITS[f.__name__]))
+
+    def decorated_function(*args, **kwargs):
+        backend = current_app.extensions.get('ratelimit')
+        if backend is not None:
+            buckets = [(key(), limit.per_minute / 60, limit.burst)
+                       for key, limit in limits if applies(limit)]
+            allowed, retry_after = backend.take(buckets) if buckets else (True, 0)
+            if not allowed:
+                metrics.rate_limited.inc(endpoint=f.__name__)
+                return too_many_requests(retry_after)
+        return f(*args, **kwargs)
+    decorated_function.__name__ = f.__name__
+    return decorated_function
+
+def init_app(app):
+    app.config.setdefault('RATE_LIMIT_ENABLED', os.environ.get('RATE_LIMIT_ENABLED', '1') == '1')
+    app.config.setdefault('RATE_LIMIT_BACKEND', os.environ.get('RATE_LIMIT_BACKEND', 'memory'))
+    app.config.setdefault('RATE_LIMIT_REDIS_URL', os.environ.get('RATE_LIMIT_REDIS_URL',
+                                                                 'redis://localhost:6379/0'))
+    if app.config['RATE_LIMIT_ENABLED']:
+        app.extensions['ratelimit'] = make_backend(app)
@@ -0,0 +1,109 @@
+from collections import namedtuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import aliased
+
+from app import db
+from models import User, Subject, Query
+
+# Read-only projections for the list pages and dashboards: only the columns
+# they show, with the subject's and both users' names joined in and the
+# message and reply cut to a preview in SQL. Rows are namedtuples, so they
+# skip the identity map and change tracking and cost a fraction of a Query
+# instance. They keep the attribute names templates already use
+# (query.subject.name, query.teacher.name, query.is_pending(), ...).
+
+PREVIEW_LENGTH = 200
+# Rows fetched per round trip when streaming; a server-side cursor on
+# PostgreSQL, so memory stays flat however many rows there are
+STREAM_BATCH = 1000
+
+EXPORT_FIELDS = ('id', 'subject', 'student', 'teacher', 'message', 'reply', 'status',
+                 'created_at', 'updated_at')
+
+NameRow = namedtuple('NameRow', 'id name')
+
+class QueryRow(namedtuple('QueryRow', 'id subject student teacher message reply status '
+                                      'created_at updated_at')):
+    __slots__ = ()
+
+    @property
+    def subject_id(self):
+        return self.subject.id
+
+    @property
+    def student_id(self):
+        return self.student.id
+
+    @property
+    def teacher_id(self):
+        return self.teacher.id
+
+    def is_pending(self):
+        return self.status == 'pending'
+
+    def is_answered(self):
+        return self.status == 'answered'
+
+    def is_closed(self):
+        return self.status == 'closed'
+
+def shorten(text, length):
+    # The previews are read one character long to tell if they were cut
+    if text is None or length is None or len(text) <= length:
+        return text
+    return text[:length].rstrip() + '…'
+
+def query_list(*criteria, preview=PREVIEW_LENGTH, source=Query):
+    # Legacy-style column query over queries with their names joined;
+    # filter, order and page it like Query.query, then pass the rows to
+    # to_rows(). preview=None keeps the full message and reply; source can
+    # be an alias of Query (see archive.history_source).
+    teacher = aliased(User)
+    student = aliased(User)
+    if preview is None:
+        message, reply = source.message, source.reply
+    else:
+        message = func.substr(source.message, 1, preview + 1)
+        reply = func.substr(source.reply, 1, preview + 1)
+    return db.session.query(
+        source.id,
+        Subject.id.label('subject_id'), Subject.name.label('subject_name'),
+        student.id.label('student_id'), student.name.label('student_name'),
+        teacher.id.label('teacher_id'), teacher.name.label('teacher_name'),
+        message.label('message'), reply.label('reply'),
+        source.status, source.created_at, source.updated_at,
+    ).join(
+        Subject, Subject.id == source.subject_id
+    ).join(
+        student, student.id == source.student_id
+    ).join(
+        teacher, teacher.id == source.teacher_id
+    ).filter(*criteria)
+
+def to_rows(rows, preview=PREVIEW_LENGTH):
+    return [QueryRow(
+        row.id,
+        NameRow(row.subject_id, row.subject_name),
+        NameRow(row.student_id, row.student_name),
+        NameRow(row.teacher_id, row.teacher_name),
+        shorten(row.message, preview),
+        shorten(row.reply, preview),
+        row.status, row.created_at, row.updated_at,
+    ) for row in rows]
+
+def stream_dicts(query, batch_size=STREAM_BATCH):
+    # Flat EXPORT_FIELDS dicts for a query_list(preview=None), fetched
+    # batch_size rows at a time and never held together
+    for row in query.yield_per(batch_size):
+        yield {
+            'id': row.id,
+            'subject': row.subject_name,
+            'student': row.student_name,
+            'teacher': row.teacher_name,
+            'message': row.message,
+            'reply': row.reply,
+            'status': row.status,
+            'created_at': row.created_at,
+            'updated_at': row.updated_at,
+        }
@@ -0,0 +1,139 @@
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app, g, request, session
+from sqlalchemy import Column, DateTime, Integer, MetaData, Table, insert, select, text, update
+
+from app import db
+
+logger = logging.getLogger(__name__)
+
+# Read replicas for read-only pages. GET and HEAD requests to views decorated
+# with read_only() run their reads on a replica whose lag is within
+# MAX_LAG_SECONDS; everything else, and every write, uses the primary (see
+# RoutingSession in app.py). A user who has written reads from the primary
+# for STICKY_SECONDS afterwards, by which time any replica still in use has
+# the write, so they always see their own changes.
+#
+#   DATABASE_REPLICA_URLS    comma-separated replica URIs; unset disables routing
+#   REPLICA_MAX_LAG_SECONDS  replicas further behind are skipped (default 5)
+#   REPLICA_CHECK_SECONDS    how long a lag measurement is trusted (default 5)
+#   REPLICA_STICKY_SECONDS   primary-only window after a write (default lag + check)
+#   REPLICA_CONNECT_TIMEOUT  seconds to wait connecting to a PostgreSQL replica
+#                            (default 2), so a dead one fails its probe quickly
+#
+# PostgreSQL streaming replicas report their lag themselves. Anything else
+# (a second PostgreSQL instance or SQLite files standing in for replicas
+# locally) is measured with a heartbeat row that `flask replica-heartbeat`
+# keeps current on the primary: the replica is as far behind as its copy of
+# that row is old.
+
+MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', 5))
+CHECK_SECONDS = float(os.environ.get('REPLICA_CHECK_SECONDS', 5))
+STICKY_SECONDS = float(os.environ.get('REPLICA_STICKY_SECONDS', MAX_LAG_SECONDS + CHECK_SECONDS))
+HEARTBEAT_SECONDS = 1
+
+replica_heartbeat = Table(
+    'replica_heartbeat', MetaData(),
+    Column('id', Integer, primary_key=True, autoincrement=False),
+    Column('beat_at', DateTime, nullable=False),
+)
+
+# Caught up with a live WAL stream counts as no lag; otherwise the lag is
+# the age of the last replayed transaction (NULL before the first one)
+POSTGRES_LAG = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() "
+    "AND EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+def create_heartbeat(connection):
+    # Idempotent; called from migrations
+    replica_heartbeat.create(connection, checkfirst=True)
+
+def beat(connection):
+    now = datetime.utcnow()
+    if not connection.execute(update(replica_heartbeat).where(replica_heartbeat.c.id == 1)
+                              .values(beat_at=now)).rowcount:
+        connection.execute(insert(replica_heartbeat).values(id=1, beat_at=now))
+
+def measure_lag(engine):
+    # Seconds the replica is behind the primary, or None if it can't tell
+    with engine.connect() as connection:
+        if connection.dialect.name == 'postgresql' and connection.scalar(text('SELECT pg_is_in_recovery()')):
+            lag = connection.scalar(POSTGRES_LAG)
+            return None if lag is None else float(lag)
+        beat_at = connection.scalar(select(replica_heartbeat.c.beat_at).where(replica_heartbeat.c.id == 1))
+        return None if beat_at is None else max((datetime.utcnow() - beat_at).total_seconds(), 0.0)
+
+class ReplicaPool:
+    def __init__(self, bind_keys, max_lag=MAX_LAG_SECONDS, check_seconds=CHECK_SECONDS):
+        self.bind_keys = bind_keys
+        self.max_lag = max_lag
+        self.check_seconds = check_seconds
+        self._lags = {}  # bind key -> (measured at, lag or None)
+        self._lock = threading.Lock()
+        self._probing = threading.Lock()
+
+    def lags(self):
+        # {bind key: lag or None}, measuring the stale ones again. Only one
+        # request at a time probes; concurrent ones use the last measurements
+        # rather than wait for it, and a replica not measured yet counts as
+        # unknown lag, as does an unreachable one until the next check.
+        if self._probing.acquire(blocking=False):
+            try:
+                cutoff = time.monotonic() - self.check_seconds
+                with self._lock:
+                    stale = [key for key in self.bind_keys
+                             if self._lags.get(key, (cutoff,))[0] <= cutoff]
+                for key in stale:
+                    try:
+                        lag = measure_lag(db.engines[key])
+                    except Exception as e:
+                        logger.warning("Replica %s unavailable: %s", key, e)
+                        lag = None
+                    with self._lock:
+                        self._lags[key] = (time.monotonic(), lag)
+            finally:
+                self._probing.release()
+        with self._lock:
+            return {key: self._lags.get(key, (None, None))[1] for key in self.bind_keys}
+
+    def choose(self):
+        # A random replica within tolerance, or None for the primary
+        usable = [key for key, lag in self.lags().items() if lag is not None and lag <= self.max_lag]
+        return random.choice(usable) if usable else None
+
+    def invalidate(self):
+        with self._lock:
+            self._lags.clear()
+
+def wrote_recently():
+    return session.get('primary_until', 0) > time.time()
+
+def read_only(f):
+    # Serves the view's GET/HEAD requests from a replica when one is fresh
+    # enough and the user hasn't just written; goes right below @route
+    def decorated_function(*args, **kwargs):
+        pool = current_app.extensions.get('replicas')
+        if pool and request.method in ('GET', 'HEAD') and not wrote_recently():
+            g.replica = pool.choose()
+        return f(*args, **kwargs)
+    decorated_function.__name__ = f.__name__
+    return decorated_function
+
+def remember_writes(response):
+    # Any request that may have written pins the user to the primary
+    if request.method not in ('GET', 'HEAD', 'OPTIONS') or g.get('wrote_primary'):
+        session['primary_until'] = time.time() + STICKY_SECONDS
+    return response
+
+def init_app(app):
+    bind_keys = [f'replica_{i}' for i in range(len(app.config['SQLALCHEMY_REPLICA_URIS']))]
+    if bind_keys:
+        app.extensions['replicas'] = ReplicaPool(bind_keys)
+        app.after_request(remember_writes)
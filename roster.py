@@ -0,0 +1,175 @@
+import csv
+import io
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import islice
+
+from sqlalchemy import select, tuple_
+from sqlalchemy.dialects import sqlite
+
+from app import db
+import passwords
+from models import User, Subject, StudentSubject, TeacherSubject
+
+logger = logging.getLogger(__name__)
+
+# Bulk roster loading for `flask import-roster`. Files are streamed in
+# batches; each batch is hashed in a process pool and written with COPY into
+# a staging table on PostgreSQL, or one executemany on SQLite. Rows that
+# already exist (same email, subject or enrollment) are skipped.
+#
+#   users.csv:        role,name,email,password,department,roll_no
+#   subjects.csv:     name,department
+#   enrollments.csv:  email,subject_name,subject_department
+
+BATCH_SIZE = 5000
+
+def read_csv(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        for line_no, row in enumerate(csv.DictReader(f), start=2):
+            yield line_no, {key: (value or '').strip() for key, value in row.items()}
+
+def batches(rows, size):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+def hash_passwords(plaintexts):
+    # Runs in a worker process
+    return [passwords.make_hash(password) for password in plaintexts]
+
+def insert_rows(connection, table, rows, conflict_columns):
+    # Inserts dict rows into table, skipping conflicts on conflict_columns
+    if not rows:
+        return
+    columns = list(rows[0])
+
+    if connection.dialect.name == 'postgresql':
+        column_list = ', '.join(columns)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow(['\\N' if row[c] is None else row[c] for c in columns])
+        buffer.seek(0)
+
+        # One staging table per target, kept for the transaction and emptied
+        # before each use, so a transaction can load several tables or the
+        # same table more than once
+        staging = f'roster_staging_{table.name}'
+        cursor = connection.connection.cursor()
+        try:
+            cursor.execute(f"CREATE TEMP TABLE IF NOT EXISTS {staging} ON COMMIT DROP AS "
+                           f"SELECT {column_list} FROM {table.name} WITH NO DATA")
+            cursor.execute(f"TRUNCATE {staging}")
+            cursor.copy_expert(f"COPY {staging} ({column_list}) FROM STDIN "
+                               f"WITH (FORMAT csv, NULL '\\N')", buffer)
+            cursor.execute(f"INSERT INTO {table.name} ({column_list}) "
+                           f"SELECT {column_list} FROM {staging} "
+                           f"ON CONFLICT ({', '.join(conflict_columns)}) DO NOTHING")
+        finally:
+            cursor.close()
+    else:
+        connection.execute(
+            sqlite.insert(table).on_conflict_do_nothing(index_elements=conflict_columns),
+            rows
+        )
+
+def import_users(path, batch_size=BATCH_SIZE, hash_workers=None):
+    count = 0
+    now = datetime.utcnow()
+    with ProcessPoolExecutor(max_workers=hash_workers) as pool:
+        for batch in batches(read_csv(path), batch_size):
+            valid = []
+            for line_no, row in batch:
+                if row.get('role') not in ('student', 'teacher') or not all(
+                        row.get(key) for key in ('name', 'email', 'password', 'department')):
+                    logger.warning(f"{path}:{line_no}: skipped, missing fields or bad role")
+                elif row['role'] == 'student' and not row.get('roll_no'):
+                    logger.warning(f"{path}:{line_no}: skipped, students need a roll_no")
+                else:
+                    valid.append(row)
+
+            # Hashing dominates the import, so skip users that already exist
+            existing = set(db.session.scalars(
+                select(User.email).where(User.email.in_([row['email'] for row in valid]))
+            ))
+            valid = [row for row in valid if row['email'] not in existing]
+
+            plaintexts = [row['password'] for row in valid]
+            chunk = max(len(plaintexts) // ((hash_workers or os.cpu_count() or 1) * 4), 1)
+            hashes = [h for part in pool.map(
+                hash_passwords, [plaintexts[i:i + chunk] for i in range(0, len(plaintexts), chunk)]
+            ) for h in part]
+
+            with db.engine.begin() as connection:
+                insert_rows(connection, User.__table__, [dict(
+                    role=row['role'], name=row['name'], email=row['email'],
+                    password_hash=password_hash, department=row['department'],
+                    roll_no=(row.get('roll_no') or None) if row['role'] == 'student' else None,
+                    created_at=now, updated_at=now,
+                ) for row, password_hash in zip(valid, hashes)], ['email'])
+            count += len(batch)
+    return count
+
+def upsert_subject_pairs(connection, pairs):
+    insert_rows(connection, Subject.__table__,
+                [dict(name=name, department=department) for name, department in pairs],
+                ['name', 'department'])
+
+def import_subjects(path, batch_size=BATCH_SIZE):
+    count = 0
+    for batch in batches(read_csv(path), batch_size):
+        pairs = {(row['name'], row['department']) for _, row in batch
+                 if row.get('name') and row.get('department')}
+        with db.engine.begin() as connection:
+            upsert_subject_pairs(connection, sorted(pairs))
+        count += len(batch)
+    return count
+
+def import_enrollments(path, batch_size=BATCH_SIZE):
+    # Enrolls students and assigns teachers, depending on the user's role;
+    # subjects that do not exist yet are created
+    count = 0
+    now = datetime.utcnow()
+    for batch in batches(read_csv(path), batch_size):
+        rows = [(line_no, row) for line_no, row in batch
+                if row.get('email') and row.get('subject_name') and row.get('subject_department')]
+        emails = {row['email'] for _, row in rows}
+        pairs = {(row['subject_name'], row['subject_department']) for _, row in rows}
+
+        with db.engine.begin() as connection:
+            upsert_subject_pairs(connection, sorted(pairs))
+            users = {email: (user_id, role) for user_id, email, role in connection.execute(
+                select(User.id, User.email, User.role).where(User.email.in_(emails))
+            )}
+            subjects = {(name, department): subject_id for subject_id, name, department in connection.execute(
+                select(Subject.id, Subject.name, Subject.department)
+                .where(tuple_(Subject.name, Subject.department).in_(pairs))
+            )}
+
+            students, teachers = [], []
+            for line_no, row in rows:
+                if row['email'] not in users:
+                    logger.warning(f"{path}:{line_no}: skipped, unknown user {row['email']}")
+                    continue
+                user_id, role = users[row['email']]
+                subject_id = subjects[(row['subject_name'], row['subject_department'])]
+                if role == 'student':
+                    students.append(dict(student_id=user_id, subject_id=subject_id, registered_at=now))
+                else:
+                    teachers.append(dict(teacher_id=user_id, subject_id=subject_id, assigned_at=now))
+
+            insert_rows(connection, StudentSubject.__table__, students, ['student_id', 'subject_id'])
+            insert_rows(connection, TeacherSubject.__table__, teachers, ['teacher_id', 'subject_id'])
+        count += len(batch)
+    return count
+
+def timed(label, load, *args, **kwargs):
+    # Runs load(*args) and returns a "label: N rows in Xs (R rows/s)" summary
+    started = time.perf_counter()
+    count = load(*args, **kwargs)
+    elapsed = time.perf_counter() - started
+    return f"{label}: {count} rows in {elapsed:.1f}s ({count / elapsed if elapsed else 0:.0f} rows/s)"
@@ -1,16 +1,61 @@
-from flask import render_template, request, redirect, url_for, flash, session
-from app import app, db
+import uuid
+from datetime import datetime
+from flask import Response, current_app, stream_with_context, make_response, render_template, request, redirect, url_for, flash, session, g, jsonify
+from app import db
 from models import User, Subject, StudentSubject, TeacherSubject, Query
+from passwords import PasswordHashingBusy
 from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+import analytics
+import archive
+import catalog
+import counters
+import enrollment
+import exports
+import http_cache
+import idempotency
+import notifications
+import ratelimit
+import readmodel
+import replicas
+import scheduler
+import search
+import suggestions
+import triage
+from pagination import DEFAULT_PAGE_SIZE, decode_cursor, filter_queries, paginate_queries
+
+# Views are collected here and registered on each app by init_app(), which
+# keeps endpoint names unprefixed ('login', 'view_queries', ...)
+_routes = []
+
+def route(rule, **options):
+    def decorator(f):
+        _routes.append((rule, f, options))
+        return f
+    return decorator
+
+def init_app(app):
+    for rule, view_func, options in _routes:
+        app.add_url_rule(rule, view_func=view_func, **options)
+    app.context_processor(inject_user)
 
 # Helper function to check if user is logged in
 def is_logged_in():
     return 'user_id' in session
 
 def get_current_user():
-    if is_logged_in():
-        return User.query.get(session['user_id'])
-    return None
+    # Load the user at most once per request; decorators, views and the
+    # context processor all share the instance cached on flask.g
+    if not is_logged_in():
+        return None
+    if 'current_user' not in g:
+        g.current_user = db.session.get(User, session['user_id'])
+    return g.current_user
+
+def invalidate_current_user():
+    # Drop the request-scoped user so the next lookup sees fresh data
+    g.pop('current_user', None)
 
 def login_required(f):
     def decorated_function(*args, **kwargs):
@@ -41,11 +86,43 @@ def teacher_required(f):
     decorated_function.__name__ = f.__name__
     return decorated_function
 
-@app.route('/')
+def admin_required(f):
+    def decorated_function(*args, **kwargs):
+        user = get_current_user()
+        if not user or not user.is_admin():
+            flash('Access denied. Admin account required.', 'error')
+            return redirect(url_for('index'))
+        return f(*args, **kwargs)
+    decorated_function.__name__ = f.__name__
+    return decorated_function
+
+def conditional(version):
+    # Answers revalidations with 304 while version(user) and the request
+    # are unchanged; goes below the login and role decorators
+    def decorator(f):
+        def decorated_function(*args, **kwargs):
+            user = get_current_user()
+            etag, last_modified = http_cache.validators(user, version(user))
+            # Pages carrying flash messages are one-offs: never 304 to or
+            # cache them
+            if '_flashes' in session:
+                return f(*args, **kwargs)
+            if http_cache.is_fresh(etag, last_modified):
+                return http_cache.not_modified(etag, last_modified)
+            response = make_response(f(*args, **kwargs))
+            if response.status_code == 200:
+                http_cache.mark(response, etag, last_modified)
+            return response
+        decorated_function.__name__ = f.__name__
+        return decorated_function
+    return decorator
+
+@route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/register', methods=['GET', 'POST'])
+@route('/register', methods=['GET', 'POST'])
+@ratelimit.limited
 def register():
     if request.method == 'POST':
         name = request.form.get('name', '').strip()
@@ -81,7 +158,11 @@ def register():
             department=department,
             roll_no=roll_no
         )
-        user.set_password(password)
+        try:
+            user.set_password(password)
+        except PasswordHashingBusy:
+            flash('The server is busy, please try again in a moment.', 'error')
+            return render_template('register.html'), 503
         
         try:
             db.session.add(user)
@@ -91,11 +172,12 @@ def register():
         except Exception as e:
             db.session.rollback()
             flash('Registration failed. Please try again.', 'error')
-            app.logger.error(f"Registration error: {e}")
+            current_app.logger.error(f"Registration error: {e}")
     
     return render_template('register.html')
 
-@app.route('/login', methods=['GET', 'POST'])
+@route('/login', methods=['GET', 'POST'])
+@ratelimit.limited
 def login():
     if request.method == 'POST':
         email = request.form.get('email', '').strip()
@@ -107,7 +189,23 @@ def login():
         
         user = User.query.filter_by(email=email).first()
         
-        if user and user.check_password(password):
+        try:
+            authenticated = user is not None and user.check_password(password)
+        except PasswordHashingBusy:
+            flash('The server is busy, please try again in a moment.', 'error')
+            return render_template('login.html'), 503
+        
+        if authenticated:
+            # Upgrade hashes written with older cost parameters while the
+            # plaintext is at hand
+            if user.password_needs_rehash():
+                try:
+                    user.set_password(password)
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    current_app.logger.warning(f"Password rehash error: {e}")
+            
             session['user_id'] = user.id
             flash(f'Welcome back, {user.name}!', 'success')
             
@@ -120,64 +218,78 @@ def login():
     
     return render_template('login.html')
 
-@app.route('/logout')
+@route('/logout')
 def logout():
     session.clear()
+    invalidate_current_user()
     flash('You have been logged out.', 'info')
     return redirect(url_for('index'))
 
-# Make helper functions available to all templates
-@app.context_processor
-def inject_user():
-    return dict(
-        is_logged_in=is_logged_in(),
-        current_user=get_current_user()
-    )
-
-@app.route('/student/dashboard')
+@route('/student/dashboard')
+@replicas.read_only
 @login_required
 @student_required
+@conditional(http_cache.dashboard_version)
 def student_dashboard():
     user = get_current_user()
     
     # Get student's subjects
-    student_subjects = db.session.query(Subject).join(StudentSubject).filter(
+    student_subjects = [catalog.SubjectRow(*row) for row in db.session.query(
+        Subject.id, Subject.name, Subject.department
+    ).join(StudentSubject).filter(
         StudentSubject.student_id == user.id
-    ).all()
+    )]
     
-    # Get recent queries
-    recent_queries = Query.query.filter_by(student_id=user.id).order_by(
-        Query.created_at.desc()
-    ).limit(5).all()
+    # Get recent queries as previews with their subject and teacher names
+    recent_queries = readmodel.to_rows(readmodel.query_list(
+        Query.student_id == user.id
+    ).order_by(Query.created_at.desc()).limit(5))
+    
+    # Pending/answered totals from the maintained counters
+    query_counts = counters.counts_for('student', [user.id])[user.id]
+    subject_counts = counters.counts_for('subject', [subject.id for subject in student_subjects])
     
     return render_template('student_dashboard.html', 
                          user=user, 
                          subjects=student_subjects, 
-                         recent_queries=recent_queries)
+                         recent_queries=recent_queries,
+                         query_counts=query_counts,
+                         subject_counts=subject_counts)
 
-@app.route('/teacher/dashboard')
+@route('/teacher/dashboard')
+@replicas.read_only
 @login_required
 @teacher_required
+@conditional(http_cache.dashboard_version)
 def teacher_dashboard():
     user = get_current_user()
     
     # Get teacher's subjects
-    teacher_subjects = db.session.query(Subject).join(TeacherSubject).filter(
+    teacher_subjects = [catalog.SubjectRow(*row) for row in db.session.query(
+        Subject.id, Subject.name, Subject.department
+    ).join(TeacherSubject).filter(
         TeacherSubject.teacher_id == user.id
-    ).all()
+    )]
+    
+    # Get pending queries as previews with their subject and student names
+    pending_queries = readmodel.to_rows(readmodel.query_list(
+        Query.teacher_id == user.id,
+        Query.status == 'pending'
+    ).order_by(Query.created_at.desc()).limit(5))
     
-    # Get pending queries
-    pending_queries = Query.query.filter_by(
-        teacher_id=user.id, 
-        status='pending'
-    ).order_by(Query.created_at.desc()).limit(5).all()
+    # Pending/answered totals from the maintained counters
+    query_counts = counters.counts_for('teacher', [user.id])[user.id]
+    subject_counts = counters.counts_for('subject', [subject.id for subject in teacher_subjects])
     
     return render_template('teacher_dashboard.html', 
                          user=user, 
                          subjects=teacher_subjects, 
-                         pending_queries=pending_queries)
+                         pending_queries=pending_queries,
+                         query_counts=query_counts,
+                         subject_counts=subject_counts)
 
-@app.route('/student/profile', methods=['GET', 'POST'])
+@route('/student/profile', methods=['GET', 'POST'])
+@replicas.read_only
 @login_required
 @student_required
 def student_profile():
@@ -205,15 +317,17 @@ def student_profile():
             user.department = department
             user.roll_no = roll_no
             db.session.commit()
+            invalidate_current_user()
             flash('Profile updated successfully!', 'success')
         except Exception as e:
             db.session.rollback()
             flash('Failed to update profile.', 'error')
-            app.logger.error(f"Profile update error: {e}")
+            current_app.logger.error(f"Profile update error: {e}")
     
     return render_template('student_profile.html', user=user)
 
-@app.route('/teacher/profile', methods=['GET', 'POST'])
+@route('/teacher/profile', methods=['GET', 'POST'])
+@replicas.read_only
 @login_required
 @teacher_required
 def teacher_profile():
@@ -239,15 +353,29 @@ def teacher_profile():
             user.email = email
             user.department = department
             db.session.commit()
+            invalidate_current_user()
+            # Cached teacher pickers show the teacher's name and department
+            catalog.invalidate_all()
             flash('Profile updated successfully!', 'success')
         except Exception as e:
             db.session.rollback()
             flash('Failed to update profile.', 'error')
-            app.logger.error(f"Profile update error: {e}")
+            current_app.logger.error(f"Profile update error: {e}")
     
     return render_template('teacher_profile.html', user=user)
 
-@app.route('/student/subjects', methods=['GET', 'POST'])
+def subject_pairs_from_form():
+    # (name, department) pairs from the subject form; the fields may repeat
+    # to register several subjects in one POST. None if any field is blank.
+    names = request.form.getlist('subject_name')
+    departments = request.form.getlist('subject_department')
+    pairs = [(name.strip(), department.strip()) for name, department in zip(names, departments)]
+    if not pairs or len(names) != len(departments) or not all(name and department for name, department in pairs):
+        return None
+    return pairs
+
+@route('/student/subjects', methods=['GET', 'POST'])
+@replicas.read_only
 @login_required
 @student_required
 def student_subjects():
@@ -257,44 +385,29 @@ def student_subjects():
         action = request.form.get('action')
         
         if action == 'register':
-            subject_name = request.form.get('subject_name', '').strip()
-            subject_department = request.form.get('subject_department', '').strip()
+            pairs = subject_pairs_from_form()
             
-            if not all([subject_name, subject_department]):
+            if not pairs:
                 flash('Subject name and department are required.', 'error')
             else:
-                # Check if subject exists, if not create it
-                subject = Subject.query.filter_by(
-                    name=subject_name, 
-                    department=subject_department
-                ).first()
-                
-                if not subject:
-                    subject = Subject(name=subject_name, department=subject_department)
-                    db.session.add(subject)
-                    db.session.flush()
-                
-                # Check if student is already registered
-                existing = StudentSubject.query.filter_by(
-                    student_id=user.id,
-                    subject_id=subject.id
-                ).first()
-                
-                if existing:
-                    flash('You are already registered for this subject.', 'warning')
-                else:
-                    try:
-                        student_subject = StudentSubject(
-                            student_id=user.id,
-                            subject_id=subject.id
-                        )
-                        db.session.add(student_subject)
-                        db.session.commit()
+                try:
+                    # Find-or-create the subjects and register in two statements
+                    subject_ids, added = enrollment.register_student(user.id, pairs)
+                    if added:
+                        user.touch()
+                    db.session.commit()
+                    if not added:
+                        flash('You are already registered for this subject.'
+                              if len(subject_ids) == 1 else
+                              'You are already registered for these subjects.', 'warning')
+                    elif len(subject_ids) == 1:
                         flash('Successfully registered for subject!', 'success')
-                    except Exception as e:
-                        db.session.rollback()
-                        flash('Failed to register for subject.', 'error')
-                        app.logger.error(f"Subject registration error: {e}")
+                    else:
+                        flash(f'Successfully registered for {len(added)} of {len(subject_ids)} subjects!', 'success')
+                except Exception as e:
+                    db.session.rollback()
+                    flash('Failed to register for subject.', 'error')
+                    current_app.logger.error(f"Subject registration error: {e}")
         
         elif action == 'withdraw':
             subject_id = request.form.get('subject_id')
@@ -307,6 +420,7 @@ def student_subjects():
                     
                     if student_subject:
                         db.session.delete(student_subject)
+                        user.touch()
                         db.session.commit()
                         flash('Successfully withdrawn from subject!', 'success')
                     else:
@@ -314,7 +428,7 @@ def student_subjects():
                 except Exception as e:
                     db.session.rollback()
                     flash('Failed to withdraw from subject.', 'error')
-                    app.logger.error(f"Subject withdrawal error: {e}")
+                    current_app.logger.error(f"Subject withdrawal error: {e}")
     
     # Get student's registered subjects
     registered_subjects = db.session.query(Subject).join(StudentSubject).filter(
@@ -325,7 +439,8 @@ def student_subjects():
                          user=user, 
                          registered_subjects=registered_subjects)
 
-@app.route('/teacher/subjects', methods=['GET', 'POST'])
+@route('/teacher/subjects', methods=['GET', 'POST'])
+@replicas.read_only
 @login_required
 @teacher_required
 def teacher_subjects():
@@ -335,44 +450,31 @@ def teacher_subjects():
         action = request.form.get('action')
         
         if action == 'assign':
-            subject_name = request.form.get('subject_name', '').strip()
-            subject_department = request.form.get('subject_department', '').strip()
+            pairs = subject_pairs_from_form()
             
-            if not all([subject_name, subject_department]):
+            if not pairs:
                 flash('Subject name and department are required.', 'error')
             else:
-                # Check if subject exists, if not create it
-                subject = Subject.query.filter_by(
-                    name=subject_name, 
-                    department=subject_department
-                ).first()
-                
-                if not subject:
-                    subject = Subject(name=subject_name, department=subject_department)
-                    db.session.add(subject)
-                    db.session.flush()
-                
-                # Check if teacher is already assigned
-                existing = TeacherSubject.query.filter_by(
-                    teacher_id=user.id,
-                    subject_id=subject.id
-                ).first()
-                
-                if existing:
-                    flash('You are already assigned to this subject.', 'warning')
-                else:
-                    try:
-                        teacher_subject = TeacherSubject(
-                            teacher_id=user.id,
-                            subject_id=subject.id
-                        )
-                        db.session.add(teacher_subject)
-                        db.session.commit()
+                try:
+                    # Find-or-create the subjects and assign in two statements
+                    subject_ids, added = enrollment.assign_teacher(user.id, pairs)
+                    if added:
+                        user.touch()
+                    db.session.commit()
+                    for subject_id in added:
+                        catalog.invalidate_subject(subject_id)
+                    if not added:
+                        flash('You are already assigned to this subject.'
+                              if len(subject_ids) == 1 else
+                              'You are already assigned to these subjects.', 'warning')
+                    elif len(subject_ids) == 1:
                         flash('Successfully assigned to subject!', 'success')
-                    except Exception as e:
-                        db.session.rollback()
-                        flash('Failed to assign subject.', 'error')
-                        app.logger.error(f"Subject assignment error: {e}")
+                    else:
+                        flash(f'Successfully assigned to {len(added)} of {len(subject_ids)} subjects!', 'success')
+                except Exception as e:
+                    db.session.rollback()
+                    flash('Failed to assign subject.', 'error')
+                    current_app.logger.error(f"Subject assignment error: {e}")
         
         elif action == 'unassign':
             subject_id = request.form.get('subject_id')
@@ -385,14 +487,16 @@ def teacher_subjects():
                     
                     if teacher_subject:
                         db.session.delete(teacher_subject)
+                        user.touch()
                         db.session.commit()
+                        catalog.invalidate_subject(int(subject_id))
                         flash('Successfully unassigned from subject!', 'success')
                     else:
                         flash('Subject assignment not found.', 'error')
                 except Exception as e:
                     db.session.rollback()
                     flash('Failed to unassign from subject.', 'error')
-                    app.logger.error(f"Subject unassignment error: {e}")
+                    current_app.logger.error(f"Subject unassignment error: {e}")
     
     # Get teacher's assigned subjects
     assigned_subjects = db.session.query(Subject).join(TeacherSubject).filter(
@@ -403,81 +507,301 @@ def teacher_subjects():
                          user=user, 
                          assigned_subjects=assigned_subjects)
 
-@app.route('/student/submit-query', methods=['GET', 'POST'])
+@route('/student/submit-query', methods=['GET', 'POST'])
+@ratelimit.limited
 @login_required
 @student_required
 def submit_query():
     user = get_current_user()
+    similar = []
+    status = 200
     
     if request.method == 'POST':
-        subject_id = request.form.get('subject_id')
-        teacher_id = request.form.get('teacher_id')
+        subject_id = request.form.get('subject_id', type=int)
+        teacher_id = request.form.get('teacher_id', type=int)
         message = request.form.get('message', '').strip()
         
-        if not all([subject_id, teacher_id, message]):
+        # A repeat of a submission that went through (double click, retry)
+        # gets the same result without a second query
+        idempotency_key = idempotency.key_from_request()
+        original = None
+        if idempotency_key and idempotency.is_valid(idempotency_key):
+            original = idempotency.original(user.id, idempotency_key)
+        if original and idempotency.same_request(original, subject_id, message):
+            flash('Query submitted successfully!', 'success')
+            return redirect(url_for('view_queries'))
+        
+        # teacher_id=auto leaves the choice to the scheduler
+        auto_assign = current_app.config['AUTO_ASSIGN'] and request.form.get('teacher_id') == 'auto'
+        if auto_assign and subject_id:
+            teacher_id = scheduler.choose_teacher(subject_id)
+        
+        if idempotency_key and not idempotency.is_valid(idempotency_key):
+            flash('Invalid idempotency key.', 'error')
+        elif original:
+            flash('This idempotency key was already used for a different query.', 'error')
+            status = 422
+        elif not all([subject_id, message]) or not (teacher_id or auto_assign):
             flash('All fields are required.', 'error')
+        elif auto_assign and not teacher_id:
+            flash('No teacher is available for this subject yet.', 'error')
+        elif not catalog.is_teacher_assigned(teacher_id, subject_id):
+            flash('Please choose a teacher assigned to this subject.', 'error')
         else:
-            try:
-                query = Query(
-                    student_id=user.id,
-                    teacher_id=teacher_id,
-                    subject_id=subject_id,
-                    message=message
-                )
-                db.session.add(query)
-                db.session.commit()
-                flash('Query submitted successfully!', 'success')
-                return redirect(url_for('view_queries'))
-            except Exception as e:
-                db.session.rollback()
-                flash('Failed to submit query.', 'error')
-                app.logger.error(f"Query submission error: {e}")
-    
-    # Get all subjects
-    subjects = Subject.query.all()
+            # Before adding to a teacher's queue, offer answers to similar
+            # questions; the form resubmits with confirm=1 if none helps
+            if not request.form.get('confirm'):
+                similar = suggestions.answered_like(subject_id, message)
+            if similar:
+                flash('Similar questions have already been answered. '
+                      'Please check them before submitting yours.', 'info')
+            else:
+                try:
+                    query = Query(
+                        student_id=user.id,
+                        teacher_id=teacher_id,
+                        subject_id=subject_id,
+                        message=message
+                    )
+                    db.session.add(query)
+                    counters.query_submitted(query)
+                    db.session.flush()
+                    if idempotency_key:
+                        idempotency.remember(user.id, idempotency_key, query.id)
+                    notifications.publish('query_submitted', query)
+                    db.session.commit()
+                    scheduler.scheduler.assigned(teacher_id)
+                    flash('Query submitted successfully!', 'success')
+                    return redirect(url_for('view_queries'))
+                except IntegrityError as e:
+                    # Lost a race with a request carrying the same key
+                    db.session.rollback()
+                    original = idempotency_key and idempotency.original(user.id, idempotency_key)
+                    if original and idempotency.same_request(original, subject_id, message):
+                        flash('Query submitted successfully!', 'success')
+                        return redirect(url_for('view_queries'))
+                    if original:
+                        flash('This idempotency key was already used for a different query.', 'error')
+                        status = 422
+                    else:
+                        flash('Failed to submit query.', 'error')
+                        current_app.logger.error(f"Query submission error: {e}")
+                except Exception as e:
+                    db.session.rollback()
+                    flash('Failed to submit query.', 'error')
+                    current_app.logger.error(f"Query submission error: {e}")
+    else:
+        subject_id = request.args.get('subject_id', type=int)
     
-    # Get all teachers
-    teachers = User.query.filter_by(role='teacher').all()
+    # Subjects that have a teacher, and only the chosen subject's teachers;
+    # the form loads others from /api/subjects/<id>/teachers on change
+    subjects = catalog.subjects_with_teachers()
+    teachers = catalog.teachers_for_subject(subject_id) if subject_id else []
     
     return render_template('submit_query.html', 
                          user=user, 
                          subjects=subjects, 
-                         teachers=teachers)
+                         teachers=teachers,
+                         selected_subject_id=subject_id,
+                         selected_teacher_id=request.form.get('teacher_id'),
+                         auto_assign=current_app.config['AUTO_ASSIGN'],
+                         message=request.form.get('message', ''),
+                         suggestions=similar,
+                         # A key refused for another query can't be reused
+                         idempotency_key=(status != 422 and request.form.get('idempotency_key'))
+                                         or uuid.uuid4().hex), status
+
+@route('/api/subjects/<int:subject_id>/suggestions')
+@ratelimit.limited
+def api_subject_suggestions(subject_id):
+    # Answered questions similar to the text a student is typing
+    user = get_current_user()
+    if not user:
+        return jsonify(error='Authentication required.'), 401
+    if not user.is_student():
+        return jsonify(error='Student account required.'), 403
+    # Only subjects a query could be submitted in, so lookups can't load an
+    # index for every subject id
+    if not catalog.teachers_for_subject(subject_id):
+        return jsonify(error='No teacher is assigned to this subject.'), 404
+    
+    found = suggestions.answered_like(subject_id, request.args.get('q', ''))
+    return jsonify(suggestions=[{
+        'id': query.id,
+        'message': query.message,
+        'reply': query.reply,
+        'teacher': {'id': query.teacher.id, 'name': query.teacher.name},
+        'score': round(score, 3),
+    } for query, score in found])
+
+@route('/api/subjects/<int:subject_id>/teachers')
+def api_subject_teachers(subject_id):
+    if not get_current_user():
+        return jsonify(error='Authentication required.'), 401
+    
+    teachers = catalog.teachers_for_subject(subject_id)
+    return jsonify(teachers=[teacher._asdict() for teacher in teachers])
 
-@app.route('/student/queries')
+def query_history_page(user, preview=readmodel.PREVIEW_LENGTH):
+    # One page of the user's query history as read-model rows, filtered by
+    # the request args; preview=None keeps the full text. Archived queries
+    # are only read with include_archive=1. Raises ValueError for a
+    # malformed cursor or filter.
+    source = archive.history_source(request.args.get('include_archive') == '1')
+    owner = source.student_id if user.is_student() else source.teacher_id
+    base = filter_queries(
+        readmodel.query_list(owner == user.id, preview=preview, source=source),
+        status=request.args.get('status') or None,
+        subject_id=request.args.get('subject_id', type=int),
+        model=source
+    )
+    rows, next_cursor = paginate_queries(
+        base,
+        cursor=decode_cursor(request.args.get('cursor')),
+        per_page=request.args.get('per_page', DEFAULT_PAGE_SIZE, type=int),
+        model=source
+    )
+    return readmodel.to_rows(rows, preview), next_cursor
+
+def render_query_history(template, endpoint, user):
+    try:
+        queries, next_cursor = query_history_page(user)
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for(endpoint))
+
+    return render_template(template,
+                         user=user,
+                         queries=queries,
+                         next_cursor=next_cursor,
+                         status=request.args.get('status', ''),
+                         subject_id=request.args.get('subject_id', type=int),
+                         include_archive=request.args.get('include_archive') == '1')
+
+@route('/student/queries')
+@replicas.read_only
 @login_required
 @student_required
+@conditional(http_cache.history_version)
 def view_queries():
     user = get_current_user()
-    
-    # Get all queries submitted by this student
-    queries = Query.query.filter_by(student_id=user.id).order_by(
-        Query.created_at.desc()
-    ).all()
-    
-    return render_template('view_queries.html', user=user, queries=queries)
+    return render_query_history('view_queries.html', 'view_queries', user)
 
-@app.route('/teacher/queries')
+@route('/teacher/queries')
+@replicas.read_only
 @login_required
 @teacher_required
+@conditional(http_cache.history_version)
 def teacher_queries():
     user = get_current_user()
-    
-    # Get all queries sent to this teacher
-    queries = Query.query.filter_by(teacher_id=user.id).order_by(
-        Query.created_at.desc()
-    ).all()
-    
-    return render_template('teacher_queries.html', user=user, queries=queries)
+    return render_query_history('teacher_queries.html', 'teacher_queries', user)
+
+def serialize_query(query):
+    return {
+        'id': query.id,
+        'subject': {'id': query.subject.id, 'name': query.subject.name},
+        'student_id': query.student_id,
+        'teacher_id': query.teacher_id,
+        'message': query.message,
+        'reply': query.reply,
+        'status': query.status,
+        'created_at': query.created_at.isoformat(),
+        'updated_at': query.updated_at.isoformat() if query.updated_at else None,
+    }
+
+@route('/api/queries')
+@replicas.read_only
+def api_queries():
+    user = get_current_user()
+    if not user:
+        return jsonify(error='Authentication required.'), 401
+
+    try:
+        queries, next_cursor = query_history_page(user, preview=None)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    return jsonify(
+        queries=[serialize_query(query) for query in queries],
+        next_cursor=next_cursor
+    )
+
+@route('/api/queries/export')
+@replicas.read_only
+def api_export_queries():
+    # The caller's whole history, archived queries included, oldest first,
+    # streamed as CSV or NDJSON (gzip=1 compresses it); takes the history
+    # filters, and include_archive=0 leaves the archive out
+    user = get_current_user()
+    if not user:
+        return jsonify(error='Authentication required.'), 401
+
+    format = request.args.get('format', 'csv')
+    include_archive = request.args.get('include_archive') != '0'
+    source = archive.history_source(include_archive)
+    owner = source.student_id if user.is_student() else source.teacher_id
+    try:
+        query = filter_queries(
+            readmodel.query_list(owner == user.id, preview=None, source=source),
+            status=request.args.get('status') or None,
+            subject_id=request.args.get('subject_id', type=int),
+            model=source
+        ).order_by(source.created_at, source.id)
+        body = exports.encode(format, readmodel.EXPORT_FIELDS, readmodel.stream_dicts(query))
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
 
-@app.route('/teacher/respond-query/<int:query_id>', methods=['GET', 'POST'])
+    filename = f"queries-{datetime.utcnow():%Y%m%d}.{format}"
+    mimetype = exports.FORMATS[format]
+    if request.args.get('gzip') == '1':
+        body, filename, mimetype = exports.gzipped(body), filename + '.gz', 'application/gzip'
+    return Response(stream_with_context(body), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+@route('/api/queries/search')
+@replicas.read_only
+def api_search_queries():
+    # Ranked full-text search over the caller's own queries
+    user = get_current_user()
+    if not user:
+        return jsonify(error='Authentication required.'), 401
+
+    owner_column = Query.student_id if user.is_student() else Query.teacher_id
+    page = request.args.get('page', 1, type=int)
+    try:
+        results, has_more = search.search_queries(
+            readmodel.query_list(preview=None), owner_column, user.id, request.args.get('q', ''),
+            status=request.args.get('status') or None,
+            subject_id=request.args.get('subject_id', type=int),
+            page=page,
+            per_page=request.args.get('per_page', DEFAULT_PAGE_SIZE, type=int)
+        )
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    return jsonify(
+        queries=[dict(serialize_query(query), rank=rank) for query, rank in
+                 zip(readmodel.to_rows([row for row, _ in results], None), [rank for _, rank in results])],
+        next_page=page + 1 if has_more else None
+    )
+
+@route('/teacher/respond-query/<int:query_id>', methods=['GET', 'POST'])
+@ratelimit.limited
 @login_required
 @teacher_required
 def respond_query(query_id):
     user = get_current_user()
     
     # Get the query and ensure it belongs to this teacher
-    query = Query.query.filter_by(id=query_id, teacher_id=user.id).first()
+    lookup = Query.query.options(
+        joinedload(Query.subject),
+        joinedload(Query.student)
+    ).filter_by(id=query_id, teacher_id=user.id)
+    if request.method == 'POST':
+        # Lock the row so two concurrent replies cannot both count as the
+        # answer to a pending query
+        lookup = lookup.with_for_update(of=Query)
+    query = lookup.first()
     
     if not query:
         flash('Query not found or access denied.', 'error')
@@ -490,19 +814,142 @@ def respond_query(query_id):
             flash('Reply cannot be empty.', 'error')
         else:
             try:
+                counters.status_changed(query, 'answered')
                 query.reply = reply
                 query.status = 'answered'
+                notifications.publish('query_answered', query)
+                answered = (query.id, query.subject_id, query.message)
                 db.session.commit()
+                suggestions.query_answered(*answered)
                 flash('Reply sent successfully!', 'success')
                 return redirect(url_for('teacher_queries'))
             except Exception as e:
                 db.session.rollback()
                 flash('Failed to send reply.', 'error')
-                app.logger.error(f"Reply error: {e}")
+                current_app.logger.error(f"Reply error: {e}")
     
     return render_template('respond_query.html', user=user, query=query)
 
-# Context processors to make functions available in templates
-@app.context_processor
+@route('/api/queries/triage', methods=['POST'])
+@ratelimit.limited
+def api_triage_queries():
+    # Applies one reply, or marks queries answered or closed, in bulk.
+    # Takes JSON {"action", "query_ids", "reply"} or the same form fields.
+    user = get_current_user()
+    if not user:
+        return jsonify(error='Authentication required.'), 401
+    if not user.is_teacher():
+        return jsonify(error='Teacher account required.'), 403
+    
+    if request.is_json:
+        data = request.get_json(silent=True) or {}
+        query_ids = data.get('query_ids')
+        action = data.get('action')
+        reply = (data.get('reply') or '').strip()
+    else:
+        query_ids = request.form.getlist('query_ids')
+        action = request.form.get('action')
+        reply = request.form.get('reply', '').strip()
+    try:
+        if not isinstance(query_ids, list):
+            raise ValueError
+        query_ids = [int(query_id) for query_id in query_ids]
+    except (TypeError, ValueError):
+        return jsonify(error='query_ids must be a list of query ids.'), 400
+    
+    try:
+        results, changed = triage.apply(user.id, query_ids, action, reply or None)
+        db.session.commit()
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify(error=str(e)), 400
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Triage error: {e}")
+        return jsonify(error='Failed to update queries.'), 500
+    
+    # Triage can mark queries answered without a reply; only suggest real answers
+    for query in changed:
+        if query.status == 'answered' and query.reply:
+            suggestions.query_answered(query.id, query.subject_id, query.message)
+    return jsonify(
+        results=[{'id': query_id, 'result': result} for query_id, result in results],
+        updated=len(changed)
+    )
+
+@route('/api/events')
+def api_events():
+    # Server-Sent Events stream of new queries and replies for this user
+    user = get_current_user()
+    if not user:
+        return jsonify(error='Authentication required.'), 401
+    
+    user_id = user.id
+    if not notifications.open_stream():
+        response = jsonify(error='Too many open event streams; poll /api/queries instead.')
+        response.status_code = 503
+        response.headers['Retry-After'] = '30'
+        return response
+    try:
+        notifications.ensure_listener()
+    except Exception:
+        notifications.close_stream()
+        raise
+    # The stream can stay open for hours; don't hold a pooled connection
+    db.session.close()
+    response = Response(notifications.stream_events(user_id),
+                        mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Runs when the server closes the response, even if it never started
+    # iterating the stream
+    response.call_on_close(notifications.close_stream)
+    return response
+
+@route('/admin/analytics')
+@replicas.read_only
+@login_required
+@admin_required
+def admin_analytics():
+    # Totals per subject, teacher or department from the rollup tables;
+    # `flask rollup-analytics` keeps them current
+    group = request.args.get('group', 'subject')
+    try:
+        since, until = analytics.parse_range(request.args.get('since'), request.args.get('until'))
+        reports = analytics.report(group, since, until)
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('admin_analytics'))
+
+    return render_template('admin_analytics.html',
+                         user=get_current_user(),
+                         reports=reports,
+                         groups=analytics.GROUPS,
+                         group=group,
+                         since=since,
+                         until=until,
+                         rolled_up_to=analytics.get_watermark())
+
+@route('/admin/analytics/export')
+@replicas.read_only
+@login_required
+@admin_required
+def admin_analytics_export():
+    # Per-day rows for the range as CSV or NDJSON, streamed a day at a time
+    group = request.args.get('group', 'subject')
+    format = request.args.get('format', 'csv')
+    try:
+        since, until = analytics.parse_range(request.args.get('since'), request.args.get('until'))
+        # The rows are generated lazily, so check the grouping while an
+        # error can still be a 400
+        analytics.grouped(analytics.analytics_daily, group)
+        body = exports.encode(format, analytics.EXPORT_FIELDS, analytics.export_rows(group, since, until))
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    filename = f"analytics-{group}-{since:%Y%m%d}.{format}"
+    return Response(stream_with_context(body), mimetype=exports.FORMATS[format],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+# Make helper functions available to all templates
 def inject_user():
     return dict(current_user=get_current_user(), is_logged_in=is_logged_in())
@@ -0,0 +1,106 @@
+import os
+import random
+import statistics
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from app import db
+from models import Query
+import catalog
+import counters
+
+# Auto-assignment: picks the teacher of a subject who should answer a new
+# query soonest, estimated as (pending queue + 1) x their recent median
+# response time.
+#
+# Each process caches every teacher's load and reconciles it with the
+# database once it is RECONCILE_SECONDS old: pending from the maintained
+# counters (a primary-key lookup) and latency from their answers created in
+# the last LATENCY_WINDOW (an index range scan per teacher). In between,
+# submissions add to the cached queue straight away, so a burst of
+# questions spreads out instead of landing on one teacher. A decision with
+# a fresh cache reads nothing from the database.
+
+RECONCILE_SECONDS = float(os.environ.get('SCHEDULER_RECONCILE_SECONDS', 30))
+LATENCY_WINDOW = timedelta(days=int(os.environ.get('SCHEDULER_LATENCY_DAYS', 14)))
+# Assumed for teachers with no recent answers
+DEFAULT_LATENCY = timedelta(days=1).total_seconds()
+
+Load = namedtuple('Load', 'pending latency')  # latency in seconds or None
+
+class Scheduler:
+    def __init__(self, reconcile_seconds=RECONCILE_SECONDS):
+        self.reconcile_seconds = reconcile_seconds
+        self._loads = {}  # teacher_id -> (reconciled at, Load)
+        self._lock = threading.Lock()
+
+    def reconcile(self, teacher_ids):
+        pending = counters.counts_for('teacher', teacher_ids)
+        answered = db.session.execute(
+            select(Query.teacher_id, Query.created_at, Query.updated_at).where(
+                Query.teacher_id.in_(teacher_ids),
+                Query.status == 'answered',
+                Query.created_at >= datetime.utcnow() - LATENCY_WINDOW,
+            )
+        )
+        latencies = {}
+        for teacher_id, created_at, updated_at in answered:
+            if created_at and updated_at:
+                latencies.setdefault(teacher_id, []).append((updated_at - created_at).total_seconds())
+
+        now = time.monotonic()
+        with self._lock:
+            for teacher_id in teacher_ids:
+                latency = statistics.median(latencies[teacher_id]) if teacher_id in latencies else None
+                self._loads[teacher_id] = (now, Load(pending[teacher_id].pending, latency))
+
+    def loads(self, teacher_ids):
+        # {teacher_id: Load}, reconciling the stale ones in one go
+        cutoff = time.monotonic() - self.reconcile_seconds
+        with self._lock:
+            stale = [teacher_id for teacher_id in teacher_ids
+                     if self._loads.get(teacher_id, (cutoff,))[0] <= cutoff]
+        if stale:
+            self.reconcile(stale)
+        with self._lock:
+            return {teacher_id: self._loads[teacher_id][1] for teacher_id in teacher_ids}
+
+    def choose(self, teacher_ids):
+        # The teacher expected to answer soonest, or None for no teachers.
+        # Ties go to a random one so workers don't all pick the same.
+        if not teacher_ids:
+            return None
+        loads = self.loads(teacher_ids)
+        known = [load.latency for load in loads.values() if load.latency is not None]
+        typical = statistics.median(known) if known else DEFAULT_LATENCY
+
+        def expected_wait(teacher_id):
+            load = loads[teacher_id]
+            return ((load.pending + 1) * (load.latency if load.latency is not None else typical),
+                    load.pending, random.random())
+        return min(teacher_ids, key=expected_wait)
+
+    def assigned(self, teacher_id):
+        # A query was added to the teacher's queue by this process
+        with self._lock:
+            entry = self._loads.get(teacher_id)
+            if entry:
+                reconciled_at, load = entry
+                self._loads[teacher_id] = (reconciled_at, load._replace(pending=load.pending + 1))
+
+    def invalidate(self, *teacher_ids):
+        with self._lock:
+            if not teacher_ids:
+                self._loads.clear()
+            for teacher_id in teacher_ids:
+                self._loads.pop(teacher_id, None)
+
+scheduler = Scheduler()
+
+def choose_teacher(subject_id):
+    # Auto-assignment target among the subject's teachers, or None
+    return scheduler.choose([teacher.id for teacher in catalog.teachers_for_subject(subject_id)])
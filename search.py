@@ -0,0 +1,125 @@
+import re
+
+from sqlalchemy import column, func, literal_column, select, table, text
+
+from app import db
+from models import Query
+from pagination import clamp_page_size, filter_queries
+
+# Full-text search over query messages and replies.
+#
+# PostgreSQL: queries.search_vector is a stored generated tsvector column
+# (so every write path keeps it current) with a GIN index; matches are
+# ranked with ts_rank_cd. SQLite: queries_fts is an external-content FTS5
+# table kept in step by triggers and ranked with bm25. Both are created by
+# migration 6 (see create_index), outside the models, because neither type
+# exists on the other backend.
+
+LANGUAGE = 'english'
+
+queries_fts = table('queries_fts', column('rowid'))
+
+# Dropped from SQLite searches, as PostgreSQL's english configuration does;
+# they match most rows and would make every search rank most of the owner's
+# history
+STOP_WORDS = frozenset('''a an and are as at be but by do does for from how i if in into is it
+no not of on or so such that the their then there these they this to was what when where which
+who why will with you'''.split())
+
+def create_index(connection):
+    # Idempotent; called from migrations
+    dialect = connection.dialect.name
+    if dialect == 'postgresql':
+        connection.execute(text(
+            "ALTER TABLE queries ADD COLUMN IF NOT EXISTS search_vector tsvector "
+            f"GENERATED ALWAYS AS (to_tsvector('{LANGUAGE}', "
+            "coalesce(message, '') || ' ' || coalesce(reply, ''))) STORED"
+        ))
+        connection.execute(text(
+            'CREATE INDEX IF NOT EXISTS ix_queries_search ON queries USING gin (search_vector)'
+        ))
+    elif dialect == 'sqlite':
+        # The owner ids are indexed too, so the owner filter is a posting
+        # list intersection inside FTS5 (see fts5_match) and only the
+        # owner's matches get ranked
+        connection.execute(text(
+            'CREATE VIRTUAL TABLE IF NOT EXISTS queries_fts USING fts5('
+            'message, reply, student_id, teacher_id, '
+            "content='queries', content_rowid='id', tokenize='porter')"
+        ))
+        columns = 'message, reply, student_id, teacher_id'
+        new_values = 'new.id, new.message, new.reply, new.student_id, new.teacher_id'
+        old_values = 'old.id, old.message, old.reply, old.student_id, old.teacher_id'
+        connection.execute(text(
+            'CREATE TRIGGER IF NOT EXISTS queries_fts_insert AFTER INSERT ON queries BEGIN '
+            f'INSERT INTO queries_fts (rowid, {columns}) VALUES ({new_values}); '
+            'END'
+        ))
+        connection.execute(text(
+            'CREATE TRIGGER IF NOT EXISTS queries_fts_delete AFTER DELETE ON queries BEGIN '
+            f"INSERT INTO queries_fts (queries_fts, rowid, {columns}) VALUES ('delete', {old_values}); "
+            'END'
+        ))
+        connection.execute(text(
+            'CREATE TRIGGER IF NOT EXISTS queries_fts_update '
+            f'AFTER UPDATE OF {columns} ON queries BEGIN '
+            f"INSERT INTO queries_fts (queries_fts, rowid, {columns}) VALUES ('delete', {old_values}); "
+            f'INSERT INTO queries_fts (rowid, {columns}) VALUES ({new_values}); '
+            'END'
+        ))
+        connection.execute(text("INSERT INTO queries_fts (queries_fts) VALUES ('rebuild')"))
+    else:
+        raise NotImplementedError(f"Search is not supported on {dialect}")
+
+def fts5_match(owner_column, owner_id, search_text):
+    # Every word as a quoted FTS5 string, so user input can't be parsed as
+    # query syntax, matched in the text columns and ANDed with the owner
+    words = re.findall(r'\w+', search_text)
+    words = [word for word in words if word.lower() not in STOP_WORDS] or words
+    words = ' '.join(f'"{word}"' for word in words)
+    return f'{{message reply}}: ({words}) AND {owner_column.key}: "{int(owner_id)}"'
+
+def ranked_ids(owner_column, owner_id, search_text):
+    # SELECT (id, rank) of the owner's matching queries, best first
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        search_vector = literal_column('queries.search_vector')
+        tsquery = func.websearch_to_tsquery(LANGUAGE, search_text)
+        rank = func.ts_rank_cd(search_vector, tsquery)
+        return (select(Query.id, rank.label('rank'))
+                .where(owner_column == owner_id, search_vector.op('@@')(tsquery))
+                .order_by(rank.desc(), Query.id.desc()))
+    if dialect == 'sqlite':
+        # bm25() is lower for better matches; negate it so higher is better
+        # on both backends. The owner columns carry no weight.
+        rank = -func.bm25(literal_column('queries_fts'), 1.0, 1.0, 0.0, 0.0)
+        return (select(Query.id, rank.label('rank'))
+                .select_from(queries_fts)
+                .join(Query, Query.id == queries_fts.c.rowid)
+                .where(literal_column('queries_fts').op('MATCH')(
+                    fts5_match(owner_column, owner_id, search_text)))
+                .order_by(rank.desc(), Query.id.desc()))
+    raise NotImplementedError(f"Search is not supported on {dialect}")
+
+def search_queries(base, owner_column, owner_id, search_text, status=None, subject_id=None,
+                   page=1, per_page=None):
+    # Returns ([(query, rank)], has_more) for one page of the owner's
+    # queries matching search_text, ranked best first. `base` (Query.query
+    # or a readmodel.query_list) loads the page's rows by id.
+    # Raises ValueError for empty search text or a bad filter.
+    if not re.search(r'\w', search_text or ''):
+        raise ValueError('Search text is required.')
+    per_page = clamp_page_size(per_page)
+    page = max(page or 1, 1)
+
+    statement = filter_queries(ranked_ids(owner_column, owner_id, search_text),
+                               status=status, subject_id=subject_id)
+    # One extra row tells whether another page exists
+    hits = db.session.execute(
+        statement.limit(per_page + 1).offset((page - 1) * per_page)
+    ).all()
+    has_more = len(hits) > per_page
+    hits = hits[:per_page]
+
+    rows = {query.id: query for query in base.filter(Query.id.in_([hit.id for hit in hits]))}
+    return [(rows[hit.id], hit.rank) for hit in hits if hit.id in rows], has_more
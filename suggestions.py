@@ -0,0 +1,219 @@
+import math
+import os
+import re
+import threading
+from collections import OrderedDict, namedtuple
+from datetime import timedelta
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
+
+from app import db
+from models import Query
+from search import STOP_WORDS
+
+# Already-answered questions similar to one a student is about to submit.
+#
+# Each process keeps an in-memory TF-IDF index of answered query messages per
+# subject, loaded on first use and evicted least recently used. Documents
+# are rows of a sparse matrix (CSC, so a lookup only touches the columns of
+# its own terms) with sublinear TF, IDF weights and unit-length rows, so a
+# lookup's scores are cosine similarities.
+#
+# respond_query adds new answers to this process's index straight away;
+# other workers pick them up on their next lookup in that subject by
+# reading rows answered since their last load (an index range scan).
+
+MAX_SUBJECTS = int(os.environ.get('SUGGESTIONS_MAX_SUBJECTS', 64))
+MIN_SCORE = float(os.environ.get('SUGGESTIONS_MIN_SCORE', 0.35))
+LIMIT = 3
+# Answers added since the last rebuild are scored one by one until there
+# are this many, then folded into the matrix (recomputing IDF)
+TAIL_SIZE = 256
+# Re-read answers this far behind the newest one seen, in case a slower
+# transaction committed an older updated_at after it
+CATCH_UP_OVERLAP = timedelta(seconds=60)
+
+Suggestion = namedtuple('Suggestion', 'query_id score')
+
+def tokenize(text):
+    return [word for word in re.findall(r'\w+', text.lower())
+            if len(word) > 1 and word not in STOP_WORDS]
+
+def term_counts(words):
+    counts = {}
+    for word in words:
+        counts[word] = counts.get(word, 0) + 1
+    return counts
+
+class SubjectIndex:
+    def __init__(self):
+        self.vocabulary = {}
+        self.ids = np.empty(0, dtype=np.int64)
+        self.known = set()
+        self.counts = sparse.csr_matrix((0, 0))
+        self.matrix = sparse.csc_matrix((0, 0))
+        self.idf = np.empty(0)
+        self.tail = []  # (query_id, {term: count}) not in the matrix yet
+        self.watermark = None  # newest updated_at read from the database
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.known)
+
+    def add(self, rows):
+        # rows: [(query_id, message)]; ids already indexed are skipped
+        with self.lock:
+            for query_id, message in rows:
+                if query_id not in self.known:
+                    self.known.add(query_id)
+                    self.tail.append((query_id, term_counts(tokenize(message))))
+            if len(self.tail) >= TAIL_SIZE:
+                self.rebuild()
+
+    def rebuild(self):
+        # Folds the tail into the count matrix and reweights everything
+        # with the new document frequencies; caller holds the lock
+        columns, data, indptr = [], [], [0]
+        for _, counts in self.tail:
+            for word, count in counts.items():
+                columns.append(self.vocabulary.setdefault(word, len(self.vocabulary)))
+                data.append(count)
+            indptr.append(len(columns))
+        width = len(self.vocabulary)
+        tail = sparse.csr_matrix((np.array(data, dtype=np.float32), columns, indptr),
+                                 shape=(len(self.tail), width))
+        previous = self.counts
+        previous.resize((previous.shape[0], width))
+        self.counts = sparse.vstack([previous, tail], format='csr')
+        self.ids = np.concatenate([self.ids, np.array([query_id for query_id, _ in self.tail],
+                                                      dtype=np.int64)])
+        self.tail = []
+
+        documents = self.counts.shape[0]
+        frequencies = np.bincount(self.counts.indices, minlength=width)
+        self.idf = (np.log((1 + documents) / (1 + frequencies)) + 1).astype(np.float32)
+        weighted = self.counts.copy()
+        weighted.data = np.log1p(weighted.data)
+        weighted = weighted.multiply(self.idf).tocsr()
+        norms = np.sqrt(np.asarray(weighted.multiply(weighted).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        self.matrix = (sparse.diags(1 / norms) @ weighted).tocsc()
+
+    def weight(self, word):
+        # IDF of a term, or that of a term seen in no document
+        column = self.vocabulary.get(word)
+        if column is not None and column < len(self.idf):
+            return self.idf[column]
+        return math.log(1 + self.matrix.shape[0]) + 1
+
+    def vector(self, counts):
+        # {term: unit-length tf-idf weight}
+        weights = {word: math.log1p(count) * self.weight(word) for word, count in counts.items()}
+        norm = math.sqrt(sum(weight * weight for weight in weights.values())) or 1
+        return {word: weight / norm for word, weight in weights.items()}
+
+    def lookup(self, text, limit=LIMIT, min_score=MIN_SCORE):
+        # [Suggestion] best first
+        with self.lock:
+            query = self.vector(term_counts(tokenize(text)))
+            if not query:
+                return []
+            candidates = []
+
+            known = [(self.vocabulary[word], weight) for word, weight in query.items()
+                     if self.vocabulary.get(word, len(self.idf)) < len(self.idf)]
+            if known and self.matrix.shape[0]:
+                columns, weights = zip(*known)
+                scores = self.matrix[:, list(columns)] @ np.array(weights, dtype=np.float32)
+                top = np.argpartition(-scores, min(limit, len(scores) - 1))[:limit]
+                candidates += [(float(scores[i]), int(self.ids[i])) for i in top]
+
+            for query_id, counts in self.tail:
+                document = self.vector(counts)
+                score = sum(weight * document.get(word, 0) for word, weight in query.items())
+                candidates.append((score, query_id))
+
+        candidates.sort(reverse=True)
+        return [Suggestion(query_id, score) for score, query_id in candidates[:limit]
+                if score >= min_score]
+
+class Shards:
+    # subject_id -> SubjectIndex, least recently used evicted past maxsize
+    def __init__(self, maxsize=MAX_SUBJECTS):
+        self.maxsize = maxsize
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, subject_id):
+        with self._lock:
+            index = self._indexes.get(subject_id)
+            if index is not None:
+                self._indexes.move_to_end(subject_id)
+            return index
+
+    def put(self, subject_id, index):
+        with self._lock:
+            self._indexes[subject_id] = index
+            self._indexes.move_to_end(subject_id)
+            while len(self._indexes) > self.maxsize:
+                self._indexes.popitem(last=False)
+
+    def invalidate(self, *subject_ids):
+        with self._lock:
+            if not subject_ids:
+                self._indexes.clear()
+            for subject_id in subject_ids:
+                self._indexes.pop(subject_id, None)
+
+shards = Shards()
+
+def catch_up(index, subject_id):
+    # Adds answers committed since the index last read the database
+    statement = select(Query.id, Query.message, Query.updated_at).where(
+        Query.subject_id == subject_id, Query.status == 'answered', Query.reply.isnot(None)
+    )
+    if index.watermark is not None:
+        statement = statement.where(Query.updated_at > index.watermark - CATCH_UP_OVERLAP)
+    rows = db.session.execute(statement).all()
+    index.add([(query_id, message) for query_id, message, _ in rows])
+    newest = max((updated_at for _, _, updated_at in rows if updated_at), default=None)
+    if newest and (index.watermark is None or newest > index.watermark):
+        index.watermark = newest
+
+def index_for(subject_id):
+    index = shards.get(subject_id)
+    if index is None:
+        index = SubjectIndex()
+        catch_up(index, subject_id)
+        with index.lock:
+            if index.tail:
+                index.rebuild()
+        shards.put(subject_id, index)
+    else:
+        catch_up(index, subject_id)
+    return index
+
+def suggest(subject_id, text, limit=LIMIT):
+    # [Suggestion] for answered queries in the subject similar to text
+    return index_for(subject_id).lookup(text, limit)
+
+def answered_like(subject_id, text, limit=LIMIT):
+    # [(query, score)] with each query's subject and teacher loaded
+    found = suggest(subject_id, text, limit)
+    if not found:
+        return []
+    rows = {query.id: query for query in Query.query.options(
+        joinedload(Query.subject), joinedload(Query.teacher)
+    ).filter(Query.id.in_([suggestion.query_id for suggestion in found]), Query.reply.isnot(None))}
+    return [(rows[suggestion.query_id], suggestion.score) for suggestion in found
+            if suggestion.query_id in rows and rows[suggestion.query_id].is_answered()]
+
+def query_answered(query_id, subject_id, message):
+    # Called by respond_query after commit; only indexes already in memory
+    # need the new answer, the rest will read it when loaded
+    index = shards.get(subject_id)
+    if index is not None:
+        index.add([(query_id, message)])
@@ -0,0 +1,131 @@
+import pytest
+from jinja2 import FunctionLoader
+from sqlalchemy import event, insert
+
+from app import create_app, db
+from models import User, Subject, StudentSubject, TeacherSubject, Query
+import catalog
+import counters
+import migrations
+import suggestions
+
+# The repo ships no templates, so every page renders this one. It reads what
+# the real templates show: the flashed messages, the current user, and each
+# listed query's subject, student and teacher names, so lazy loads still
+# show up in statement counts.
+PAGE_TEMPLATE = """
+{%- for message in get_flashed_messages() %}{{ message }}{% endfor %}
+{{ current_user.name if current_user }}
+{% for subject in subjects or [] %}{{ subject.name }}{% endfor %}
+{% for query in queries or recent_queries or pending_queries or [] -%}
+{{ query.subject.name }} {{ query.student.name }} {{ query.teacher.name }} {{ query.status }}
+{% endfor %}
+{{ query.subject.name if query }}
+"""
+
+@pytest.fixture
+def databases():
+    # Overridden by tests that need files or replicas
+    return {'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'SQLALCHEMY_REPLICA_URIS': []}
+
+@pytest.fixture
+def app(databases):
+    app = create_app({
+        **databases,
+        'TESTING': True,
+        'RATE_LIMIT_ENABLED': False,
+        'NOTIFICATIONS_BACKEND': 'local',
+    })
+    app.jinja_loader = FunctionLoader(lambda name: PAGE_TEMPLATE)
+    # Per-process caches outlive the in-memory database of each test
+    catalog.invalidate_all()
+    suggestions.shards.invalidate()
+    with app.app_context():
+        migrations.upgrade(db.engine)
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def login(client):
+    def login(user_id):
+        with client.session_transaction() as session:
+            session['user_id'] = user_id
+    return login
+
+@pytest.fixture
+def statements(app):
+    # SQL of every statement the app runs while the test does
+    executed = []
+    def record(connection, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    yield executed
+    event.remove(engine, 'before_cursor_execute', record)
+
+@pytest.fixture
+def seed(app):
+    # seed(queries) fills the empty database; see create_rows
+    def seed(queries, answered_every=2):
+        with app.app_context():
+            return create_rows(queries, answered_every)
+    return seed
+
+@pytest.fixture
+def more_queries(app):
+    # more_queries(ids, queries) adds queries for the users seed created
+    def more_queries(ids, queries, answered_every=2):
+        with app.app_context():
+            add_queries(ids, queries, answered_every)
+    return more_queries
+
+def create_rows(queries, answered_every):
+    # Three students, teachers and subjects; teacher i teaches subject i and
+    # every student takes all three. Queries spread over all of them, every
+    # answered_every-th one answered. Returns {'students', 'teachers',
+    # 'subjects': [ids]}.
+    ids = {}
+    for role in ('student', 'teacher'):
+        ids[f'{role}s'] = [db.session.scalar(insert(User).values(
+            role=role, name=f'{role.title()} {i}', email=f'{role}{i}@example.edu',
+            password_hash='x', department='Science',
+            roll_no=f'R{i}' if role == 'student' else None,
+        ).returning(User.id)) for i in range(3)]
+    ids['subjects'] = [db.session.scalar(insert(Subject).values(
+        name=f'Subject {i}', department='Science'
+    ).returning(Subject.id)) for i in range(3)]
+    db.session.execute(insert(TeacherSubject), [
+        dict(teacher_id=teacher_id, subject_id=subject_id)
+        for teacher_id, subject_id in zip(ids['teachers'], ids['subjects'])
+    ])
+    db.session.execute(insert(StudentSubject), [
+        dict(student_id=student_id, subject_id=subject_id)
+        for student_id in ids['students'] for subject_id in ids['subjects']
+    ])
+    add_queries(ids, queries, answered_every)
+    return ids
+
+def add_queries(ids, queries, answered_every):
+    # Bulk inserts skip the write paths, so the counters are rebuilt
+    existing = db.session.query(Query).count()
+    rows = []
+    for k in range(existing, existing + queries):
+        answered = k % answered_every == 0
+        rows.append(dict(
+            student_id=ids['students'][k // 3 % 3],
+            teacher_id=ids['teachers'][k % 3],
+            subject_id=ids['subjects'][k % 3],
+            message=f'Question {k} about limits',
+            reply=f'Answer {k}' if answered else None,
+            status='answered' if answered else 'pending',
+        ))
+    if rows:
+        db.session.execute(insert(Query), rows)
+    counters.rebuild(db.session.connection())
+    db.session.commit()
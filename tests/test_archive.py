@@ -0,0 +1,40 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select
+
+from app import db
+from models import Query
+import archive
+
+def archive_finished(app):
+    with app.app_context():
+        return archive.archive_queries(datetime.utcnow() + timedelta(seconds=1))
+
+def test_new_queries_never_reuse_archived_ids(app, client, login, seed):
+    # Every query answered, so archiving empties the table, newest ids too
+    ids = seed(6, answered_every=1)
+    assert archive_finished(app) == 6
+    with app.app_context():
+        archived = set(db.session.scalars(select(archive.queries_archive.c.id)))
+
+    login(ids['students'][0])
+    response = client.post('/student/submit-query', data={
+        'subject_id': ids['subjects'][0], 'teacher_id': ids['teachers'][0],
+        'message': 'Asked after archiving', 'confirm': '1',
+    })
+    assert response.status_code == 302
+    with app.app_context():
+        new_id = db.session.scalar(select(Query.id).where(Query.message == 'Asked after archiving'))
+    assert new_id > max(archived)
+
+    # The next run moves it without colliding, and the history lists each
+    # id once
+    login(ids['teachers'][0])
+    client.post(f'/teacher/respond-query/{new_id}', data={'reply': 'Done.'})
+    assert archive_finished(app) == 1
+    login(ids['students'][0])
+    history = client.get('/api/queries?include_archive=1&per_page=100').get_json()['queries']
+    assert len(history) == len({query['id'] for query in history})
+    assert new_id in {query['id'] for query in history}
+    with app.app_context():
+        assert db.session.scalar(select(func.count()).select_from(archive.queries_archive)) == 7
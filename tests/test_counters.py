@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select, update
+
+from app import db
+from models import Query
+import archive
+import counters
+
+def drift(app):
+    with app.app_context(), db.engine.connect() as connection:
+        return counters.check(connection)
+
+def test_counters_match_queries_through_every_write_path(app, client, login, seed):
+    ids = seed(6)
+    student, teacher, subject = ids['students'][0], ids['teachers'][0], ids['subjects'][0]
+    assert drift(app) == []
+
+    login(student)
+    for i in range(4):
+        response = client.post('/student/submit-query', data={
+            'subject_id': subject, 'teacher_id': teacher,
+            'message': f'New question {i}', 'confirm': '1',
+        })
+        assert response.status_code == 302
+    assert drift(app) == []
+
+    with app.app_context():
+        pending = db.session.scalars(select(Query.id).where(
+            Query.teacher_id == teacher, Query.status == 'pending'
+        ).order_by(Query.id)).all()
+    assert len(pending) >= 4
+
+    login(teacher)
+    response = client.post(f'/teacher/respond-query/{pending[0]}', data={'reply': 'Like this.'})
+    assert response.status_code == 302
+    assert drift(app) == []
+
+    for action, query_ids, reply in (('close', pending[1:3], None),
+                                     ('answer', pending[2:3], None),
+                                     ('reply', pending[3:], 'All at once.')):
+        response = client.post('/api/queries/triage',
+                               json={'query_ids': query_ids, 'action': action, 'reply': reply})
+        assert response.status_code == 200
+        assert drift(app) == []
+
+    with app.app_context():
+        assert archive.archive_queries(datetime.utcnow() + timedelta(seconds=1)) > 0
+        assert db.session.scalar(select(func.count()).select_from(archive.queries_archive)) > 0
+    assert drift(app) == []
+
+def test_check_reports_drift(app, seed):
+    seed(6)
+    with app.app_context():
+        # A write that skips counters.status_changed()
+        db.session.execute(update(Query).where(Query.status == 'pending').values(status='closed'))
+        db.session.commit()
+    assert drift(app) != []
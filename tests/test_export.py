@@ -0,0 +1,100 @@
+import csv
+import gzip
+import io
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+import archive
+import exports
+import readmodel
+
+@pytest.fixture
+def ids(seed, login):
+    # Student 0 asked queries 0-2, one to each teacher; 0 and 2 are answered
+    ids = seed(6)
+    login(ids['students'][0])
+    return ids
+
+def export(client, **args):
+    response = client.get('/api/queries/export', query_string=args)
+    assert response.status_code == 200
+    return response
+
+def csv_rows(text):
+    return list(csv.DictReader(io.StringIO(text)))
+
+def test_csv_export(client, ids, monkeypatch):
+    # Small chunks, so rows span several of them
+    monkeypatch.setattr(exports, 'CHUNK_ROWS', 2)
+    response = export(client)
+
+    assert response.mimetype == 'text/csv'
+    assert response.headers['Content-Disposition'] == \
+        f'attachment; filename="queries-{datetime.utcnow():%Y%m%d}.csv"'
+    text = response.get_data(as_text=True)
+    assert text.splitlines()[0] == ','.join(readmodel.EXPORT_FIELDS)
+    rows = csv_rows(text)
+    assert [(row['subject'], row['student'], row['teacher'], row['status'], row['reply'])
+            for row in rows] == [
+        ('Subject 0', 'Student 0', 'Teacher 0', 'answered', 'Answer 0'),
+        ('Subject 1', 'Student 0', 'Teacher 1', 'pending', ''),
+        ('Subject 2', 'Student 0', 'Teacher 2', 'answered', 'Answer 2'),
+    ]
+    assert [row['message'] for row in rows] == [f'Question {k} about limits' for k in range(3)]
+
+def test_ndjson_export(client, ids):
+    response = export(client, format='ndjson')
+
+    assert response.mimetype == 'application/x-ndjson'
+    assert response.headers['Content-Disposition'].endswith('.ndjson"')
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [list(row) for row in rows] == [list(readmodel.EXPORT_FIELDS)] * 3
+    assert [(row['teacher'], row['status'], row['reply']) for row in rows] == [
+        ('Teacher 0', 'answered', 'Answer 0'),
+        ('Teacher 1', 'pending', None),
+        ('Teacher 2', 'answered', 'Answer 2'),
+    ]
+    datetime.fromisoformat(rows[0]['created_at'])
+
+def test_gzip_export_is_the_same_csv(client, ids):
+    plain = export(client).get_data()
+    response = export(client, gzip='1')
+
+    assert response.mimetype == 'application/gzip'
+    assert response.headers['Content-Disposition'].endswith('.csv.gz"')
+    assert gzip.decompress(response.get_data()) == plain
+
+def test_filters_apply(client, ids):
+    rows = csv_rows(export(client, status='pending').get_data(as_text=True))
+    assert [row['teacher'] for row in rows] == ['Teacher 1']
+
+def test_teachers_export_queries_sent_to_them(client, login, ids):
+    login(ids['teachers'][1])
+    rows = csv_rows(export(client).get_data(as_text=True))
+    assert {row['teacher'] for row in rows} == {'Teacher 1'}
+    assert {row['student'] for row in rows} == {'Student 0', 'Student 1'}
+
+def test_archived_queries_are_included_unless_excluded(app, client, ids):
+    with app.app_context():
+        assert archive.archive_queries(datetime.utcnow() + timedelta(seconds=1)) == 3
+
+    rows = csv_rows(export(client).get_data(as_text=True))
+    assert [row['teacher'] for row in rows] == ['Teacher 0', 'Teacher 1', 'Teacher 2']
+    rows = csv_rows(export(client, include_archive='0').get_data(as_text=True))
+    assert [row['teacher'] for row in rows] == ['Teacher 1']
+
+@pytest.mark.parametrize('args, error', [
+    ({'format': 'xml'}, 'Unknown export format; use one of: csv, ndjson.'),
+    ({'status': 'lost'}, 'Invalid status filter.'),
+])
+def test_bad_requests_are_refused(client, ids, args, error):
+    response = client.get('/api/queries/export', query_string=args)
+    assert response.status_code == 400
+    assert response.get_json() == {'error': error}
+
+def test_export_needs_a_login(client):
+    response = client.get('/api/queries/export')
+    assert response.status_code == 401
+    assert response.get_json() == {'error': 'Authentication required.'}
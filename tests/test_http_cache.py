@@ -0,0 +1,109 @@
+import pytest
+from flask import template_rendered
+
+from app import db
+from models import Query
+
+STUDENT_PAGES = ['/student/dashboard', '/student/queries']
+TEACHER_PAGES = ['/teacher/dashboard', '/teacher/queries']
+
+@pytest.fixture
+def users(seed):
+    # Student 0 takes all three subjects; teacher 0 teaches subject 0
+    ids = seed(6)
+    return {'student': ids['students'][0], 'teacher': ids['teachers'][0], 'ids': ids}
+
+@pytest.fixture
+def visit(client, login):
+    # visit(user_id, pages) -> {page: ETag} of a first visit
+    def visit(user_id, pages):
+        login(user_id)
+        etags = {}
+        for page in pages:
+            response = client.get(page)
+            assert response.status_code == 200
+            etags[page] = response.headers['ETag']
+        return etags
+    return visit
+
+@pytest.fixture
+def revisit(client, login):
+    # revisit(user_id, etags) -> {page: status} revalidating each ETag
+    def revisit(user_id, etags):
+        login(user_id)
+        with client.session_transaction() as session:
+            # A pending flash would make any page a 200
+            assert '_flashes' not in session
+        return {page: client.get(page, headers={'If-None-Match': etag}).status_code
+                for page, etag in etags.items()}
+    return revisit
+
+def test_unchanged_revisit_is_not_modified(app, client, users, visit, revisit):
+    for role, pages in (('student', STUDENT_PAGES), ('teacher', TEACHER_PAGES)):
+        etags = visit(users[role], pages)
+        rendered = []
+        with template_rendered.connected_to(lambda sender, template, context: rendered.append(template),
+                                            app):
+            assert revisit(users[role], etags) == {page: 304 for page in pages}
+        assert rendered == []
+
+def test_submit_changes_student_and_teacher_pages(client, login, users, visit, revisit):
+    student_etags = visit(users['student'], STUDENT_PAGES)
+    teacher_etags = visit(users['teacher'], TEACHER_PAGES)
+
+    login(users['student'])
+    client.post('/student/submit-query', data={
+        'subject_id': users['ids']['subjects'][0], 'teacher_id': users['teacher'],
+        'message': 'What is a derivative?', 'confirm': '1',
+    }, follow_redirects=True)
+
+    assert revisit(users['student'], student_etags) == {page: 200 for page in STUDENT_PAGES}
+    assert revisit(users['teacher'], teacher_etags) == {page: 200 for page in TEACHER_PAGES}
+
+def test_reply_changes_student_and_teacher_pages(app, client, login, users, visit, revisit):
+    with app.app_context():
+        query_id = db.session.scalar(db.select(Query.id).where(
+            Query.student_id == users['student'], Query.teacher_id == users['teacher']
+        ))
+    student_etags = visit(users['student'], STUDENT_PAGES)
+    teacher_etags = visit(users['teacher'], TEACHER_PAGES)
+
+    login(users['teacher'])
+    client.post(f'/teacher/respond-query/{query_id}', data={'reply': 'Like this.'},
+                follow_redirects=True)
+
+    assert revisit(users['student'], student_etags) == {page: 200 for page in STUDENT_PAGES}
+    assert revisit(users['teacher'], teacher_etags) == {page: 200 for page in TEACHER_PAGES}
+
+def test_profile_edit_changes_only_that_users_pages(client, login, users, visit, revisit):
+    student_etags = visit(users['student'], STUDENT_PAGES)
+    teacher_etags = visit(users['teacher'], TEACHER_PAGES)
+
+    login(users['student'])
+    client.post('/student/profile', data={
+        'name': 'Renamed Student', 'email': 'student0@example.edu',
+        'department': 'Science', 'roll_no': 'R0',
+    }, follow_redirects=True)
+
+    assert revisit(users['student'], student_etags) == {page: 200 for page in STUDENT_PAGES}
+    assert revisit(users['teacher'], teacher_etags) == {page: 304 for page in TEACHER_PAGES}
+
+def test_enrollment_change_changes_student_pages(client, login, users, visit, revisit):
+    student_etags = visit(users['student'], STUDENT_PAGES)
+
+    login(users['student'])
+    client.post('/student/subjects', data={
+        'action': 'withdraw', 'subject_id': users['ids']['subjects'][2],
+    }, follow_redirects=True)
+
+    assert revisit(users['student'], student_etags) == {page: 200 for page in STUDENT_PAGES}
+
+def test_pages_with_pending_flashes_get_no_etag(client, login, users, visit):
+    etags = visit(users['student'], STUDENT_PAGES)
+    for page, etag in etags.items():
+        with client.session_transaction() as session:
+            session['_flashes'] = [('info', 'Welcome back!')]
+        response = client.get(page, headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert 'ETag' not in response.headers
+        assert b'Welcome back!' in response.data
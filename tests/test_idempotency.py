@@ -0,0 +1,77 @@
+import pytest
+from sqlalchemy import func, select
+
+from app import db
+from models import Query
+import idempotency
+
+@pytest.fixture
+def submit(client, login, seed):
+    # submit(message, key=None, header=None, subject=0) -> response
+    ids = seed(0)
+    login(ids['students'][0])
+    def submit(message, key=None, header=None, subject=0):
+        data = {'subject_id': ids['subjects'][subject], 'teacher_id': ids['teachers'][subject],
+                'message': message, 'confirm': '1'}
+        if key:
+            data['idempotency_key'] = key
+        return client.post('/student/submit-query', data=data,
+                           headers={'Idempotency-Key': header} if header else {})
+    return submit
+
+def count(app, message):
+    with app.app_context():
+        return db.session.scalar(select(func.count()).select_from(Query).where(Query.message == message))
+
+def test_repeated_form_key_inserts_one_query(app, submit):
+    for _ in range(3):
+        response = submit('Double clicked', key='form-key')
+        assert response.status_code == 302
+    assert count(app, 'Double clicked') == 1
+
+def test_repeated_header_key_inserts_one_query(app, submit):
+    for _ in range(3):
+        response = submit('Retried by a client', header='header-key')
+        assert response.status_code == 302
+    assert count(app, 'Retried by a client') == 1
+
+def test_without_a_key_every_submission_counts(app, submit):
+    submit('Asked twice')
+    submit('Asked twice')
+    assert count(app, 'Asked twice') == 2
+
+def test_reused_key_with_a_different_query_is_refused(app, submit):
+    assert submit('First question', key='reused').status_code == 302
+
+    response = submit('Second question', key='reused')
+    assert response.status_code == 422
+    assert b'already used for a different query' in response.data
+    assert count(app, 'Second question') == 0
+
+    # Same message in another subject is a different query too
+    assert submit('First question', key='reused', subject=1).status_code == 422
+    assert count(app, 'First question') == 1
+
+def test_oversized_key_is_rejected(app, submit):
+    response = submit('Key too long', key='k' * (idempotency.MAX_KEY_LENGTH + 1))
+    assert response.status_code == 200
+    assert b'Invalid idempotency key.' in response.data
+    assert count(app, 'Key too long') == 0
+
+@pytest.mark.parametrize('message, status', [('Raced', 302), ('Raced with another body', 422)])
+def test_losing_a_race_reports_the_winner(app, submit, monkeypatch, message, status):
+    assert submit('Raced', key='raced').status_code == 302
+
+    # The second request checks before the first commits, so it sees no
+    # original and only learns of it from the key's primary key
+    lookup = idempotency.original
+    calls = []
+    def original(user_id, key):
+        calls.append(key)
+        return None if len(calls) == 1 else lookup(user_id, key)
+    monkeypatch.setattr(idempotency, 'original', original)
+
+    assert submit(message, key='raced').status_code == status
+    assert len(calls) == 2
+    assert count(app, 'Raced') == 1
+    assert count(app, 'Raced with another body') == 0
@@ -0,0 +1,47 @@
+import pytest
+
+import notifications
+
+@pytest.fixture
+def events(app, client, login, seed):
+    # events() opens a stream for student 0 and returns the response
+    app.config['NOTIFICATIONS_MAX_STREAMS'] = 2
+    login(seed(0)['students'][0])
+    yield lambda: client.get('/api/events')
+    assert notifications._streams['open'] == 0
+
+def test_streams_over_the_cap_are_refused_until_one_closes(events):
+    streams = [events(), events()]
+    assert [stream.status_code for stream in streams] == [200, 200]
+    assert streams[0].mimetype == 'text/event-stream'
+
+    refused = events()
+    assert refused.status_code == 503
+    assert refused.headers['Retry-After'] == '30'
+    assert refused.get_json() == {'error': 'Too many open event streams; poll /api/queries instead.'}
+
+    streams[0].close()
+    streams.append(events())
+    assert streams[-1].status_code == 200
+
+    for stream in streams[1:]:
+        stream.close()
+
+def test_default_cap_leaves_a_thread_for_requests(app, monkeypatch):
+    app.config['NOTIFICATIONS_MAX_STREAMS'] = None
+    monkeypatch.setattr(notifications, 'running_on_gevent', lambda: False)
+    monkeypatch.setattr(notifications, 'WORKER_THREADS', 4)
+    with app.app_context():
+        opened = [notifications.open_stream() for _ in range(4)]
+        for _ in range(opened.count(True)):
+            notifications.close_stream()
+    assert opened == [True, True, True, False]
+
+def test_gevent_streams_are_not_capped_by_default(app, monkeypatch):
+    app.config['NOTIFICATIONS_MAX_STREAMS'] = None
+    monkeypatch.setattr(notifications, 'running_on_gevent', lambda: True)
+    with app.app_context():
+        opened = [notifications.open_stream() for _ in range(10)]
+        for _ in range(opened.count(True)):
+            notifications.close_stream()
+    assert all(opened)
@@ -0,0 +1,71 @@
+import pytest
+
+import ratelimit
+
+@pytest.fixture
+def limiter(app):
+    # The suite runs with limits off; this test turns them on
+    app.extensions['ratelimit'] = ratelimit.MemoryBackend()
+    return app.extensions['ratelimit']
+
+def login_attempts(client, email, attempts, **kwargs):
+    return [client.post('/login', data={'email': email, 'password': 'wrong'}, **kwargs)
+            for _ in range(attempts)]
+
+def test_login_is_refused_after_the_burst(client, limiter):
+    burst = ratelimit.LIMITS['login'].burst
+    responses = login_attempts(client, 'someone@example.edu', burst + 1)
+
+    assert [response.status_code for response in responses[:burst]] == [200] * burst
+    refused = responses[-1]
+    assert refused.status_code == 429
+    assert int(refused.headers['Retry-After']) >= 1
+    assert refused.mimetype == 'text/plain'
+
+def test_api_refusals_are_json(client, login, seed, limiter):
+    login(seed(0)['teachers'][0])
+    burst = ratelimit.LIMITS['api_triage_queries'].burst
+    responses = [client.post('/api/queries/triage', json={'query_ids': [], 'action': 'close'})
+                 for _ in range(burst + 1)]
+
+    assert [response.status_code for response in responses[:burst]] == [400] * burst
+    refused = responses[-1]
+    assert refused.status_code == 429
+    assert refused.get_json() == {'error': 'Too many requests.',
+                                  'retry_after': int(refused.headers['Retry-After'])}
+
+def test_reads_are_not_limited_unless_listed(client, limiter):
+    burst = ratelimit.LIMITS['login'].burst
+    assert {client.get('/login').status_code for _ in range(burst * 2)} == {200}
+
+def test_login_buckets_are_per_email_behind_one_address(client, limiter):
+    # A campus NAT: many users, one address, each with their own bucket
+    burst = ratelimit.LIMITS['login'].burst
+    login_attempts(client, 'busy@example.edu', burst + 1)
+
+    assert login_attempts(client, 'other@example.edu', 1)[0].status_code == 200
+    assert login_attempts(client, 'BUSY@example.edu', 1)[0].status_code == 429
+
+def test_one_address_is_capped_across_emails(client, limiter):
+    ip_burst = ratelimit.IP_LIMITS['login'].burst
+    statuses = [login_attempts(client, f'user{i}@example.edu', 1)[0].status_code
+                for i in range(ip_burst + 1)]
+    assert statuses == [200] * ip_burst + [429]
+
+def test_forged_forwarded_for_does_not_reset_buckets(client, limiter):
+    burst = ratelimit.LIMITS['login'].burst
+    responses = [client.post('/login', data={'email': 'forger@example.edu', 'password': 'wrong'},
+                             headers={'X-Forwarded-For': f'10.0.0.{i}'})
+                 for i in range(burst + 1)]
+    assert responses[-1].status_code == 429
+
+def test_a_refusing_bucket_does_not_drain_the_others():
+    backend = ratelimit.MemoryBackend()
+    own, shared = ('own', 1 / 60, 2), ('shared', 1 / 60, 1)
+
+    assert backend.take([own, shared]) == (True, 0)
+    allowed, retry_after = backend.take([own, shared])
+    assert not allowed and retry_after > 0
+    # own still has the token the refused request didn't spend
+    assert backend.take([own]) == (True, 0)
+    assert backend.take([own])[0] is False
@@ -0,0 +1,105 @@
+import shutil
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event, update
+
+from app import db
+import replicas
+
+# SQLite files stand in for the primary and one replica: the replica is a
+# copy of the primary taken after seeding, so it has the same rows and a
+# fresh heartbeat until a test changes either.
+
+@pytest.fixture
+def databases(tmp_path):
+    (tmp_path / 'replica').mkdir()
+    return {'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "primary.db"}',
+            'SQLALCHEMY_REPLICA_URIS': [f'sqlite:///{tmp_path / "replica" / "replica.db"}']}
+
+@pytest.fixture
+def ids(app, seed, tmp_path):
+    ids = seed(6)
+    with app.app_context():
+        with db.engine.begin() as connection:
+            replicas.beat(connection)
+        db.engine.dispose()
+    shutil.copy(tmp_path / 'primary.db', tmp_path / 'replica' / 'replica.db')
+    return ids
+
+@pytest.fixture
+def served(app):
+    # Names of the databases that ran each statement since the last clear()
+    names = []
+    with app.app_context():
+        engines = {'primary': db.engine, 'replica': db.engines['replica_0']}
+    listeners = [(engine, lambda *args, name=name: names.append(name)) for name, engine in engines.items()]
+    for engine, listener in listeners:
+        event.listen(engine, 'before_cursor_execute', listener)
+    yield names
+    for engine, listener in listeners:
+        event.remove(engine, 'before_cursor_execute', listener)
+
+def history(client):
+    response = client.get('/api/queries')
+    assert response.status_code == 200
+    return response.get_json()['queries']
+
+def test_read_only_routes_read_from_the_replica(client, login, ids, served):
+    login(ids['students'][0])
+    served.clear()
+    assert history(client)
+    # The lag probe runs on the replica too
+    assert set(served) == {'replica'}
+
+def test_writes_go_to_the_primary_and_stick(client, login, ids, served):
+    login(ids['students'][0])
+    history(client)
+    served.clear()
+
+    response = client.post('/student/submit-query', data={
+        'subject_id': ids['subjects'][0], 'teacher_id': ids['teachers'][0],
+        'message': 'Only on the primary', 'confirm': '1',
+    })
+    assert response.status_code == 302
+    assert set(served) == {'primary'}
+
+    # The replica never gets the write here, so reading it back proves the
+    # next read went to the primary
+    served.clear()
+    assert 'Only on the primary' in {query['message'] for query in history(client)}
+    assert set(served) == {'primary'}
+
+def test_stickiness_expires(client, login, ids, served, monkeypatch):
+    monkeypatch.setattr(replicas, 'STICKY_SECONDS', 0)
+    login(ids['students'][0])
+    client.post('/student/submit-query', data={
+        'subject_id': ids['subjects'][0], 'teacher_id': ids['teachers'][0],
+        'message': 'Written a while ago', 'confirm': '1',
+    })
+    served.clear()
+    history(client)
+    assert set(served) == {'replica'}
+
+def test_a_lagging_replica_is_skipped(app, client, login, ids, served):
+    with app.app_context(), db.engines['replica_0'].begin() as connection:
+        connection.execute(update(replicas.replica_heartbeat).values(
+            beat_at=datetime.utcnow() - timedelta(seconds=replicas.MAX_LAG_SECONDS + 10)))
+
+    login(ids['students'][0])
+    served.clear()
+    assert history(client)
+    # Only the lag probe touched the replica
+    assert served.count('replica') == 1
+    assert served[0] == 'replica' and set(served[1:]) == {'primary'}
+
+def test_an_unreachable_replica_is_skipped(app, client, login, ids, served, tmp_path):
+    with app.app_context():
+        db.engines['replica_0'].dispose()
+    shutil.rmtree(tmp_path / 'replica')
+
+    login(ids['students'][0])
+    served.clear()
+    assert history(client)
+    # Its probe fails before running a statement
+    assert set(served) == {'primary'}
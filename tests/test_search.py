@@ -0,0 +1,97 @@
+import pytest
+
+from app import db
+from models import Query
+
+@pytest.fixture
+def users(seed):
+    return seed(0)
+
+@pytest.fixture
+def ask(app, users):
+    # ask(student, teacher, message, reply=None) -> query id; student and
+    # teacher are indexes into the seeded users
+    def ask(student, teacher, message, reply=None):
+        with app.app_context():
+            query = Query(student_id=users['students'][student], teacher_id=users['teachers'][teacher],
+                          subject_id=users['subjects'][teacher], message=message, reply=reply,
+                          status='answered' if reply else 'pending')
+            db.session.add(query)
+            db.session.commit()
+            return query.id
+    return ask
+
+@pytest.fixture
+def search(client, login, users):
+    # search(role, index, q, **args) -> JSON body of /api/queries/search
+    def search(role, index, q, **args):
+        login(users[f'{role}s'][index])
+        response = client.get('/api/queries/search', query_string={'q': q, **args})
+        assert response.status_code == 200
+        return response.get_json()
+    return search
+
+def ids(body):
+    return [query['id'] for query in body['queries']]
+
+def test_results_are_ranked_best_first(ask, search):
+    strong = ask(0, 0, 'Integral of an integral: how do I evaluate a double integral?')
+    weak = ask(0, 0, 'My homework has vectors, matrices, forces and one integral near the end')
+    ask(0, 0, 'How do I normalise an eigenvector?')
+
+    body = search('student', 0, 'integral')
+    assert ids(body) == [strong, weak]
+    ranks = [query['rank'] for query in body['queries']]
+    assert ranks == sorted(ranks, reverse=True) and ranks[0] > ranks[1]
+
+def test_replies_are_searched(ask, search):
+    answered = ask(0, 0, 'Stuck on question four', reply='Try integrating by parts.')
+    assert ids(search('student', 0, 'parts')) == [answered]
+
+def test_students_only_find_their_own_queries(ask, search):
+    own = ask(0, 0, 'What are eigenvalues used for?')
+    ask(1, 0, 'Eigenvalues of a symmetric matrix?')
+    ask(2, 1, 'Eigenvalues and eigenvectors')
+
+    assert ids(search('student', 0, 'eigenvalues')) == [own]
+
+def test_teachers_only_find_queries_sent_to_them(ask, search):
+    mine = {ask(0, 0, 'Entropy of an ideal gas'), ask(1, 0, 'Entropy and the second law')}
+    theirs = ask(2, 1, 'Entropy in information theory')
+
+    assert set(ids(search('teacher', 0, 'entropy'))) == mine
+    assert ids(search('teacher', 1, 'entropy')) == [theirs]
+    assert ids(search('teacher', 2, 'entropy')) == []
+
+def test_index_follows_reply_updates(client, login, users, ask, search):
+    query_id = ask(0, 0, 'How do I differentiate a composite function?')
+    assert ids(search('student', 0, 'chain')) == []
+
+    login(users['teachers'][0])
+    client.post(f'/teacher/respond-query/{query_id}', data={'reply': 'Use the chain rule.'})
+    assert ids(search('student', 0, 'chain')) == [query_id]
+
+    login(users['teachers'][0])
+    client.post(f'/teacher/respond-query/{query_id}', data={'reply': 'Substitute and expand instead.'})
+    assert ids(search('student', 0, 'chain')) == []
+    assert ids(search('student', 0, 'substitute')) == [query_id]
+
+def test_results_are_paginated(ask, search):
+    matching = {ask(0, 0, f'Kinematics question number {i}') for i in range(5)}
+    ask(0, 0, 'Something else entirely')
+
+    pages, page = [], 1
+    while page:
+        body = search('student', 0, 'kinematics', page=page, per_page=2)
+        pages.append(ids(body))
+        page = body['next_page']
+
+    assert [len(ids_on_page) for ids_on_page in pages] == [2, 2, 1]
+    assert {query_id for ids_on_page in pages for query_id in ids_on_page} == matching
+
+def test_search_needs_text_and_a_login(client, login, users):
+    assert client.get('/api/queries/search?q=anything').status_code == 401
+    login(users['students'][0])
+    response = client.get('/api/queries/search?q=%20')
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Search text is required.'}
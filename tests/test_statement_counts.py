@@ -0,0 +1,72 @@
+import re
+
+import pytest
+
+from app import db
+from models import Query
+import catalog
+
+# SQL statements each protected page runs, checked so that new per-request
+# lookups don't creep in unnoticed; change a number only on purpose. The
+# current user is loaded once per request however many decorators, views
+# and context processors ask for it.
+STATEMENTS = {
+    ('student', '/student/dashboard'): 6,
+    ('student', '/student/profile'): 1,
+    ('student', '/student/subjects'): 2,
+    ('student', '/student/submit-query'): 2,
+    ('student', '/student/queries'): 3,
+    ('student', '/api/queries'): 2,
+    ('teacher', '/teacher/dashboard'): 6,
+    ('teacher', '/teacher/profile'): 1,
+    ('teacher', '/teacher/subjects'): 2,
+    ('teacher', '/teacher/queries'): 3,
+    ('teacher', '/teacher/respond-query/{query_id}'): 2,
+    ('teacher', '/api/queries'): 2,
+}
+
+USER_LOOKUP = re.compile(r'FROM users\s+WHERE users\.id = \?')
+
+@pytest.mark.parametrize('role, url', list(STATEMENTS))
+def test_protected_route_statements(app, client, login, statements, seed, role, url):
+    ids = seed(9)
+    user_id = ids[f'{role}s'][0]
+    with app.app_context():
+        query_id = db.session.scalar(db.select(Query.id).where(Query.teacher_id == user_id).limit(1))
+    login(user_id)
+    statements.clear()
+
+    response = client.get(url.format(query_id=query_id))
+
+    assert response.status_code == 200
+    assert sum(bool(USER_LOOKUP.search(statement)) for statement in statements) == 1
+    assert len(statements) == STATEMENTS[role, url]
+
+# Pages listing queries, whose statement count must not grow with the
+# number of rows they show (one lazy load per row would)
+LIST_PAGES = [
+    ('student', '/student/dashboard'),
+    ('student', '/student/queries'),
+    ('student', '/student/queries?per_page=100'),
+    ('teacher', '/teacher/dashboard'),
+    ('teacher', '/teacher/queries'),
+    ('teacher', '/teacher/queries?per_page=100'),
+    ('teacher', '/api/queries?per_page=100'),
+]
+ROWS = 6
+
+@pytest.mark.parametrize('role, url', LIST_PAGES)
+def test_list_page_statements_do_not_grow_with_rows(client, login, statements, seed, more_queries,
+                                                    role, url):
+    ids = seed(ROWS)
+    login(ids[f'{role}s'][0])
+
+    def count():
+        catalog.invalidate_all()
+        statements.clear()
+        assert client.get(url).status_code == 200
+        return len(statements)
+
+    few = count()
+    more_queries(ids, ROWS * 9)
+    assert count() == few
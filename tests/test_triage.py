@@ -0,0 +1,58 @@
+from sqlalchemy import select
+
+from app import db
+from models import Query
+
+def queries_of(app, teacher_id):
+    # {status: [query ids]} of one teacher's queries
+    with app.app_context():
+        rows = db.session.execute(select(Query.id, Query.status).where(Query.teacher_id == teacher_id)
+                                  .order_by(Query.id)).all()
+    grouped = {}
+    for query_id, status in rows:
+        grouped.setdefault(status, []).append(query_id)
+    return grouped
+
+def test_results_report_each_requested_id(app, client, login, seed):
+    ids = seed(6)
+    own, other = queries_of(app, ids['teachers'][0]), queries_of(app, ids['teachers'][1])
+    pending, answered = own['pending'][0], own['answered'][0]
+    others_pending = other['pending'][0]
+    missing = 10_000
+
+    login(ids['teachers'][0])
+    response = client.post('/api/queries/triage', json={
+        'action': 'close',
+        'query_ids': [pending, answered, others_pending, missing, pending],
+    })
+
+    assert response.status_code == 200
+    assert response.get_json() == {
+        'results': [
+            {'id': pending, 'result': 'updated'},
+            # Closing only applies to pending queries
+            {'id': answered, 'result': 'unchanged'},
+            # Another teacher's query is indistinguishable from a missing one
+            {'id': others_pending, 'result': 'not_found'},
+            {'id': missing, 'result': 'not_found'},
+        ],
+        'updated': 1,
+    }
+    assert queries_of(app, ids['teachers'][0])['closed'] == [pending]
+    assert queries_of(app, ids['teachers'][1]) == other
+
+def test_reply_applies_to_answered_queries_too(app, client, login, seed):
+    ids = seed(6)
+    own = queries_of(app, ids['teachers'][0])
+
+    login(ids['teachers'][0])
+    response = client.post('/api/queries/triage', json={
+        'action': 'reply', 'reply': 'See the worked example.',
+        'query_ids': own['pending'] + own['answered'],
+    })
+
+    assert response.status_code == 200
+    assert {result['result'] for result in response.get_json()['results']} == {'updated'}
+    with app.app_context():
+        replies = db.session.scalars(select(Query.reply).where(Query.teacher_id == ids['teachers'][0]))
+        assert set(replies) == {'See the worked example.'}
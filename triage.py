@@ -0,0 +1,78 @@
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import select, update
+
+from app import db
+from models import Query
+import counters
+import notifications
+
+# Bulk triage: one reply, or one status, applied to many of a teacher's
+# queries. Whatever the number of queries it is a locking SELECT, a single
+# set-based UPDATE, one counter upsert and one notification statement, and
+# both the SELECT and the UPDATE are restricted to the teacher's own rows.
+
+MAX_QUERIES = 500
+
+# action: (new status, statuses it applies to, event published)
+ACTIONS = {
+    'reply': ('answered', ('pending', 'answered', 'closed'), 'query_answered'),
+    'answer': ('answered', ('pending', 'closed'), 'query_answered'),
+    'close': ('closed', ('pending',), 'query_closed'),
+}
+
+# Per-query results; queries of other teachers are reported as not found
+UPDATED = 'updated'
+UNCHANGED = 'unchanged'
+NOT_FOUND = 'not_found'
+
+Changed = namedtuple('Changed', 'id student_id teacher_id subject_id status message reply')
+
+def apply(teacher_id, query_ids, action, reply=None):
+    # Returns ([(query_id, result)] in request order, [Changed]); the caller
+    # commits. Raises ValueError for an invalid request.
+    if action not in ACTIONS:
+        raise ValueError('Invalid action.')
+    if action == 'reply' and not reply:
+        raise ValueError('Reply cannot be empty.')
+    query_ids = list(dict.fromkeys(query_ids))
+    if not query_ids:
+        raise ValueError('No queries selected.')
+    if len(query_ids) > MAX_QUERIES:
+        raise ValueError(f'At most {MAX_QUERIES} queries can be triaged at once.')
+    new_status, applies_to, event = ACTIONS[action]
+
+    # Locking the rows makes concurrent replies wait for this transaction,
+    # so the statuses read here are the ones the counters move away from
+    current = db.session.execute(
+        select(Query.id, Query.student_id, Query.teacher_id, Query.subject_id,
+               Query.status, Query.message, Query.reply)
+        .where(Query.id.in_(query_ids), Query.teacher_id == teacher_id)
+        .with_for_update()
+    ).all()
+    eligible = [row for row in current if row.status in applies_to]
+
+    changed = []
+    if eligible:
+        values = {'status': new_status, 'updated_at': datetime.utcnow()}
+        if action == 'reply':
+            values['reply'] = reply
+        db.session.execute(
+            update(Query)
+            .where(Query.id.in_([row.id for row in eligible]), Query.teacher_id == teacher_id)
+            .values(**values)
+        )
+        counters.bump_many([(row, *counters.status_deltas(row.status, new_status))
+                            for row in eligible])
+        changed = [Changed(row.id, row.student_id, row.teacher_id, row.subject_id,
+                           new_status, row.message, reply if action == 'reply' else row.reply)
+                   for row in eligible]
+        notifications.publish_many(event, changed)
+
+    found = {row.id for row in current}
+    updated = {row.id for row in eligible}
+    results = [(query_id, UPDATED if query_id in updated else
+                UNCHANGED if query_id in found else NOT_FOUND)
+               for query_id in query_ids]
+    return results, changed